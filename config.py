@@ -11,36 +11,107 @@
 
 
 from pathlib import Path
-import logging
+import logging,re,copy
 
+## dynamic parameters (@ expressions) are compiled once, and their value is stored as a plain class attribute on first read.
+## __memo__ holds the names of such cached values. setting any parameter removes the cached values of all
+## dynamic parameters that depend on it, directly or through other dynamic parameters
 class basecfg(type):
     __dynamic__={}
+    __compiled__={}                         ## expression -> (code,set of parameter names used)
+    __memo__=set()
+    __parsed__={}                           ## resolved path of parameter file -> (mtime,size,[(name,expression or code,dynamic),...])
+
+    def _compile(cls,expr):
+        if not expr in cls.__compiled__:
+            cls.__compiled__[expr]=(compile(expr.replace('@','cfg.'),expr,'eval'),set(re.findall(r'@(\w+)',expr)))
+        return cls.__compiled__[expr]
+
+    def invalidate(cls,key=None):
+        '''removes cached values of dynamic parameters depending on key (all cached values if key is None)'''
+        if key is None:
+            stale=set(cls.__memo__)
+        else:
+            stale={key}
+            grown=True
+            while grown:
+                grown=False
+                for name,expr in cls.__dynamic__.items():
+                    if not name in stale and cls._compile(expr)[1]&stale:
+                        stale.add(name)
+                        grown=True
+        for name in stale&cls.__memo__:
+            cls.__memo__.discard(name)
+            type.__delattr__(cls,name)
+
+    def __setattr__(cls,key,value):
+        ## a dynamic parameter set from outside is frozen: its value is no longer a cached one
+        cls.__memo__.discard(key)
+        type.__setattr__(cls,key,value)
+        cls.invalidate(key)
+
+    def _read(cls,paramfile):
+        ## parameter file is read and its values compiled once, until it is modified
+        path=Path(paramfile).resolve()
+        st=path.stat()
+        cached=cls.__parsed__.get(str(path))
+        if cached is not None and cached[:2]==(st.st_mtime_ns,st.st_size):
+            return cached[2]
+        entries=[]
+        with open(path) as pfile:
+            for e,line in enumerate(pfile.readlines()):
+                if line.startswith("#") or len(line.strip(' \t\n\r')) == 0:
+                    continue
+                paramname=line.split('=',1)[0].strip()
+                paramvalue=line.split('=',1)[1].split('#')[0].strip()
+                if '@' in paramvalue:
+                    entries.append((paramname,paramvalue,True))
+                else:
+                    entries.append((paramname,compile(paramvalue,str(path),'eval'),False))
+        cls.__parsed__[str(path)]=(st.st_mtime_ns,st.st_size,entries)
+        return entries
+
     def parse(cls,paramfile):
         if (Path(__file__).resolve().parent/paramfile).is_file():
-            with open(paramfile) as pfile:
-                for e,line in enumerate(pfile.readlines()):
-                    if line.startswith("#") or len(line.strip(' \t\n\r')) == 0:
-                        continue
-                    paramname=line.split('=',1)[0].strip()
-                    paramvalue=line.split('=',1)[1].split('#')[0].strip()
-                    try:
-                        paramcomment=line.split('=',1)[1].split('#')[1].strip()
-                    except:
-                        pass
-                    if '@' in paramvalue:
-                        cls.__dynamic__[paramname]=paramvalue
-                    else:
-                        setattr(cls,paramname,eval(paramvalue))
-                    logging.getLogger(__name__).debug(f"Updating value for param {paramname}")
+            entries=cls._read(paramfile)
+            for paramname,paramvalue,dynamic in entries:
+                if dynamic:
+                    cls.__dynamic__[paramname]=paramvalue
+                else:
+                    cls.__memo__.discard(paramname)
+                    type.__setattr__(cls,paramname,eval(paramvalue))
+            cls.invalidate()
+            logging.getLogger(__name__).debug(f"Updated {len(entries)} params from {paramfile}")
+
+    def snapshot(cls):
+        '''returns the state of cfg (static values and dynamic expressions), to be applied later with restore()'''
+        static={k:v for k,v in vars(cls).items() if not k.startswith('__') and not k in cls.__memo__}
+        return (copy.deepcopy(static),dict(cls.__dynamic__))
+
+    def restore(cls,state):
+        '''resets cfg to a state returned by snapshot(). parameters created after the snapshot are removed'''
+        static,dynamic=state
+        for k in [k for k in vars(cls) if not k.startswith('__') and not k in static]:
+            type.__delattr__(cls,k)
+        for k,v in copy.deepcopy(static).items():
+            type.__setattr__(cls,k,v)
+        cls.__memo__.clear()
+        cls.__dynamic__.clear()
+        cls.__dynamic__.update(dynamic)
+
+    def context(cls,state=None):
+        '''returns a read only cfgcontext built from state (see snapshot()), or from the current state of cfg'''
+        static,dynamic=copy.deepcopy(state) if state is not None else cls.snapshot()
+        return cfgcontext(static,dynamic)
 
     def dump(cls):
         d={}
-        d.update({k:getattr(cls,k) for k in dir(cls) if not k.startswith('__')})
+        d.update({k:getattr(cls,k) for k in dir(cls) if not k.startswith('__') and not k in cls.__memo__})
         d.update(cls.__dynamic__)
         return {k: v for k, v in sorted(d.items(), key=lambda item: item[0])}
 
     def set(cls,key,value):
-        if key in dir(cls):
+        if key in dir(cls) and not key in cls.__memo__:
             setattr(cls,key,value)
         elif key in cls.__dynamic__.keys():
             logging.getLogger(__name__).warning(f"using set on dynamic cfg will freeze {key}")
@@ -52,18 +123,103 @@ class basecfg(type):
     def set_dynamic(cls,key,value):
         if isinstance(value,str):
             cls.__dynamic__[key]=value
+            cls.invalidate(key)
         else:
             raise KeyError(f"{cls.__name__} does not have {key} dynamic attribute.")
 
     def __getattr__(cls,key):
         if key in cls.__dynamic__.keys():
-            return eval(cls.__dynamic__[key].replace('@','cfg.'))
+            value=eval(cls._compile(cls.__dynamic__[key])[0])
+            type.__setattr__(cls,key,value)
+            cls.__memo__.add(key)
+            return value
         else:
             raise AttributeError(f"{cls.__name__} does not have {key} attribute.")
 
 class cfg(metaclass=basecfg):
     pass
 
+## a cfgcontext is a frozen copy of cfg, owned by one protocol analysis. reads are plain instance attribute reads,
+## dynamic parameters are evaluated on first read against the context itself. changes are made by deriving a new context,
+## so that a job never sees the changes made by another one, and never leaks its own changes to the global cfg
+class cfgcontext:
+    def __init__(self,static,dynamic):
+        object.__setattr__(self,'__static__',static)
+        object.__setattr__(self,'__dynamic__',dynamic)
+        self.__dict__.update(static)
+
+    def __getattr__(self,key):
+        dynamic=self.__dict__['__dynamic__']
+        if key in dynamic:
+            value=eval(cfg._compile(dynamic[key])[0],dict(globals(),cfg=self))
+            self.__dict__[key]=value
+            return value
+        raise AttributeError(f"{type(self).__name__} does not have {key} attribute.")
+
+    def __setattr__(self,key,value):
+        raise AttributeError(f"{type(self).__name__} is read only. Use derive({key}=...)")
+
+    def __delattr__(self,key):
+        raise AttributeError(f"{type(self).__name__} is read only.")
+
+    def __reduce__(self):
+        return (cfgcontext,(self.__static__,self.__dynamic__))
+
+    def _spawn(self,static,dynamic):
+        return cfgcontext(static,dynamic)
+
+    def trace(self,reads):
+        '''returns a copy of this context that adds the name of each parameter it reads to the set reads.
+        contexts derived from it share the same set
+        '''
+        return tracedcontext(self.__static__,self.__dynamic__,reads)
+
+    def untraced(self):
+        '''returns a copy of this context that does not record the parameters it reads'''
+        return self
+
+    def derive(self,**values):
+        '''returns a new context where values replace the current ones. as with cfg.set, dynamic parameters are frozen'''
+        return self._spawn(dict(self.__static__,**values),{k:v for k,v in self.__dynamic__.items() if not k in values})
+
+    def parse(self,paramfile):
+        '''returns a new context updated with the values of paramfile, or self if paramfile does not exist'''
+        if not (Path(__file__).resolve().parent/paramfile).is_file():
+            return self
+        static=dict(self.__static__)
+        dynamic=dict(self.__dynamic__)
+        for paramname,paramvalue,isdynamic in cfg._read(paramfile):
+            if isdynamic:
+                dynamic[paramname]=paramvalue
+            else:
+                static[paramname]=eval(paramvalue)
+        return self._spawn(static,dynamic)
+
+    def dump(self):
+        d=dict(self.__static__)
+        d.update(self.__dynamic__)
+        return {k: v for k, v in sorted(d.items(), key=lambda item: item[0])}
+
+## parameters are upper case names. reads of methods and private attributes are not recorded
+class tracedcontext(cfgcontext):
+    def __init__(self,static,dynamic,reads):
+        super().__init__(static,dynamic)
+        object.__setattr__(self,'__reads__',reads)
+
+    def __getattribute__(self,key):
+        if key.isupper():
+            object.__getattribute__(self,'__reads__').add(key)
+        return object.__getattribute__(self,key)
+
+    def __reduce__(self):
+        return (tracedcontext,(self.__static__,self.__dynamic__,self.__reads__))
+
+    def _spawn(self,static,dynamic):
+        return tracedcontext(static,dynamic,self.__reads__)
+
+    def untraced(self):
+        return cfgcontext(self.__static__,self.__dynamic__)
+
 if __name__=='__main__':
     cfg.parse("./params/generic_params_test.py")
     #print(cfg.dump())
@@ -11,7 +11,7 @@
 
 ## Python stdlib import. Can't live without it
 from cmath import nan
-import os,sys,platform,logging,fnmatch,pprint,re,time
+import os,sys,platform,logging,fnmatch,pprint,re,time,hashlib
 sys.path.insert(0,"./modules")
 from pathlib import Path
 
@@ -21,7 +21,6 @@ warnings.warn = lambda *args,**kwargs:0   ## shut down matplotlib deprecation wa
 
 ## data science stack
 import numpy as np
-import pandas as pd
 import scipy
 import quantities as pq
 import neo
@@ -47,7 +46,7 @@ prefix={1e-12:'p',
         1e3:'k',
         1e6:'M',
         1e9:'G'}
-import matplotlib
+## matplotlib, pandas and the interactive tools are imported on first use: batch and command line runs start faster
 ## tried several backend, but none is clearly faster than another, ecept for gr, but which is very buggy!
 '''
 'GTK3Agg', 'GTK3Cairo', 'MacOSX', 'nbAgg', 'Qt4Agg', 'Qt4Cairo', 'Qt5Agg', 'Qt5Cairo', 
@@ -56,17 +55,20 @@ import matplotlib
 '''
 #matplotlib.use("module://gr.matplotlib.backend_gr")
 if cfg.ITSQ_MPL_BACKEND in ['GTK3Agg', 'MacOSX', 'Qt4Agg', 'Qt5Agg', 'TkAgg', 'WXAgg']:
-    matplotlib.use(cfg.ITSQ_MPL_BACKEND)
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
+    import matplotlib
+    matplotlib.use(cfg.ITSQ_MPL_BACKEND)   ## pyplot is not imported yet: only selects the backend
 #plt.rcParams['lines.antialiased']=True
 #plt.rcParams['lines.linewidth']=1.0
-from mpl_interaction import PanAndZoom
-from mpl_toolbutton import TriggerBtn,ToggleBtn
-from mpl_draggable import draggable_line
 
-from experiment import Experiment
+from experiment import Experiment,probe
 from xyfitter import XYFitter
+from sweepstats import SweepStats
+from spiketable import findpeaks,spiketable,ahpminima
+import framepool
+import rerun
+import resultcache
+import manifest
+from resultstore import ResultStore
 from baseprotocol import once,BaseFrame,BaseProtocol
 ## default config file in case we lose the original one
 defaultconfig='''
@@ -256,10 +258,12 @@ def _pprint(q,unit):
         return "nan"
 
 def _autoscale(ax,x,y,xmargin=0,ymargin=0.1):
-    xmargin=0.1*abs(max(x)-min(x))
-    ax.set_xlim(min(x),max(x))
-    ymargin=0.1*abs(max(y)-min(y))
-    ax.set_ylim(min(y)-ymargin,max(y)+ymargin)
+    xmin,xmax=np.min(x),np.max(x)
+    ymin,ymax=np.min(y),np.max(y)
+    xmargin=0.1*abs(xmax-xmin)
+    ax.set_xlim(xmin,xmax)
+    ymargin=0.1*abs(ymax-ymin)
+    ax.set_ylim(ymin-ymargin,ymax+ymargin)
 
 def _prefix(stringlist,prefix):
     return [prefix+l for l in stringlist] 
@@ -267,6 +271,89 @@ def _prefix(stringlist,prefix):
 def _clamp(x,lo,hi):
     return max(lo, min(x, hi))
 
+def _context(context):
+    ## protocols analyse with the given cfg context, or with a context copied from the global cfg
+    return context if context is not None else cfg.context()
+
+def _framestats(frame):
+    ## window statistics shared by all frames of protocol, or statistics of this frame alone
+    stats=getattr(frame.parent,'stats',None)
+    if stats is None:
+        return SweepStats(frame.voltage.V()[np.newaxis,:],frame.voltage.sampling_rate),0
+    return stats,frame.idx
+
+def _fit(frame,times,volts,order,weighted,start):
+    ## time constant fit of a frame. with cfg.ITSQ_FIT_WARM_START, starts from previous fit of frame or last fit of protocol
+    warmstart=None
+    if frame.cfg.ITSQ_FIT_WARM_START:
+        warmstart=getattr(frame,'fitter',None)
+        if warmstart is None or not warmstart.success:
+            warmstart=getattr(frame.parent,'lastfitter',None)
+    fitter=XYFitter(times,volts,order,weighted,start,
+                    maxfev=frame.cfg.ITSQ_FIT_ITERATION_COUNT,
+                    version=frame.cfg.ITSQ_FITTER_VERSION,
+                    warmstart=warmstart)
+    if fitter.success:
+        frame.parent.lastfitter=fitter
+    return fitter
+
+def _previewahppeaks(frame,height,prominence):
+    ## live preview of the ahp spike cursors: peaks only. ahp and adp are measured on release
+    volts=frame.voltage.V()
+    peak_pos,_=scipy.signal.find_peaks(volts,height=height,prominence=prominence,distance=int(0.00040*frame.voltage._sampling_rate))
+    frame._preview(frame._axes(0),'previewpeaks',frame.voltage.s()[peak_pos],volts[peak_pos],
+                   ['peaks','ahp','ahppos','ahppos_1s','adp_5ms','adp_10ms'],'x',color='red')
+
+def _tcautostop(ctx,stats,row,sr):
+    ## end of time constant fit: 80% of delay to voltage minimum during current injection, at most 120% of default fit duration
+    fitstop=float(stats.argmin(ctx.IV_CURRENT_INJECTION_START,ctx.IV_CURRENT_INJECTION_STOP)[row]/sr+ctx.IV_CURRENT_INJECTION_START)
+    fitstop=ctx.IV_CURRENT_INJECTION_START+(fitstop-ctx.IV_CURRENT_INJECTION_START)*0.8
+    return float(np.min([fitstop,ctx.IV_CURRENT_INJECTION_START+(ctx.IV_TCFIT_STOP-ctx.IV_TCFIT_START)*1.2])) ##initially 1.2; 0.8 would be better?
+
+def _spikeargs(ctx,sig):
+    ## spike detection settings (sr,height,prominence,distance,pre,post,dvthreshold,lowest,smooth)
+    return (float(sig._sampling_rate),ctx.IV_SPIKE_MIN_PEAK,ctx.IV_SPIKE_MIN_AMP,ctx.IV_SPIKE_MIN_INTER,
+            ctx.IV_SPIKE_PRE_TIME,ctx.IV_SPIKE_POST_TIME,ctx.IV_SPIKE_DV_THRESHOLD,ctx.IV_SPIKE_LOWEST_THRESHOLD,ctx.IV_SPIKE_DV_SMOOTHING)
+
+def _fitargs(ctx,sig,fitstart,fitstop):
+    ## time constant fit settings (i0,i1,order,weighted,fitstart,maxfev,version). None if window is not given in seconds
+    if not (isinstance(fitstart,float) and isinstance(fitstop,float)):
+        return None
+    return (int(round(fitstart*sig._sampling_rate)),int(round(fitstop*sig._sampling_rate)),
+            ctx.IV_TCFIT_ORDER,ctx.IV_TCFIT_WEIGHTED_AVERAGE,fitstart,ctx.ITSQ_FIT_ITERATION_COUNT,ctx.ITSQ_FITTER_VERSION)
+
+def _precompute(protocol,sigs,currents):
+    '''measures spikes and fits time constants of all sweeps in the frame pool, before frames are built.
+    frames pick their results in protocol.precomputed, and process locally anything computed with other settings
+    '''
+    protocol.precomputed={}
+    ctx=protocol.cfg
+    if not ctx.ITSQ_ENABLE_MULTIPROCESSING or _batchmode or len(sigs)<2:
+        return
+    if len(set([(len(s),float(s._sampling_rate),float(s.t_start)) for s in sigs]))!=1:
+        return
+    ## spontaneousactivity frames all have idx 0: rows are positions in sigs
+    stats=getattr(protocol,'stats',None) or SweepStats.fromsignals(sigs)
+    tasks=[]
+    for e,(s,current) in enumerate(zip(sigs,currents)):
+        fitargs=None
+        if current<=ctx.IV_TCFIT_THRESHOLD:
+            fitstop=_tcautostop(ctx,stats,e,float(s.sampling_rate)) if ctx.IV_TCFIT_AUTOSTOP else ctx.IV_TCFIT_STOP
+            fitargs=_fitargs(ctx,s,ctx.IV_TCFIT_START,fitstop)
+        tasks.append((e,_spikeargs(ctx,s),fitargs))
+    results=framepool.measure(stats.data,sigs[0].s(),tasks,ctx.ITSQ_FRAME_JOBS)
+    if results is None:
+        return
+    for s,(_,spikeargs,fitargs),r in zip(sigs,tasks,results):
+        protocol.precomputed[id(s)]=dict(r,spikesargs=spikeargs,fitterargs=fitargs)
+
+def _precomputed(frame,kind,args):
+    ## result of frame pool for this frame, provided it was computed with the same settings
+    r=getattr(frame.parent,'precomputed',{}).get(id(frame.voltage),{})
+    if args is not None and kind in r and r[kind+'args']==args:
+        return r[kind]
+    return None
+
 ##################################################################################################
 ##################################################################################################
 ##################################################################################################
@@ -289,35 +376,38 @@ class tcframe(BaseFrame):
         super(tcframe,self).__init__(idx,parent)
 
     def process(self,bitmask=0xFFFF):
-        times=self.voltage.s(cfg.TC_FIT_START,cfg.TC_FIT_STOP)
-        volts=self.voltage.V(cfg.TC_FIT_START,cfg.TC_FIT_STOP)
-        self.fitter=XYFitter(times,volts,cfg.TC_FIT_ORDER,cfg.TC_WEIGHTED_AVERAGE,cfg.TC_FIT_START,
-                            maxfev=cfg.ITSQ_FIT_ITERATION_COUNT,
-                            version=cfg.ITSQ_FITTER_VERSION)
+        times=self.voltage.s(self.cfg.TC_FIT_START,self.cfg.TC_FIT_STOP)
+        volts=self.voltage.V(self.cfg.TC_FIT_START,self.cfg.TC_FIT_STOP)
+        self.fitter=_fit(self,times,volts,self.cfg.TC_FIT_ORDER,self.cfg.TC_WEIGHTED_AVERAGE,self.cfg.TC_FIT_START)
         self.fitline=[times,self.fitter.line(times)]
     
     @once
     def setup(self):
         self._fig().subplots(1, 1)
-        self._cursor(self._axes(0),'v',cfg.TC_FIT_START,
-                    lambda x:cfg.set('TC_FIT_START',x) or self.parent.process(0xFFFF) or self.parent.draw (False))
-        self._cursor(self._axes(0),'v',cfg.TC_FIT_STOP,
-                    lambda x:cfg.set('TC_FIT_STOP',x) or self.parent.process(0xFFFF) or self.parent.draw (False))
+        self._cursor(self._axes(0),'v',self.cfg.TC_FIT_START,
+                    lambda x:self.parent.setcfg(TC_FIT_START=x) or self.parent.process(0xFFFF) or self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewfit(x,self.cfg.TC_FIT_STOP))
+        self._cursor(self._axes(0),'v',self.cfg.TC_FIT_STOP,
+                    lambda x:self.parent.setcfg(TC_FIT_STOP=x) or self.parent.process(0xFFFF) or self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewfit(self.cfg.TC_FIT_START,x))
+
+    def previewfit(self,start,stop):
+        self._previewwindow(self._axes(0),self.voltage,start,stop,['fit'])
 
     def draw(self,drawall=True):
         self.setup() ## ensure that axes are ready!
         self._fig().canvas.TopLevelParent.SetTitle("Time constant protocol")
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            self._axes(0).plot(self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
+            self._trace(self._axes(0),self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
             _autoscale(self._axes(0),self.voltage.s(),self.voltage.V())
-        self._clf(['markers'])
         if self.fitter.success:
-            self._axes(0).set_title(f'TC: {_pprint(self.fitter.tc,pq.s)}')
-            self._axes(0).plot( self.fitline[0], self.fitline[1],color='red',gid='markers')
+            self._title(self._axes(0),f'TC: {_pprint(self.fitter.tc,pq.s)}')
+            self._marker(self._axes(0),'fit',self.fitline[0], self.fitline[1],color='red')
 
 class timeconstantprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive):
+    def __init__(self,sigs,interactive,context=None):
+        self.cfg=_context(context)
         self.frames=[tcframe(s,idx=e,parent=self) for e,s in enumerate(sigs) ]
         super(timeconstantprotocol,self).__init__(interactive)
     def provides(self):
@@ -325,8 +415,8 @@ class timeconstantprotocol(BaseProtocol):
                 'TC_tc_pos':'avg time constant, measured for positive current pulse'}
     def results(self):
         ## np.mean return nan for empty lists
-        self.r= {'TC_tc_neg':np.nanmean([f.fitter.tc for f in self.frames if f.fitter.success and f.enabled and f.idx<len(self.frames)/2 ] )/cfg.OUTPUT_S_SCALE,
-                'TC_tc_pos':np.nanmean([f.fitter.tc for f in self.frames if f.fitter.success and f.enabled and f.idx>len(self.frames)/2 ] )/cfg.OUTPUT_S_SCALE}
+        self.r= {'TC_tc_neg':np.nanmean([f.fitter.tc for f in self.frames if f.fitter.success and f.enabled and f.idx<len(self.frames)/2 ] )/self.cfg.OUTPUT_S_SCALE,
+                'TC_tc_pos':np.nanmean([f.fitter.tc for f in self.frames if f.fitter.success and f.enabled and f.idx>len(self.frames)/2 ] )/self.cfg.OUTPUT_S_SCALE}
         return self.r
 '''
     Sag ratio protocol, Frick lab version (Yukti & Anna)
@@ -346,9 +436,10 @@ class sagframe(BaseFrame):
         super(sagframe,self).__init__(idx,parent)
 
     def process(self,bitmask=0xFFFF):
-        midpoint=0.66*(cfg.SAG_CURRENT_INJECTION_START+cfg.SAG_CURRENT_INJECTION_STOP)
-        self.baseline=np.mean(self.voltage.V(0.0,cfg.SAG_CURRENT_INJECTION_START))
-        self.steadystate=np.mean(self.voltage.V(midpoint,cfg.SAG_CURRENT_INJECTION_STOP))
+        midpoint=0.66*(self.cfg.SAG_CURRENT_INJECTION_START+self.cfg.SAG_CURRENT_INJECTION_STOP)
+        stats,row=_framestats(self)
+        self.baseline=stats.mean(0.0,self.cfg.SAG_CURRENT_INJECTION_START)[row]
+        self.steadystate=stats.mean(midpoint,self.cfg.SAG_CURRENT_INJECTION_STOP)[row]
         #self.resistance=np.abs((self.baseline-self.steadystate)/self.currentstep*1e12) ##in Ohms current step is in pA 
         #times=self.voltage.s(cfg.SAG_TCFIT_START,cfg.SAG_TCFIT_STOP)
         #volts=self.voltage.V(cfg.SAG_TCFIT_START,cfg.SAG_TCFIT_STOP)
@@ -356,8 +447,8 @@ class sagframe(BaseFrame):
         #                    maxfev=cfg.ITSQ_FIT_ITERATION_COUNT,
         #                    version=cfg.ITSQ_FITTER_VERSION)
         #self.fitline=[times,self.fitter.line(times)]
-        negpeak=np.argmin(self.voltage.V())/float(self.voltage._sampling_rate)
-        self.sagpeak=np.mean(self.voltage.V(negpeak-0.01,negpeak+0.01))
+        negpeak=stats.argmin()[row]/float(self.voltage._sampling_rate)
+        self.sagpeak=np.mean(stats.row(row,negpeak-0.01,negpeak+0.01))
         self.sagratio=(self.baseline-self.steadystate)/(self.baseline-self.sagpeak)  
 
     @once
@@ -373,23 +464,25 @@ class sagframe(BaseFrame):
         self._fig().canvas.TopLevelParent.SetTitle("Sag protocol protocol")
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            self._axes(0).plot(self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
+            self._trace(self._axes(0),self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
             _autoscale(self._axes(0),self.voltage.s(),self.voltage.V())
-        self._clf(['markers'])
-        self._axes(0).set_title(f'Sag ratio {self.currentstep}pA: {self.sagratio} ')
+        self._title(self._axes(0),f'Sag ratio {self.currentstep}pA: {self.sagratio} ')
         #if self.fitter.success:
-        #    self._axes(0).plot( self.fitline[0], self.fitline[1],color='red',gid='markers')
-        self._axes(0).axhline(self.baseline,color="black",linestyle ="--",gid='markers')
-        self._axes(0).axhline(self.steadystate,color="grey",linestyle ="--",gid='markers')
-        self._axes(0).axhline(self.sagpeak,color="green",linestyle ="--",gid='markers')
+        #    self._marker(self._axes(0),'fit',self.fitline[0], self.fitline[1],color='red')
+        self._hmarker(self._axes(0),'baseline',self.baseline,color="black",linestyle ="--")
+        self._hmarker(self._axes(0),'steadystate',self.steadystate,color="grey",linestyle ="--")
+        self._hmarker(self._axes(0),'sagpeak',self.sagpeak,color="green",linestyle ="--")
 
 class sagprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive,currentstep=None):
+    def __init__(self,sigs,interactive,currentstep=None,context=None):
+        self.cfg=_context(context)
+        self.stats=SweepStats.fromsignals(sigs)
         self.frames=[sagframe(s,currentstep[e],idx=e,parent=self) for e,s in enumerate(sigs) ]
         super(sagprotocol,self).__init__(interactive)
     def provides(self):
         d={}
-        for c in cfg.SAG_CURRENT_STEPS:
+        ctx=getattr(self,'cfg',cfg)   ## provides(None) describes the global cfg
+        for c in ctx.SAG_CURRENT_STEPS:
             d[f'SAG_ratio_{c}pA']=f'average voltage peak value for {c}pA current step'
         return d
     def results(self):
@@ -416,46 +509,46 @@ class resistanceframe(BaseFrame):
         super(resistanceframe,self).__init__(idx,parent)
 
     def process(self,bitmask=0xFFFF):
-        midpoint=0.66*(cfg.INPUTR_CURRENT_INJECTION_START+cfg.INPUTR_CURRENT_INJECTION_STOP)
-        self.baseline=np.mean(self.voltage.V(0.0,cfg.INPUTR_CURRENT_INJECTION_START))
-        self.steadystate=np.mean(self.voltage.V(midpoint,cfg.INPUTR_CURRENT_INJECTION_STOP))
+        midpoint=0.66*(self.cfg.INPUTR_CURRENT_INJECTION_START+self.cfg.INPUTR_CURRENT_INJECTION_STOP)
+        stats,row=_framestats(self)
+        self.baseline=stats.mean(0.0,self.cfg.INPUTR_CURRENT_INJECTION_START)[row]
+        self.steadystate=stats.mean(midpoint,self.cfg.INPUTR_CURRENT_INJECTION_STOP)[row]
         self.resistance=np.abs((self.baseline-self.steadystate)/self.currentstep*1e12) ##in Ohms current step is in pA 
-        times=self.voltage.s(cfg.INPUTR_TCFIT_START,cfg.INPUTR_TCFIT_STOP)
-        volts=self.voltage.V(cfg.INPUTR_TCFIT_START,cfg.INPUTR_TCFIT_STOP)
-        self.fitter=XYFitter(times,volts,cfg.INPUTR_TCFIT_ORDER,cfg.INPUTR_TCFIT_WEIGHTED_AVERAGE,cfg.INPUTR_TCFIT_START,
-                            maxfev=cfg.ITSQ_FIT_ITERATION_COUNT,
-                            version=cfg.ITSQ_FITTER_VERSION)
+        times=self.voltage.s(self.cfg.INPUTR_TCFIT_START,self.cfg.INPUTR_TCFIT_STOP)
+        volts=self.voltage.V(self.cfg.INPUTR_TCFIT_START,self.cfg.INPUTR_TCFIT_STOP)
+        self.fitter=_fit(self,times,volts,self.cfg.INPUTR_TCFIT_ORDER,self.cfg.INPUTR_TCFIT_WEIGHTED_AVERAGE,self.cfg.INPUTR_TCFIT_START)
         self.fitline=[times,self.fitter.line(times)]
-        negpeak=np.argmin(self.voltage.V())/float(self.voltage._sampling_rate)
-        self.sagpeak=np.mean(self.voltage.V(negpeak-0.01,negpeak+0.01))
+        negpeak=stats.argmin()[row]/float(self.voltage._sampling_rate)
+        self.sagpeak=np.mean(stats.row(row,negpeak-0.01,negpeak+0.01))
         self.sagratio=(self.baseline-self.steadystate)/(self.baseline-self.sagpeak)  
 
     @once
     def setup(self):
         self._fig().subplots(1, 1)
-        self._cursor(self._axes(0),'v',cfg.INPUTR_TCFIT_START,
-                    lambda x:cfg.set('INPUTR_TCFIT_START',x) or self.parent.process(0xFFFF) or self.parent.draw ())
-        self._cursor(self._axes(0),'v',cfg.INPUTR_TCFIT_STOP,
-                    lambda x:cfg.set('INPUTR_TCFIT_STOP',x) or self.parent.process(0xFFFF) or self.parent.draw ())
+        self._cursor(self._axes(0),'v',self.cfg.INPUTR_TCFIT_START,
+                    lambda x:self.parent.setcfg(INPUTR_TCFIT_START=x) or self.parent.process(0xFFFF) or self.parent.draw ())
+        self._cursor(self._axes(0),'v',self.cfg.INPUTR_TCFIT_STOP,
+                    lambda x:self.parent.setcfg(INPUTR_TCFIT_STOP=x) or self.parent.process(0xFFFF) or self.parent.draw ())
 
     def draw(self,drawall=True):
         self.setup() ## ensure that axes are ready!
         self._fig().canvas.TopLevelParent.SetTitle("Resistance protocol")
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            self._axes(0).plot(self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
+            self._trace(self._axes(0),self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
             _autoscale(self._axes(0),self.voltage.s(),self.voltage.V())
-        self._clf(['markers'])
-        self._axes(0).set_title(f'Res : {_pprint(self.resistance,pq.Ohm)} '+\
+        self._title(self._axes(0),f'Res : {_pprint(self.resistance,pq.Ohm)} '+\
                            f'TC: {_pprint(self.fitter.tc,pq.s)}')
         if self.fitter.success:
-            self._axes(0).plot( self.fitline[0], self.fitline[1],color='red',gid='markers')
-        self._axes(0).axhline(self.baseline,color="black",linestyle ="--",gid='markers')
-        self._axes(0).axhline(self.steadystate,color="grey",linestyle ="--",gid='markers')
-        self._axes(0).axhline(self.sagpeak,color="green",linestyle ="--",gid='markers')
+            self._marker(self._axes(0),'fit',self.fitline[0], self.fitline[1],color='red')
+        self._hmarker(self._axes(0),'baseline',self.baseline,color="black",linestyle ="--")
+        self._hmarker(self._axes(0),'steadystate',self.steadystate,color="grey",linestyle ="--")
+        self._hmarker(self._axes(0),'sagpeak',self.sagpeak,color="green",linestyle ="--")
 
 class resistanceprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive,currentstep=None):
+    def __init__(self,sigs,interactive,currentstep=None,context=None):
+        self.cfg=_context(context)
+        self.stats=SweepStats.fromsignals(sigs)
         self.frames=[resistanceframe(s,currentstep,idx=e,parent=self) for e,s in enumerate(sigs) ]
         super(resistanceprotocol,self).__init__(interactive)
     def provides(self):
@@ -464,9 +557,9 @@ class resistanceprotocol(BaseProtocol):
                 'INPUTR_baseline':'avg baseline before current pulse',
                 'INPUTR_sagratio':'avg sag ratio'}
     def results(self):
-        self.r= {'INPUTR_res':np.nanmean([f.resistance for f in self.frames if f.enabled ] ) / cfg.OUTPUT_OHM_SCALE,
-                'INPUTR_tc':np.nanmean([f.fitter.tc for f in self.frames if f.fitter.success and f.enabled ] ) / cfg.OUTPUT_S_SCALE,
-                'INPUTR_baseline':np.nanmean([f.baseline for f in self.frames if f.fitter.success and f.enabled]) / cfg.OUTPUT_V_SCALE,
+        self.r= {'INPUTR_res':np.nanmean([f.resistance for f in self.frames if f.enabled ] ) / self.cfg.OUTPUT_OHM_SCALE,
+                'INPUTR_tc':np.nanmean([f.fitter.tc for f in self.frames if f.fitter.success and f.enabled ] ) / self.cfg.OUTPUT_S_SCALE,
+                'INPUTR_baseline':np.nanmean([f.baseline for f in self.frames if f.fitter.success and f.enabled]) / self.cfg.OUTPUT_V_SCALE,
                 'INPUTR_sagratio':np.nanmean([f.sagratio for f in self.frames if f.fitter.success and f.enabled])}
         return self.r
 
@@ -480,6 +573,7 @@ class resistanceprotocol(BaseProtocol):
            print(protocol.results())
 '''
 class ahpsimpleframe(BaseFrame):
+    background=False                        ## process() moves cursors
     def __init__(self,sig,frequency,apcount,idx,parent):
         logging.getLogger().info("Using new simplified AHP analysis")
         self.voltage=sig
@@ -492,24 +586,23 @@ class ahpsimpleframe(BaseFrame):
         self.adp_10ms=None
         self.p1=0.1
         self.p2=0.2
-        if cfg.AHP_SPIKE_AUTO:
+        if parent.cfg.AHP_SPIKE_AUTO:
             hi,lo=np.max(self.voltage.V()),np.min(self.voltage.V())
             delta=(hi-lo)
-            cfg.AHP_SPIKE_MIN_PEAK=lo+delta*0.5
-            cfg.AHP_SPIKE_MIN_AMP=delta*0.35
+            parent.cfg=parent.cfg.derive(AHP_SPIKE_MIN_PEAK=lo+delta*0.5,AHP_SPIKE_MIN_AMP=delta*0.35)
         super(ahpsimpleframe,self).__init__(idx,parent)
 
     def process(self,bitmask=0xFFFF):
-        self.baseline=float(np.mean(self.voltage.V(cfg.AHP_SS_START,cfg.AHP_SS_STOP)))
+        self.baseline=float(np.mean(self.voltage.V(self.cfg.AHP_SS_START,self.cfg.AHP_SS_STOP)))
         volts=self.voltage.V()
         times=self.voltage.s()
         ## working in samples, as we're using find_peaks and argmin
         peak_pos,peak_info=scipy.signal.find_peaks(volts, \
-                                    height=cfg.AHP_SPIKE_MIN_PEAK,\
-                                    prominence=cfg.AHP_SPIKE_MIN_AMP,\
+                                    height=self.cfg.AHP_SPIKE_MIN_PEAK,\
+                                    prominence=self.cfg.AHP_SPIKE_MIN_AMP,\
                                     distance=int(0.00040*self.voltage._sampling_rate)) # up to 200Hz
-        validcounts=set([cnt for cnt,freq in cfg.AHP_VALID_COMBO])
-        validfreqs=set([freq for cnt,freq in cfg.AHP_VALID_COMBO])
+        validcounts=set([cnt for cnt,freq in self.cfg.AHP_VALID_COMBO])
+        validfreqs=set([freq for cnt,freq in self.cfg.AHP_VALID_COMBO])
         if len(peak_pos)==0:
             logging.getLogger().error("Could not find any peak in data!")
             self.ahp_pos=np.nan
@@ -525,9 +618,9 @@ class ahpsimpleframe(BaseFrame):
         self.peakcount=self.apcount
         self.peaks={'x':times[peak_pos],'y':volts[peak_pos]}
         ## get the mimimum
-        self.ahp_pos=peak_pos[-1]+np.argmin(  volts[peak_pos[-1] : peak_pos[-1] + int(cfg.AHP_MAX_DELAY*self.voltage.sampling_rate) ] )
-        start=int(self.ahp_pos-cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
-        stop=int(self.ahp_pos+cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        self.ahp_pos=peak_pos[-1]+np.argmin(  volts[peak_pos[-1] : peak_pos[-1] + int(self.cfg.AHP_MAX_DELAY*self.voltage.sampling_rate) ] )
+        start=int(self.ahp_pos-self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        stop=int(self.ahp_pos+self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
         self.ahp_value=self.baseline-np.mean(volts[start:stop]) ##self.baseline-np.mean(self.voltage.V(start,stop)) works also, as start and stop are int
         ## Anna's request.
         ## was previously measured relative to last spike max. now relative to baseline
@@ -554,8 +647,8 @@ class ahpsimpleframe(BaseFrame):
         ## get the value 1s after last peak
         try:
             self.ahp_pos_1s=peak_pos[-1]+int(1.0*self.voltage.sampling_rate)
-            start=int(self.ahp_pos_1s-cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
-            stop=int(self.ahp_pos_1s+cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+            start=int(self.ahp_pos_1s-self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+            stop=int(self.ahp_pos_1s+self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
             self.ahp_value_1s=self.baseline-np.mean(volts[start:stop])
         except:
             self.ahp_pos_1s=np.nan
@@ -563,13 +656,13 @@ class ahpsimpleframe(BaseFrame):
 
     def manualprocess(self,bitmask=0xFFFF):
         ## much easier...
-        self.baseline=float(np.mean(self.voltage.V(cfg.AHP_SS_START,cfg.AHP_SS_STOP)))
+        self.baseline=float(np.mean(self.voltage.V(self.cfg.AHP_SS_START,self.cfg.AHP_SS_STOP)))
         volts=self.voltage.V()
         p1=int(self.p1*self.voltage.sampling_rate)
         p2=int(self.p2*self.voltage.sampling_rate)
         self.ahp_pos=p1+np.argmin(volts[p1 : p2 ])
-        start=int(self.ahp_pos-cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
-        stop=int(self.ahp_pos+cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        start=int(self.ahp_pos-self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        stop=int(self.ahp_pos+self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
         self.ahp_value=self.baseline-np.mean(volts[start:stop]) ##self.baseline-np.mean(self.voltage.V(start,stop)) works also, as start and stop are int
         ## Anna's request.
         ## was previously measured relative to last spike max. now relative to baseline
@@ -581,15 +674,17 @@ class ahpsimpleframe(BaseFrame):
     @once
     def setup(self):
         self._fig().subplots(1, 1)
-        self._cursor(self._axes(0),'h',cfg.AHP_SPIKE_MIN_PEAK,
-                    lambda x:cfg.set('AHP_SPIKE_MIN_PEAK',x) or \
-                        cfg.set('AHP_SPIKE_MIN_AMP',x-self.parent.cursors[1].getpos()) or
+        self._cursor(self._axes(0),'h',self.cfg.AHP_SPIKE_MIN_PEAK,
+                    lambda x:self.parent.setcfg(AHP_SPIKE_MIN_PEAK=x) or \
+                        self.parent.setcfg(AHP_SPIKE_MIN_AMP=x-self.parent.cursors[1].getpos()) or
                         self.parent.process(0xFFFF) or \
-                        self.parent.draw (False))
-        self._cursor(self._axes(0),'h',cfg.AHP_SPIKE_MIN_PEAK-cfg.AHP_SPIKE_MIN_AMP,
-                    lambda x:cfg.set('AHP_SPIKE_MIN_AMP',cfg.AHP_SPIKE_MIN_PEAK-x) or \
+                        self.parent.draw (False),
+                    preview=lambda x:_previewahppeaks(self.parent.currentframe(),x,x-self.parent.cursors[1].getpos()))
+        self._cursor(self._axes(0),'h',self.cfg.AHP_SPIKE_MIN_PEAK-self.cfg.AHP_SPIKE_MIN_AMP,
+                    lambda x:self.parent.setcfg(AHP_SPIKE_MIN_AMP=self.cfg.AHP_SPIKE_MIN_PEAK-x) or \
                         self.parent.process(0xFFFF) or \
-                        self.parent.draw (False))
+                        self.parent.draw (False),
+                    preview=lambda x:_previewahppeaks(self.parent.currentframe(),self.cfg.AHP_SPIKE_MIN_PEAK,self.cfg.AHP_SPIKE_MIN_PEAK-x))
         ## enable manual analysis. When setup is called, process has already been called, therefore
         ## self.peaks and self.ahppos should exist,although they may be nan
         try:
@@ -605,40 +700,40 @@ class ahpsimpleframe(BaseFrame):
         self._cursor(self._axes(0),'v',self.p1,
                     lambda x:self.parent.currentframe().__setattr__('p1',x) or \
                         self.manualprocess(0xFFFF) or \
-                        self.parent.draw (False))
+                        self.parent.draw (False),preview=True)
         self._cursor(self._axes(0),'v',self.p2,
                     lambda x:self.parent.currentframe().__setattr__('p2',x) or \
                         self.manualprocess(0xFFFF) or \
-                        self.parent.draw (False))
+                        self.parent.draw (False),preview=True)
 
     def draw(self,drawall=True):
         self.setup() ## ensure that axes are ready!
         self._fig().canvas.TopLevelParent.SetTitle("AHP protocol")
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            self._axes(0).plot(self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
+            self._trace(self._axes(0),self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
             _autoscale(self._axes(0),self.voltage.s(),self.voltage.V())
-        self._clf(['markers'])
-        self._axes(0).axhline(self.baseline,color="black",linestyle ="--",gid='markers')
+        self._hmarker(self._axes(0),'baseline',self.baseline,color="black",linestyle ="--")
         if not self.ahp_value is None:
-            self._axes(0).set_title(f'Calc Freq: {self.frequency:.2f}Hz '+
+            self._title(self._axes(0),f'Calc Freq: {self.frequency:.2f}Hz '+
                                f'AHP : {_pprint(self.ahp_value,pq.V)}')
-            self._axes(0).axhline(self.baseline-self.ahp_value,color="green",linestyle ="--",gid='markers')
-            self._axes(0).plot(self.ahp_pos/self.voltage.sampling_rate,self.baseline-self.ahp_value,"o",color="green",gid='markers')
+            self._hmarker(self._axes(0),'ahp',self.baseline-self.ahp_value,color="green",linestyle ="--")
+            self._marker(self._axes(0),'ahppos',[self.ahp_pos/self.voltage.sampling_rate],[self.baseline-self.ahp_value],"o",color="green")
         if not (self.ahp_value_1s is None or np.isnan(self.ahp_value_1s)):
-            self._axes(0).set_title(f'Calc Freq: {self.frequency:.2f}Hz '+
+            self._title(self._axes(0),f'Calc Freq: {self.frequency:.2f}Hz '+
                                f'AHP : {_pprint(self.ahp_value,pq.V)} '+
                                f'AHP_1s : {_pprint(self.ahp_value_1s,pq.V)}')
-            self._axes(0).plot([self.ahp_pos_1s/self.voltage.sampling_rate],[self.baseline-self.ahp_value_1s],"o",color='orange', gid="markers")
-        self._axes(0).plot(self.peaks['x'],self.peaks['y'],'x',color='red',gid="markers")
+            self._marker(self._axes(0),'ahppos_1s',[self.ahp_pos_1s/self.voltage.sampling_rate],[self.baseline-self.ahp_value_1s],"o",color='orange')
+        self._marker(self._axes(0),'peaks',self.peaks['x'],self.peaks['y'],'x',color='red')
         try:
             if len(self.peaks['x'])!=0:
-                self._axes(0).plot(self.adp_5ms_t,self.baseline-self.adp_5ms,'v',color='orange',gid="markers")
-                self._axes(0).plot(self.adp_10ms_t,self.baseline-self.adp_10ms,'v',color='orange',gid="markers")
+                self._marker(self._axes(0),'adp_5ms',[self.adp_5ms_t],[self.baseline-self.adp_5ms],'v',color='orange')
+                self._marker(self._axes(0),'adp_10ms',[self.adp_10ms_t],[self.baseline-self.adp_10ms],'v',color='orange')
         except:
             pass
 
 class ahpframe(BaseFrame):
+    background=False                        ## process() moves cursors
     def __init__(self,sig,frequency,apcount,idx,parent):
         self.voltage=sig
         self.sr=int(sig.sampling_rate)
@@ -655,30 +750,29 @@ class ahpframe(BaseFrame):
         self.adp_10ms=None
         self.p1=0.1
         self.p2=0.2
-        if cfg.AHP_SPIKE_AUTO:
+        if parent.cfg.AHP_SPIKE_AUTO:
             hi,lo=np.max(self.voltage.V()),np.min(self.voltage.V())
             delta=(hi-lo)
-            cfg.AHP_SPIKE_MIN_PEAK=lo+delta*0.5
-            cfg.AHP_SPIKE_MIN_AMP=delta*0.35
+            parent.cfg=parent.cfg.derive(AHP_SPIKE_MIN_PEAK=lo+delta*0.5,AHP_SPIKE_MIN_AMP=delta*0.35)
         super(ahpframe,self).__init__(idx,parent)
 
     def process(self,bitmask=0xFFFF):
-        self.baseline=float(np.mean(self.voltage.V(cfg.AHP_SS_START,cfg.AHP_SS_STOP)))
+        self.baseline=float(np.mean(self.voltage.V(self.cfg.AHP_SS_START,self.cfg.AHP_SS_STOP)))
         volts=self.voltage.V()
         times=self.voltage.s()
         ## working in samples, as we're using find_peaks and argmin
-        if cfg.AHP_CHECK_NONE:
+        if self.cfg.AHP_CHECK_NONE:
             if self.frequency is None or self.apcount is None:
                 logging.getLogger().error("cfg.AHP_CHECK_NONE is set but could not parse number of APS or frequency!")
                 return
-            peak_pos=[int((cfg.AHP_SPIKE_START+n*(1/self.frequency))*int(self.voltage.sampling_rate)) for n in range (self.apcount)]
+            peak_pos=[int((self.cfg.AHP_SPIKE_START+n*(1/self.frequency))*int(self.voltage.sampling_rate)) for n in range (self.apcount)]
         else:
             peak_pos,peak_info=scipy.signal.find_peaks(volts, \
-                                        height=cfg.AHP_SPIKE_MIN_PEAK,\
-                                        prominence=cfg.AHP_SPIKE_MIN_AMP,\
+                                        height=self.cfg.AHP_SPIKE_MIN_PEAK,\
+                                        prominence=self.cfg.AHP_SPIKE_MIN_AMP,\
                                         distance=int(0.00040*self.voltage._sampling_rate)) # up to 200Hz
-        validcounts=set([cnt for cnt,freq in cfg.AHP_VALID_COMBO])
-        validfreqs=set([freq for cnt,freq in cfg.AHP_VALID_COMBO])
+        validcounts=set([cnt for cnt,freq in self.cfg.AHP_VALID_COMBO])
+        validfreqs=set([freq for cnt,freq in self.cfg.AHP_VALID_COMBO])
         self.peakcount=len(peak_pos)
         self.peaks={'x':times[peak_pos],'y':volts[peak_pos]}
         if self.autofreq:
@@ -691,7 +785,7 @@ class ahpframe(BaseFrame):
                 self.frequency=sorted(validfreqs)[idx]
             except:
                 self.frequency=np.nan
-        if self.peakcount<cfg.AHP_MIN_SPIKE_COUNT:
+        if self.peakcount<self.cfg.AHP_MIN_SPIKE_COUNT:
             logging.getLogger().error("Could not find at least 3 peaks in file!")
             self.ahp_pos=np.nan
             self.ahp_value=np.nan
@@ -701,7 +795,7 @@ class ahpframe(BaseFrame):
             self.adp_10ms=np.nan
             if self.peakcount<1:
                 return
-        if cfg.AHP_CHECK_SPIKE_COUNT and not (self.peakcount in validcounts):
+        if self.cfg.AHP_CHECK_SPIKE_COUNT and not (self.peakcount in validcounts):
             logging.getLogger().error(f"The number of detected peaks ({self.peakcount}) is unexpected!")
             self.ahp_pos=np.nan
             self.ahp_value=np.nan
@@ -710,7 +804,7 @@ class ahpframe(BaseFrame):
             self.adp_5ms=np.nan
             self.adp_10ms=np.nan
             return
-        elif cfg.AHP_CHECK_SPIKE_FREQ and not (self.frequency in validfreqs):
+        elif self.cfg.AHP_CHECK_SPIKE_FREQ and not (self.frequency in validfreqs):
             logging.getLogger().error(f"The computed frequency ({self.frequency}) is unexpected!")
             self.ahp_pos=np.nan
             self.ahp_value=np.nan
@@ -720,10 +814,10 @@ class ahpframe(BaseFrame):
             self.adp_10ms=np.nan
             return
         ## get the mimimum
-        self.ahp_pos=peak_pos[-1]+np.argmin(  volts[peak_pos[-1] : peak_pos[-1] + int(cfg.AHP_MAX_DELAY*self.voltage.sampling_rate) ] )
+        self.ahp_pos=peak_pos[-1]+np.argmin(  volts[peak_pos[-1] : peak_pos[-1] + int(self.cfg.AHP_MAX_DELAY*self.voltage.sampling_rate) ] )
         #self.ahp_pos=peak_pos[-1]+np.argmin(  volts[peak_pos[-1] : ] )
-        start=int(self.ahp_pos-cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
-        stop=int(self.ahp_pos+cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        start=int(self.ahp_pos-self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        stop=int(self.ahp_pos+self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
         self.ahp_value=self.baseline-np.mean(volts[start:stop]) ##self.baseline-np.mean(self.voltage.V(start,stop)) works also, as start and stop are int
         ## Anna's request.
         ## was previously measured relative to last spike max. now relative to baseline
@@ -741,8 +835,8 @@ class ahpframe(BaseFrame):
         ## get the value 1s after last peak
         try:
             self.ahp_pos_1s=peak_pos[-1]+int(1.0*self.voltage.sampling_rate)
-            start=int(self.ahp_pos_1s-cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
-            stop=int(self.ahp_pos_1s+cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+            start=int(self.ahp_pos_1s-self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+            stop=int(self.ahp_pos_1s+self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
             self.ahp_value_1s=self.baseline-np.mean(volts[start:stop])
         except:
             self.ahp_pos_1s=np.nan
@@ -750,13 +844,13 @@ class ahpframe(BaseFrame):
 
     def manualprocess(self,bitmask=0xFFFF):
         ## much easier...
-        self.baseline=float(np.mean(self.voltage.V(cfg.AHP_SS_START,cfg.AHP_SS_STOP)))
+        self.baseline=float(np.mean(self.voltage.V(self.cfg.AHP_SS_START,self.cfg.AHP_SS_STOP)))
         volts=self.voltage.V()
         p1=int(self.p1*self.voltage.sampling_rate)
         p2=int(self.p2*self.voltage.sampling_rate)
         self.ahp_pos=p1+np.argmin(volts[p1 : p2 ])
-        start=int(self.ahp_pos-cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
-        stop=int(self.ahp_pos+cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        start=int(self.ahp_pos-self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
+        stop=int(self.ahp_pos+self.cfg.AHP_TIME_WINDOW_AVERAGE*int(self.voltage.sampling_rate))
         self.ahp_value=self.baseline-np.mean(volts[start:stop]) ##self.baseline-np.mean(self.voltage.V(start,stop)) works also, as start and stop are int
         ## Anna's request.
         ## was previously measured relative to last spike max. now relative to baseline
@@ -768,15 +862,17 @@ class ahpframe(BaseFrame):
     @once
     def setup(self):
         self._fig().subplots(1, 1)
-        self._cursor(self._axes(0),'h',cfg.AHP_SPIKE_MIN_PEAK,
-                    lambda x:cfg.set('AHP_SPIKE_MIN_PEAK',x) or \
-                        cfg.set('AHP_SPIKE_MIN_AMP',x-self.parent.cursors[1].getpos()) or
+        self._cursor(self._axes(0),'h',self.cfg.AHP_SPIKE_MIN_PEAK,
+                    lambda x:self.parent.setcfg(AHP_SPIKE_MIN_PEAK=x) or \
+                        self.parent.setcfg(AHP_SPIKE_MIN_AMP=x-self.parent.cursors[1].getpos()) or
                         self.parent.process(0xFFFF) or \
-                        self.parent.draw (False))
-        self._cursor(self._axes(0),'h',cfg.AHP_SPIKE_MIN_PEAK-cfg.AHP_SPIKE_MIN_AMP,
-                    lambda x:cfg.set('AHP_SPIKE_MIN_AMP',cfg.AHP_SPIKE_MIN_PEAK-x) or \
+                        self.parent.draw (False),
+                    preview=lambda x:_previewahppeaks(self.parent.currentframe(),x,x-self.parent.cursors[1].getpos()))
+        self._cursor(self._axes(0),'h',self.cfg.AHP_SPIKE_MIN_PEAK-self.cfg.AHP_SPIKE_MIN_AMP,
+                    lambda x:self.parent.setcfg(AHP_SPIKE_MIN_AMP=self.cfg.AHP_SPIKE_MIN_PEAK-x) or \
                         self.parent.process(0xFFFF) or \
-                        self.parent.draw (False))
+                        self.parent.draw (False),
+                    preview=lambda x:_previewahppeaks(self.parent.currentframe(),self.cfg.AHP_SPIKE_MIN_PEAK,self.cfg.AHP_SPIKE_MIN_PEAK-x))
         ## enable manual analysis. When setup is called, process has already been called, therefore
         ## self.peaks and self.ahppos should exist,although they may be nan
         try:
@@ -792,73 +888,74 @@ class ahpframe(BaseFrame):
         self._cursor(self._axes(0),'v',self.p1,
                     lambda x:self.parent.currentframe().__setattr__('p1',x) or \
                         self.manualprocess(0xFFFF) or \
-                        self.parent.draw (False))
+                        self.parent.draw (False),preview=True)
         self._cursor(self._axes(0),'v',self.p2,
                     lambda x:self.parent.currentframe().__setattr__('p2',x) or \
                         self.manualprocess(0xFFFF) or \
-                        self.parent.draw (False))
+                        self.parent.draw (False),preview=True)
 
     def draw(self,drawall=True):
         self.setup() ## ensure that axes are ready!
         self._fig().canvas.TopLevelParent.SetTitle("AHP protocol")
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            self._axes(0).plot(self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
+            self._trace(self._axes(0),self.voltage.s(), self.voltage.V(),color='blue',gid='traces')
             _autoscale(self._axes(0),self.voltage.s(),self.voltage.V())
-        self._clf(['markers'])
-        self._axes(0).axhline(self.baseline,color="black",linestyle ="--",gid='markers')
+        self._hmarker(self._axes(0),'baseline',self.baseline,color="black",linestyle ="--")
         if not self.ahp_value is None:
-            self._axes(0).set_title(f'Calc Freq: {self.frequency:.2f}Hz '+
+            self._title(self._axes(0),f'Calc Freq: {self.frequency:.2f}Hz '+
                                f'AHP : {_pprint(self.ahp_value,pq.V)}')
-            self._axes(0).axhline(self.baseline-self.ahp_value,color="green",linestyle ="--",gid='markers')
-            self._axes(0).plot(self.ahp_pos/self.voltage.sampling_rate,self.baseline-self.ahp_value,"o",color="green",gid='markers')
+            self._hmarker(self._axes(0),'ahp',self.baseline-self.ahp_value,color="green",linestyle ="--")
+            self._marker(self._axes(0),'ahppos',[self.ahp_pos/self.voltage.sampling_rate],[self.baseline-self.ahp_value],"o",color="green")
         if not (self.ahp_value_1s is None or np.isnan(self.ahp_value_1s)):
-            self._axes(0).set_title(f'Calc Freq: {self.frequency:.2f}Hz '+
+            self._title(self._axes(0),f'Calc Freq: {self.frequency:.2f}Hz '+
                                f'AHP : {_pprint(self.ahp_value,pq.V)} '+
                                f'AHP_1s : {_pprint(self.ahp_value_1s,pq.V)}')
-            self._axes(0).plot([self.ahp_pos_1s/self.voltage.sampling_rate],[self.baseline-self.ahp_value_1s],"o",color='orange', gid="markers")
+            self._marker(self._axes(0),'ahppos_1s',[self.ahp_pos_1s/self.voltage.sampling_rate],[self.baseline-self.ahp_value_1s],"o",color='orange')
         try:
-            self._axes(0).plot(self.peaks['x'],self.peaks['y'],'x',color='red',gid="markers")
+            self._marker(self._axes(0),'peaks',self.peaks['x'],self.peaks['y'],'x',color='red')
         except:
             pass
         try:
             if len(self.peaks['x'])!=0:
-                self._axes(0).plot(self.adp_5ms_t,self.baseline-self.adp_5ms,'v',color='orange',gid="markers")
-                self._axes(0).plot(self.adp_10ms_t,self.baseline-self.adp_10ms,'v',color='orange',gid="markers")
+                self._marker(self._axes(0),'adp_5ms',[self.adp_5ms_t],[self.baseline-self.adp_5ms],'v',color='orange')
+                self._marker(self._axes(0),'adp_10ms',[self.adp_10ms_t],[self.baseline-self.adp_10ms],'v',color='orange')
         except:
             pass
 
 
 class ahpprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive,frequency=None,apcount=None):
-        if cfg.AHP_SIMPLIFIED_PROTOCOL and (apcount,frequency) in cfg.AHP_VALID_COMBO:
+    def __init__(self,sigs,interactive,frequency=None,apcount=None,context=None):
+        self.cfg=_context(context)
+        if self.cfg.AHP_SIMPLIFIED_PROTOCOL and (apcount,frequency) in self.cfg.AHP_VALID_COMBO:
             self.frames=[ahpsimpleframe(s,frequency,apcount,idx=e,parent=self) for e,s in enumerate(sigs) ]
         else:
             self.frames=[ahpframe(s,frequency,apcount,idx=e,parent=self) for e,s in enumerate(sigs) ]
         super(ahpprotocol,self).__init__(interactive)
     def provides(self):
+        ctx=getattr(self,'cfg',cfg)   ## provides(None) describes the global cfg
         r={}
-        for cnt,freq in cfg.AHP_VALID_COMBO:
+        for cnt,freq in ctx.AHP_VALID_COMBO:
             if cnt<6:
                 r.update({f'AHP_{cnt}_{freq}Hz_min':'maximal hyperpolarization after last detected pulse.'})
             if cnt>6:
                 r.update({f'AHP_{cnt}_{freq}Hz_min':'maximal hyperpolarization after last detected pulse.'})
                 r.update({f'AHP_{cnt}_{freq}Hz_1s':'hyperpolarization 1s after last detected pulse.'})
-        for cnt,freq in cfg.AHP_VALID_COMBO:
+        for cnt,freq in ctx.AHP_VALID_COMBO:
             r.update({f'AHP_{cnt}_{freq}Hz_adp_5ms':"ADP 5 ms after last spike (voltage(peak) -voltage(peak+5)"})
             r.update({f'AHP_{cnt}_{freq}Hz_adp_10ms':"ADP 10 ms after last spike (voltage(peak) -voltage(peak+5)"})
         return r
     def results(self):
-        sign=-1 if cfg.AHP_CORRECT_SIGNS else 1
+        sign=-1 if self.cfg.AHP_CORRECT_SIGNS else 1
         cnt=self.frames[0].peakcount
         freq=self.frames[0].frequency
         if cnt<6: ## AHP MED protocol
-            self.r= {f'AHP_{cnt}_{freq}Hz_min':sign*self.frames[0].ahp_value/cfg.OUTPUT_V_SCALE}
+            self.r= {f'AHP_{cnt}_{freq}Hz_min':sign*self.frames[0].ahp_value/self.cfg.OUTPUT_V_SCALE}
         elif cnt>5: ## AHP SLOW protocol
-            self.r= {f'AHP_{cnt}_{freq}Hz_min':sign*self.frames[0].ahp_value/cfg.OUTPUT_V_SCALE,
-                    f'AHP_{cnt}_{freq}Hz_1s':sign*self.frames[0].ahp_value_1s/cfg.OUTPUT_V_SCALE}
-        self.r.update({f'AHP_{cnt}_{freq}Hz_adp_5ms':sign*self.frames[0].adp_5ms/cfg.OUTPUT_V_SCALE})
-        self.r.update({f'AHP_{cnt}_{freq}Hz_adp_10ms':sign*self.frames[0].adp_10ms/cfg.OUTPUT_V_SCALE})
+            self.r= {f'AHP_{cnt}_{freq}Hz_min':sign*self.frames[0].ahp_value/self.cfg.OUTPUT_V_SCALE,
+                    f'AHP_{cnt}_{freq}Hz_1s':sign*self.frames[0].ahp_value_1s/self.cfg.OUTPUT_V_SCALE}
+        self.r.update({f'AHP_{cnt}_{freq}Hz_adp_5ms':sign*self.frames[0].adp_5ms/self.cfg.OUTPUT_V_SCALE})
+        self.r.update({f'AHP_{cnt}_{freq}Hz_adp_10ms':sign*self.frames[0].adp_10ms/self.cfg.OUTPUT_V_SCALE})
         return self.r
 
 '''
@@ -871,61 +968,30 @@ class ahpprotocol(BaseProtocol):
            print(protocol.results())
 '''
 class spike(object):
-    def __init__(self,signal,pos,idx,fidx,ahpbaseline=None):
-        pre=cfg.IV_SPIKE_PRE_TIME
-        post=cfg.IV_SPIKE_POST_TIME
-        prepts=cfg.IV_SPIKE_PRE_TIME*signal._sampling_rate          ## number of points to keep before peak
-        postpts=cfg.IV_SPIKE_POST_TIME*signal._sampling_rate        ## number of points to keep after peak
-        volts=signal.V()                                        ## convert to raw numpy array
-        times=signal.s()                                        ## convert to raw numpy array
-        self.pos=pos                                            ## pos of spike (in samples)in frame
+    def __init__(self,row,idx,fidx,ppv,ppdv):
+        ## row is a line of the spike table built by spiketable() for the whole frame
+        self.pos=row['pos']                                     ## pos of spike (in samples)in frame
         self.idx=idx                                            ## the index of spike in frame
         self.fidx=fidx                                          ## the frame the spike belongs to belongs to
-        self.time=times[pos]                                    ## time of spike in frame
-        self.peak=volts[pos]                                    ## peak amplitude of spike
+        self.time=row['time']                                   ## time of spike in frame
+        self.peak=row['peak']                                   ## peak amplitude of spike
         self.ISI=np.nan                                         ## inter spike interval. will be calculated later
         self.evoked=False                                       ## spike is evoked spike. will be calculated later
         self.rebound=False                                      ## spike is rebound spike
-        ## position and value for max rising slope (in samples)
-        self.maxrisepos=np.argmax(np.gradient(   signal.V(self.time-pre,self.time+post)   ))
-        self.maxrise=float(np.max(np.gradient(   signal.V(self.time-pre,self.time+post)   )) * signal._sampling_rate) ## to convert to V/s
-        self.maxrisepos+=self.pos-int(pre*signal._sampling_rate)
-
-        ## position and value for max descending slope (in samples)
-        self.maxfallpos=np.argmin(np.gradient(  signal.V(self.time-pre,self.time+post)   ))
-        self.maxfall=float(np.min(np.gradient(  signal.V(self.time-pre,self.time+post)   )) *signal._sampling_rate)
-        self.maxfallpos+=self.pos-int(pre*signal._sampling_rate)
-
-        ## phase plane values. As it is guaranteed that they will exist, we have to write them before trying to find threshold
-        ## for phase plane analysis, we'll keed a list of voltages and voltage variation
-        #self.PPV=volts[pos-int(prepts):pos+int(postpts)]
-        self.PPV=signal.V(self.time-pre,self.time+post)
-        self.PPdV=np.gradient(self.PPV)* signal._sampling_rate ## to convert to V/s
-
+        ## position and value for max rising and descending slopes (in samples and V/s)
+        self.maxrisepos=row['maxrisepos']
+        self.maxrise=float(row['maxrise'])
+        self.maxfallpos=row['maxfallpos']
+        self.maxfall=float(row['maxfall'])
+        ## phase plane values. for phase plane analysis, we'll keed a list of voltages and voltage variation
+        self.PPV=ppv
+        self.PPdV=ppdv
         ## position and value for threshold
-        ## using second derivarive maximum is very unefficient.
-        ## using second derivative threshold isn't more efficient than maximum.
-        ## see https://stackoverflow.com/questions/3843017/efficiently-detect-sign-changes-in-python
-        ## the latest algorithm is as follow: get the threshold pos both on first and second derivatives, and take the first one!
-        try:
-            thrsignal=np.gradient(np.gradient(  signal.V(self.time-pre,self.time+post)  )) -float(cfg.IV_SPIKE_DV_THRESHOLD)
-            self.thresholdpos1=np.where(np.diff(np.signbit(thrsignal)))[0][0]
-            self.thresholdpos1+=self.pos-int(pre*signal._sampling_rate)
-        except:
-            self.thresholdpos1=np.nan
-        try:
-            thrsignal=np.gradient(             signal.V(self.time-pre,self.time+post) ) -float(cfg.IV_SPIKE_DV_THRESHOLD)
-            self.thresholdpos2=np.where(np.diff(np.signbit(thrsignal)))[0][0]
-            self.thresholdpos2+=self.pos-int(pre*signal._sampling_rate)
-        except:
-            self.thresholdpos2=np.nan
-        if cfg.IV_SPIKE_LOWEST_THRESHOLD:
-            self.thresholdpos=np.nanmin([self.thresholdpos1,self.thresholdpos2])
-        else:
-            self.thresholdpos=self.thresholdpos1 if self.thresholdpos1!=np.nan else self.thresholdpos2
-
+        ## the threshold pos is determined both on first and second derivatives, and we take the first one!
+        self.thresholdpos1=np.nan if np.isnan(row['thresholdpos1']) else int(row['thresholdpos1'])
+        self.thresholdpos2=np.nan if np.isnan(row['thresholdpos2']) else int(row['thresholdpos2'])
         ## if we failed at identifying a threshold, then mark spike as incomplete and use np.nan values for the remaining spike measurements
-        if np.isnan(self.thresholdpos) :
+        if np.isnan(row['thresholdpos']):
             logging.getLogger(__name__).warning(f"Could not isolate threshold for spike {self.idx} in frame {self.fidx}")
             self.complete=False
             self.thresholdpos=np.nan
@@ -935,26 +1001,18 @@ class spike(object):
             self.hwpos=[np.nan,np.nan]
             #self.ahp=None ## will be overriden in frame analysis
             return
+        self.complete=bool(row['complete'])
+        self.thresholdpos=int(row['thresholdpos'])
+        self.threshold=row['threshold']
+        self.amplitude=row['amplitude']
+        ## position and value for half width 
+        self.halfvoltage=row['halfvoltage']
+        if self.complete:
+            self.hwpos=np.array([row['hwstart'],row['hwstop']],dtype=np.int64)
         else:
-            self.complete=True
-            self.thresholdpos=int(self.thresholdpos)
-            self.threshold=volts[self.thresholdpos]
-            self.amplitude=self.peak-self.threshold
-            ## position and value for half width 
-            ## could be more precise here: we could find the exact time at which the signal crosses zero (),
-            ## instead of first point before a zero crossing event occurs
-            self.halfvoltage=self.peak-(self.peak-self.threshold)/2
-            hwsignal=signal.V(self.time-pre,self.time+post)-self.halfvoltage
-            self.hwpos=np.where(np.diff(np.signbit(hwsignal)))[0]
-            self.hwpos[0]+=self.pos-int(pre*signal._sampling_rate)
-            try:
-                ## for weird spikes, it may happen thta voltage does not fall back to half voltage...
-                self.hwpos[1]+=self.pos-int(pre*signal._sampling_rate)
-                self.halfwidth=float((self.hwpos[1]-self.hwpos[0])/signal._sampling_rate)
-            except:
-                self.hwpos=np.append(self.hwpos,np.nan)
-                self.halfwidth=np.nan
-                self.complete=False
+            ## for weird spikes, it may happen thta voltage does not fall back to half voltage...
+            self.hwpos=np.array([row['hwstart'],np.nan])
+        self.halfwidth=float(row['halfwidth'])
 
 class ivframe(BaseFrame):
     bitmask_ALL=0xFFFF          ## reprocess time constant
@@ -965,30 +1023,31 @@ class ivframe(BaseFrame):
         self.sr=int(sig.sampling_rate)
         self.idx=idx
         if current==None:
-            self.current=cfg.IV_CURRENT_STEPS[self.idx]
+            self.current=parent.cfg.IV_CURRENT_STEPS[self.idx]
         else:
             self.current=current
         ## membrane time constant fit:
         ## each frame keeps its own settings
         self.fitter=None
-        self.fitstart=cfg.IV_TCFIT_START
-        self.fitstop=-1 if cfg.IV_TCFIT_AUTOSTOP else cfg.IV_TCFIT_STOP
+        self.fitstart=parent.cfg.IV_TCFIT_START
+        self.fitstop=-1 if parent.cfg.IV_TCFIT_AUTOSTOP else parent.cfg.IV_TCFIT_STOP
         ## no spike for now
         self.spikes=[]
         super(ivframe,self).__init__(idx,parent)
 
     def process(self,bitmask=0xFFFF):
         ## baseline,resistance, sagratio
-        self.baseline=np.mean(self.voltage.V(cfg.IV_BASELINE_START,cfg.IV_BASELINE_STOP))
-        self.sagpeak=np.min(self.voltage.V(cfg.IV_SAG_PEAK_START,cfg.IV_SAG_PEAK_STOP))
-        self.sagss=np.mean(self.voltage.V(cfg.IV_SAG_SS_START,cfg.IV_SAG_SS_STOP))
+        stats,row=_framestats(self)
+        self.baseline=stats.mean(self.cfg.IV_BASELINE_START,self.cfg.IV_BASELINE_STOP)[row]
+        self.sagpeak=stats.min(self.cfg.IV_SAG_PEAK_START,self.cfg.IV_SAG_PEAK_STOP)[row]
+        self.sagss=stats.mean(self.cfg.IV_SAG_SS_START,self.cfg.IV_SAG_SS_STOP)[row]
         self.sagratio=(self.baseline-self.sagss)/(self.baseline-self.sagpeak) if self.current<0 else None
         self.sagratio_pct=(self.sagss-self.sagpeak)/(self.baseline-self.sagss)*100 if self.current<0 else None
         self.resistance=(self.baseline-self.sagpeak)/self.current*1e12 if self.current!=0 else None
         self.resistance_interp=np.nan
 
         ##other analyses are in separated funcs
-        if bitmask & ivframe.bitmask_TC and self.current<=cfg.IV_TCFIT_THRESHOLD:
+        if bitmask & ivframe.bitmask_TC and self.current<=self.cfg.IV_TCFIT_THRESHOLD:
             self.process_tc()
         if bitmask & ivframe.bitmask_SPIKES:
             self.process_spikes()
@@ -998,68 +1057,57 @@ class ivframe(BaseFrame):
     def process_tc(self):
         ##if required, try to determine the end of fitting region
         if self.fitstop==-1:
-            ## find minimal value
-            self.fitstop=float(np.argmin(self.voltage.V(cfg.IV_CURRENT_INJECTION_START,cfg.IV_CURRENT_INJECTION_STOP))/float(self.voltage.sampling_rate)+cfg.IV_CURRENT_INJECTION_START)
-            ## adjust minimal value
-            self.fitstop=cfg.IV_CURRENT_INJECTION_START+(self.fitstop-cfg.IV_CURRENT_INJECTION_START)*0.8
-            self.fitstop=float(np.min([self.fitstop,cfg.IV_CURRENT_INJECTION_START+(cfg.IV_TCFIT_STOP-cfg.IV_TCFIT_START)*1.2])) ##initially 1.2; 0.8 would be better?
-        times=self.voltage.s(self.fitstart,self.fitstop)
-        volts=self.voltage.V(self.fitstart,self.fitstop)
-        self.fitter=XYFitter(times,volts,cfg.IV_TCFIT_ORDER,cfg.IV_TCFIT_WEIGHTED_AVERAGE,self.fitstart,
-                            maxfev=cfg.ITSQ_FIT_ITERATION_COUNT,
-                            version=cfg.ITSQ_FITTER_VERSION)
+            self.fitstop=_tcautostop(self.cfg,*_framestats(self),float(self.voltage.sampling_rate))
+        fitter=_precomputed(self,'fitter',_fitargs(self.cfg,self.voltage,self.fitstart,self.fitstop))
+        if fitter is None:
+            times=self.voltage.s(self.fitstart,self.fitstop)
+            volts=self.voltage.V(self.fitstart,self.fitstop)
+            fitter=_fit(self,times,volts,self.cfg.IV_TCFIT_ORDER,self.cfg.IV_TCFIT_WEIGHTED_AVERAGE,self.fitstart)
+        self.fitter=fitter
         ## computed fitted curve till the end of current pulse
         if self.fitter.success:
-            self.fitline=[               self.voltage.s(cfg.IV_CURRENT_INJECTION_START,cfg.IV_CURRENT_INJECTION_STOP),
-                        self.fitter.line(self.voltage.s(cfg.IV_CURRENT_INJECTION_START,cfg.IV_CURRENT_INJECTION_STOP))]
+            self.fitline=[               self.voltage.s(self.cfg.IV_CURRENT_INJECTION_START,self.cfg.IV_CURRENT_INJECTION_STOP),
+                        self.fitter.line(self.voltage.s(self.cfg.IV_CURRENT_INJECTION_START,self.cfg.IV_CURRENT_INJECTION_STOP))]
             self.resistance_interp=(self.fitline[1][-1]-self.baseline)/self.current*1e12 if self.current!=0 else None
         
     def process_spikes(self):
         ## convenient variables to simplify writing...
         times=self.voltage.s()
         volts=self.voltage.V()
-        sr=int(self.voltage.sampling_rate)
-        ## detect peaks
-        peak_pos,peak_infos=scipy.signal.find_peaks(volts, \
-                                    height=cfg.IV_SPIKE_MIN_PEAK,\
-                                    prominence=cfg.IV_SPIKE_MIN_AMP,\
-                                    #width=(int(0.0001*sr),int(0.05*sr)),\
-                                    distance=int(cfg.IV_SPIKE_MIN_INTER*sr),\
-                                    )
-
-        ## make sure we do not have a spike at the beginning or at the end of frame (in which case we could not take pre and post points)
-        skipstart=cfg.IV_SPIKE_PRE_TIME*sr
-        skipend=len(self.voltage)-cfg.IV_SPIKE_POST_TIME*sr
-        peak_pos=[p for p in peak_pos if p>skipstart and p<skipend]
+        spikeargs=_spikeargs(self.cfg,self.voltage)
+        precomputed=_precomputed(self,'spikes',spikeargs)
+        if precomputed is None:
+            sr,height,prominence,distance,pre,post,dvthreshold,lowest,smooth=spikeargs
+            ## detect peaks, except at the beginning or at the end of frame (in which case we could not take pre and post points)
+            peak_pos=findpeaks(volts,sr,height,prominence,distance,pre,post)
+            ## build the list of spikes. all spikes are measured at once, from the derivatives of the frame
+            table,ppv,ppdv=spiketable(volts,times,sr,peak_pos,pre,post,dvthreshold,lowest,smooth,self._derivatives(self.voltage,smooth))
+        else:
+            peak_pos,table,ppv,ppdv=precomputed
         ## try to determine baseline
         self.ahpbaseline=self._try_guess_ahp_baseline(peak_pos)
-        ## build the list of spikes
-        if cfg.ITSQ_ENABLE_MULTIPROCESSING and len(peak_pos)>100:
-            from multiprocessing import Pool
-            with Pool() as pool:
-                star_peak_pos=[(self.voltage,p,e,self.idx,self.ahpbaseline)   for e,p in enumerate(peak_pos) ]
-                self.spikes=pool.starmap(spike,star_peak_pos,)
-        else:
-            self.spikes=[  spike(self.voltage,p,e,self.idx,self.ahpbaseline)   for e,p in enumerate(peak_pos) ]
+        self.spikes=[  spike(table[e],e,self.idx,ppv[e],ppdv[e]*self.voltage._sampling_rate)   for e in range(len(table)) ]
         ## make list of evoked and rebound spikes and save attribute in spike object
-        self.reboundspikes=[s for s in self.spikes if s.time>cfg.IV_CURRENT_INJECTION_STOP and self.current<0]
-        self.evokedspikes=[s for s in self.spikes if cfg.IV_CURRENT_INJECTION_START<s.time<cfg.IV_CURRENT_INJECTION_STOP and self.current>=cfg.IV_SPIKE_EVOKED_THRESHOLD]
+        self.reboundspikes=[s for s in self.spikes if s.time>self.cfg.IV_CURRENT_INJECTION_STOP and self.current<0]
+        self.evokedspikes=[s for s in self.spikes if self.cfg.IV_CURRENT_INJECTION_START<s.time<self.cfg.IV_CURRENT_INJECTION_STOP and self.current>=self.cfg.IV_SPIKE_EVOKED_THRESHOLD]
         for s in self.reboundspikes:
             s.rebound=True
         for s in self.evokedspikes:
             s.evoked=True
         ## calculate interspike interval
         for e,s in enumerate(self.evokedspikes):
-            s.ISI=s.time-cfg.IV_CURRENT_INJECTION_START if e==0 else s.time-self.evokedspikes[e-1].time
+            s.ISI=s.time-self.cfg.IV_CURRENT_INJECTION_START if e==0 else s.time-self.evokedspikes[e-1].time
         ## for evoked spikes, extract minimum following spike, aka ahp
         ahp_spikes=[s for s in self.evokedspikes if s.complete]
-        for e,s in enumerate([s for s in self.evokedspikes]):
-            if e<(len(self.evokedspikes)-1): ## we are sure that there will be another spike after
-                s.ahppos=s.pos+np.argmin(   self.voltage.V(s.time,min(s.time+0.05,self.evokedspikes[e+1].time))  ) ## this line crashes
-                s.ahp=volts[s.ahppos]####YLF26APRIL#### self.ahpbaseline-volts[s.ahppos]
-            else:
-                s.ahppos=s.pos+np.argmin(   self.voltage.V(s.time,min(s.time+0.05,cfg.IV_CURRENT_INJECTION_STOP))    )
-                s.ahp=volts[s.ahppos]####YLF26APRIL#### self.ahpbaseline-volts[s.ahppos]
+        ## the ahp window ends 50ms after spike, or at next spike, or at the end of current injection
+        nexttimes=[s.time for s in self.evokedspikes[1:]]+[self.cfg.IV_CURRENT_INJECTION_STOP]
+        ahppos=ahpminima(volts,float(self.voltage._sampling_rate),
+                         [s.pos for s in self.evokedspikes],
+                         [s.time for s in self.evokedspikes],
+                         [min(s.time+0.05,t) for s,t in zip(self.evokedspikes,nexttimes)])
+        for s,p in zip(self.evokedspikes,ahppos):
+            s.ahppos=p
+            s.ahp=volts[s.ahppos]####YLF26APRIL#### self.ahpbaseline-volts[s.ahppos]
         ## end of spikes processing. store meta information for drawing
         self.meta={}
         self.meta['maxriseV']=   {'x': times[[s.maxrisepos for s in self.spikes]],\
@@ -1083,10 +1131,10 @@ class ivframe(BaseFrame):
     def _try_guess_ahp_baseline(self,pp):
             sr=int(self.voltage.sampling_rate)
             basesignal=self.voltage.V()
-            basesignal[0:int(cfg.IV_CURRENT_INJECTION_START*sr)]=np.nan
-            basesignal[int(cfg.IV_CURRENT_INJECTION_STOP*sr):]=np.nan
+            basesignal[0:int(self.cfg.IV_CURRENT_INJECTION_START*sr)]=np.nan
+            basesignal[int(self.cfg.IV_CURRENT_INJECTION_STOP*sr):]=np.nan
             for p in pp:
-                basesignal[p-int(cfg.IV_SPIKE_PRE_TIME*sr):p+int(cfg.IV_SPIKE_POST_TIME*sr)]=np.nan
+                basesignal[p-int(self.cfg.IV_SPIKE_PRE_TIME*sr):p+int(self.cfg.IV_SPIKE_POST_TIME*sr)]=np.nan
             return np.nanmean(basesignal)
 
     def process_firingpattern(self):
@@ -1113,13 +1161,13 @@ class ivframe(BaseFrame):
            self.pattern=None
         if len([s for s in self.evokedspikes])==0:
             self.pattern=="silent" ## obviously!
-        elif len([s for s in self.evokedspikes])<=2 and max([s.time-cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])<0.125:
+        elif len([s for s in self.evokedspikes])<=2 and max([s.time-self.cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])<0.125:
             self.pattern=p="single" ## strange that doublet spiking are indeed considered as single spiking
-        elif len([s for s in self.evokedspikes])>=5 and min([s.time-cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])>0.1:
+        elif len([s for s in self.evokedspikes])>=5 and min([s.time-self.cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])>0.1:
             self.pattern=="delayed"## 
-        elif len([s for s in self.evokedspikes])>=3 and max([s.time-cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])<1.0:
+        elif len([s for s in self.evokedspikes])>=3 and max([s.time-self.cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])<1.0:
             self.pattern="transient"
-        elif len([s for s in self.evokedspikes])>=3 and min([s.time-cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])>0.095 and freq(self.evokedspikes[:8])<8.0:
+        elif len([s for s in self.evokedspikes])>=3 and min([s.time-self.cfg.IV_CURRENT_INJECTION_START for s in self.evokedspikes])>0.095 and freq(self.evokedspikes[:8])<8.0:
             self.pattern="gap"
         elif len([s for s in self.evokedspikes])>=3 and sem(self.evokedspikes[:4])>2:
             self.pattern="tonic_irregular"
@@ -1127,7 +1175,7 @@ class ivframe(BaseFrame):
             self.pattern="tonic"
 
     def process_sfa(self):
-        if len(self.evokedspikes)<cfg.IV_MIN_SPIKES_FOR_SFADAPT:
+        if len(self.evokedspikes)<self.cfg.IV_MIN_SPIKES_FOR_SFADAPT:
             self.sfa_freq_lin=None
             self.sfa_freq_log=None
             self.sfa_freq_div=None
@@ -1155,6 +1203,7 @@ class ivframe(BaseFrame):
         self._get_cursor(1).setpos(self.fitstop)
 
     def charts(self,*args,**kwargs):
+        import matplotlib.pyplot as plt
         fig,ax=plt.subplots(2,3)
         a00,a01,a02,a10,a11,a12=ax[0][0],ax[0][1],ax[0][2],ax[1][0],ax[1][1],ax[1][2]
         a00.plot(self.spikes[0].PPV,self.spikes[0].PPdV)
@@ -1163,7 +1212,7 @@ class ivframe(BaseFrame):
         a00.plot(np.mean(np.array([s.PPV for s in self.spikes]),axis=0),
                 np.mean(np.array([s.PPdV for s in self.spikes]),axis=0) )
         a00.set(xlabel='Voltage (V)',ylabel='dV (V)',title='Phase plane')
-        if len(self.evokedspikes)>=cfg.IV_MIN_SPIKES_FOR_SFADAPT:
+        if len(self.evokedspikes)>=self.cfg.IV_MIN_SPIKES_FOR_SFADAPT:
             y=[s.ISI for s in self.evokedspikes[1:] ]
             x=list(range(len(y)))
             a01.plot(x, y,"o")
@@ -1184,33 +1233,54 @@ class ivframe(BaseFrame):
 
     @once
     def setup(self):
+        from mpl_toolbutton import TriggerBtn
         self._fig().subplots(2, 1, gridspec_kw={'height_ratios': [3, 1],"top":0.9},sharex = True)
         testbtn=TriggerBtn(self._fig(),"charts",'alt+c',str(Path(__file__).parent/'resources/fa-linechart-solid.png'),'Chart graphics',
                     lambda *args,**kwargs:self.parent.currentframe().charts(*args,**kwargs))
         self._cursor(self._axes(),'v',self.fitstart,
                     lambda x:self.parent.currentframe().__setattr__('fitstart',x) or \
                         self.parent.process(ivframe.bitmask_TC) or \
-                        self.parent.draw (False)
-                    )
+                        self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewfit(x,self.parent.currentframe().fitstop))
         self._cursor(self._axes(),'v',self.fitstop,
                     lambda x:self.parent.currentframe().__setattr__('fitstop',x) or \
                         self.parent.process(ivframe.bitmask_TC) or \
-                        self.parent.draw (False)
-                    )
-        self._cursor(self._axes(0),'h',cfg.IV_SPIKE_MIN_PEAK,
-                    lambda x:cfg.set('IV_SPIKE_MIN_PEAK',x) or \
-                        cfg.set('IV_SPIKE_MIN_AMP',x-self.parent.cursors[3].getpos()) or
+                        self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewfit(self.parent.currentframe().fitstart,x))
+        self._cursor(self._axes(0),'h',self.cfg.IV_SPIKE_MIN_PEAK,
+                    lambda x:self.parent.setcfg(IV_SPIKE_MIN_PEAK=x) or \
+                        self.parent.setcfg(IV_SPIKE_MIN_AMP=x-self.parent.cursors[3].getpos()) or
                         self.parent.process(ivframe.bitmask_SPIKES) or \
-                        self.parent.draw (False)
-                    )
-        self._cursor(self._axes(0),'h',cfg.IV_SPIKE_MIN_PEAK-cfg.IV_SPIKE_MIN_AMP,
-                    lambda x:cfg.set('IV_SPIKE_MIN_AMP',cfg.IV_SPIKE_MIN_PEAK-x) or \
+                        self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewpeaks(x,x-self.parent.cursors[3].getpos()))
+        self._cursor(self._axes(0),'h',self.cfg.IV_SPIKE_MIN_PEAK-self.cfg.IV_SPIKE_MIN_AMP,
+                    lambda x:self.parent.setcfg(IV_SPIKE_MIN_AMP=self.cfg.IV_SPIKE_MIN_PEAK-x) or \
                         self.parent.process(ivframe.bitmask_SPIKES) or \
-                        self.parent.draw (False)
-                    )
-        self._cursor(self._axes(1),'h',cfg.IV_SPIKE_DV_THRESHOLD,
-                    lambda x:cfg.set('IV_SPIKE_DV_THRESHOLD',x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False)
-                    )
+                        self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewpeaks(self.cfg.IV_SPIKE_MIN_PEAK,self.cfg.IV_SPIKE_MIN_PEAK-x))
+        self._cursor(self._axes(1),'h',self.cfg.IV_SPIKE_DV_THRESHOLD,
+                    lambda x:self.parent.setcfg(IV_SPIKE_DV_THRESHOLD=x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False),
+                    preview=lambda x:self.parent.currentframe().previewthreshold(x))
+
+    ## live previews of the cursors. only the stage of the analysis that the cursor controls is redone, on the current frame.
+    ## the complete analysis runs on release
+    def previewfit(self,start,stop):
+        self._previewwindow(self._axes(0),self.voltage,start,stop,['fit'])
+
+    def previewpeaks(self,height,prominence):
+        sr,_,_,distance,pre,post,_,_,_=_spikeargs(self.cfg,self.voltage)
+        peak_pos=findpeaks(self.voltage.V(),sr,height,prominence,distance,pre,post)
+        self._preview(self._axes(0),'previewpeak',self.voltage.s()[peak_pos],self.voltage.V()[peak_pos],
+                      ['peak','maxriseV','threshold','hwstart','hwstop','ahp'],'x',color='red')
+
+    def previewthreshold(self,dvthreshold):
+        ## thresholds of the spikes already detected
+        times=self.voltage.s()
+        volts=self.voltage.V()
+        sr,_,_,_,pre,post,_,lowest,smooth=_spikeargs(self.cfg,self.voltage)
+        table,_,_=spiketable(volts,times,sr,[s.pos for s in self.spikes],pre,post,dvthreshold,lowest,smooth,self._derivatives(self.voltage,smooth))
+        pos=table['thresholdpos'][table['complete']].astype(np.int64)
+        self._preview(self._axes(0),'previewthreshold',times[pos],volts[pos],['threshold','hwstart','hwstop'],"+",color='red')
 
     def draw(self,drawall=True):
         self.setup() ## ensure that axes are ready!
@@ -1218,107 +1288,47 @@ class ivframe(BaseFrame):
         title=''
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            aa=len(self.voltage)<200e3
-            self._axes(0).plot(self.voltage.s(), self.voltage.V(),color='blue', gid='traces',aa=aa, linewidth=1)
-            self._axes(1).plot(self.voltage.s(),np.gradient(self.voltage.V()), color='green',gid='traces',aa=aa,linewidth=1)
-            self._axes(1).plot(self.voltage.s(),np.gradient(np.gradient(self.voltage.V())), color='orange',gid='traces',aa=aa,linewidth=1)
+            self._trace(self._axes(0),self.voltage.s(), self.voltage.V(),color='blue', gid='traces', linewidth=1)
+            dv,d2v=self._derivatives(self.voltage,self.cfg.IV_SPIKE_DV_SMOOTHING)
+            self._trace(self._axes(1),self.voltage.s(),dv, color='green',gid='traces',linewidth=1)
+            self._trace(self._axes(1),self.voltage.s(),d2v, color='orange',gid='traces',linewidth=1)
             _autoscale(self._axes(0),self.voltage.s(),self.voltage.V())
-        self._clf(['markers'])
-        self._axes(0).axhline(self.baseline,color="grey",linestyle ="--",gid='markers')
+        self._hmarker(self._axes(0),'baseline',self.baseline,color="grey",linestyle ="--")
         if self.current<0: ## for negative current, plot sagss and sagpeak
             title+=f'sagratio: {self.sagratio:.2f} '
-            self._axes(0).axhline(self.sagss,color="blue",linestyle ="--",gid='markers')
-            self._axes(0).axhline(self.sagpeak,color="orange",linestyle ="--",gid='markers')
-        if self.fitter and self.fitter.success and self.current<=cfg.IV_TCFIT_THRESHOLD: ##plot fitter if fitting was successful  (or if fitter esists)
+            self._hmarker(self._axes(0),'sagss',self.sagss,color="blue",linestyle ="--")
+            self._hmarker(self._axes(0),'sagpeak',self.sagpeak,color="orange",linestyle ="--")
+        if self.fitter and self.fitter.success and self.current<=self.cfg.IV_TCFIT_THRESHOLD: ##plot fitter if fitting was successful  (or if fitter esists)
             title+=f'TC: {_pprint(self.fitter.tc,pq.s)} '
-            self._axes(0).plot( self.fitline[0], self.fitline[1],color='red',gid='markers')
+            self._marker(self._axes(0),'fit',self.fitline[0], self.fitline[1],color='red')
         ## plot spike keypoints
-        self._axes(0).plot(self.meta['peak']['x'],self.meta['peak']['y'],"x",color="red",gid="markers")
-        self._axes(0).plot(self.meta['maxriseV']['x'],self.meta['maxriseV']['y'],"o",color="orange",gid="markers")
-        self._axes(0).plot(self.meta['threshold']['x'],self.meta['threshold']['y'],"+",color="red",gid="markers")
-        self._axes(0).plot(self.meta['hwstart']['x'],self.meta['hwstart']['y'],"3",color="red",gid="markers")
-        self._axes(0).plot(self.meta['hwstop']['x'],self.meta['hwstop']['y'],"4",color="red",gid="markers")
-        self._axes(0).plot(self.meta['ahp']['x'],self.meta['ahp']['y'],"+",color="purple",gid="markers")
-        self._axes(0).set_title(title)
-        ## beta feature. Not a major improvement, even with  numba and custom caching + generates errors
-        ## nb np_cache is incredibly slow
-        #_axes(0).callbacks.connect('xlim_changed', self.fastplt)
+        self._marker(self._axes(0),'peak',self.meta['peak']['x'],self.meta['peak']['y'],"x",color="red")
+        self._marker(self._axes(0),'maxriseV',self.meta['maxriseV']['x'],self.meta['maxriseV']['y'],"o",color="orange")
+        self._marker(self._axes(0),'threshold',self.meta['threshold']['x'],self.meta['threshold']['y'],"+",color="red")
+        self._marker(self._axes(0),'hwstart',self.meta['hwstart']['x'],self.meta['hwstart']['y'],"3",color="red")
+        self._marker(self._axes(0),'hwstop',self.meta['hwstop']['x'],self.meta['hwstop']['y'],"4",color="red")
+        self._marker(self._axes(0),'ahp',self.meta['ahp']['x'],self.meta['ahp']['y'],"+",color="purple")
+        self._title(self._axes(0),title)
 
-'''
-    def fastplt(self,*ax):
-        ##fastplt should round to nearest sec, and resample only if signal has changed
-        xlo,xhi=self._axes(0).get_xlim()
-        ## clamp xlo and xhi
-        xlo=_clamp(int(xlo*self.voltage.sampling_rate),0, len(self.voltage))
-        xhi=_clamp(int(xhi*self.voltage.sampling_rate),0, len(self.voltage))
-        sig=self.voltage[xlo:xhi]
-        x,y=min_max_downsample_v4(sig.V(),sig.s(),4*2500)
-        self._axes(0).lines[0].set_data(x,y)
-        self._axes(1).lines[0].set_data(x,np.gradient(y))
-        self._axes(1).lines[1].set_data(x,np.gradient(np.gradient(y)))
-
-    def fastpltcache(self,*ax):
-        ##alternative version
-        if not hasattr(self,'mipmaps'):
-            self.mipmaps={len(self.voltage):(self.voltage.V(),self.voltage.s())}
-        xlo,xhi=self._axes(0).get_xlim()
-        npoints=(xhi-xlo)*int(self.voltage.sampling_rate)
-        rf=npoints//1680 ## assume 1680 width screen. should get real ex pixel span)
-        from math import ceil, log
-        ## the trick here is to use discrete resampling levels, so they can be cached by numpy
-        rf=10**(ceil(log(rf,10)))
-        npts= len(self.voltage)//rf
-        ## clamp xlo and xhi
-        xlo=_clamp(int(xlo*self.voltage.sampling_rate),0, len(self.voltage))
-        xhi=_clamp(int(xhi*self.voltage.sampling_rate),0, len(self.voltage))
-        npts=_clamp(npts,1,len(self.voltage))
-        try:
-            print(f"Using saved mipmaps for level {npts}")
-            x,y=self.mipmaps[npts]
-        except:
-            print(f"Computing mipmaps for level {npts}")
-            x,y=min_max_downsample_v4(self.voltage.V(),self.voltage.s(),npts)
-            self.mipmaps[npts]=(x,y)
-        self._axes(0).lines[0].set_data(x,y)
-        #_axes(1).lines[0].set_data(x,np.gradient(y))
-        #_axes(1).lines[1].set_data(x,np.gradient(np.gradient(y)))
-        
-from numba import jit, prange
-@jit(parallel=True)
-def min_max_downsample_v4(x,y, num_bins):
-        pts_per_bin = x.size // num_bins
-        x_view = x[:pts_per_bin*num_bins].reshape(num_bins, pts_per_bin)
-        y_view = y[:pts_per_bin*num_bins].reshape(num_bins, pts_per_bin)    
-        i_min = np.zeros(num_bins,dtype='int64')
-        i_max = np.zeros(num_bins,dtype='int64')
-
-        for r in prange(num_bins):
-            min_val = y_view[r,0]
-            max_val = y_view[r,0]
-            for c in range(pts_per_bin):
-                if y_view[r,c] < min_val:
-                    min_val = y_view[r,c]
-                    i_min[r] = c
-                elif y_view[r,c] > max_val:
-                    max_val = y_view[r,c]
-                    i_max[r] = c                
-        r_index = np.repeat(np.arange(num_bins), 2)
-        c_index = np.sort(np.stack((i_min, i_max), axis=1)).ravel()        
-        return x_view[r_index, c_index], y_view[r_index, c_index]
-'''
 class ivprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive):
+    def __init__(self,sigs,interactive,context=None):
+        self.cfg=_context(context)
+        self.stats=SweepStats.fromsignals(sigs)
+        _precompute(self,sigs,[self.cfg.IV_CURRENT_STEPS[e] for e in range(len(sigs))])
         self.frames=[ivframe(s,idx=e,parent=self) for e,s in enumerate(sigs) ]
         super(ivprotocol,self).__init__(interactive)
+    def precompute(self):
+        _precompute(self,[f.voltage for f in self.frames],[f.current for f in self.frames])
     def provides(self):
+        ctx=getattr(self,'cfg',cfg)   ## provides(None) describes the global cfg
         r={'IV_baseline':'average baseline (all frames).',
                 'IV_resistance':'average resistance (frames with sag_ratio>0.95).',
                 'IV_resistance_interp':'interpolated resistance (calculated from fit).',
                 'IV_tc':'average time constant (frames with injected current<IV_TCFIT_THRESHOLD).',
-                f'IV_sagratio_I={cfg.IV_SAG_TARGET_CURRENT}pA':'sag ratio (base-ss)/(base-peak) for IV_SAGRATIO_TGT_CURRENT amplitude.',
-                f'IV_sagratio_I={cfg.IV_SAG_TARGET_CURRENT}pA_pct':'(ss-peak)/(base-ss)*100 for for IV_SAGRATIO_TGT_CURRENT amplitude.',
-                f'IV_sagratio_tgt={cfg.IV_SAG_SS_TARGET_VOLTAGE}V':'sag ratio (base-ss)/(base-peak) for frame with baseline-steadystate closest to IV_SAGRATIO_TGT_VOLTAGE.',
-                f'IV_sagratio_tgt={cfg.IV_SAG_SS_TARGET_VOLTAGE}V_pct':'(ss-peak)/(base-ss)*100 for frame with baseline-steadystate closest to IV_SAGRATIO_TGT_VOLTAGE.',
+                f'IV_sagratio_I={ctx.IV_SAG_TARGET_CURRENT}pA':'sag ratio (base-ss)/(base-peak) for IV_SAGRATIO_TGT_CURRENT amplitude.',
+                f'IV_sagratio_I={ctx.IV_SAG_TARGET_CURRENT}pA_pct':'(ss-peak)/(base-ss)*100 for for IV_SAGRATIO_TGT_CURRENT amplitude.',
+                f'IV_sagratio_tgt={ctx.IV_SAG_SS_TARGET_VOLTAGE}V':'sag ratio (base-ss)/(base-peak) for frame with baseline-steadystate closest to IV_SAGRATIO_TGT_VOLTAGE.',
+                f'IV_sagratio_tgt={ctx.IV_SAG_SS_TARGET_VOLTAGE}V_pct':'(ss-peak)/(base-ss)*100 for frame with baseline-steadystate closest to IV_SAGRATIO_TGT_VOLTAGE.',
                 'IV_rheobase':'current required to observe a spike between cfg.IV_CURRENT_INJECTION_START and cfg.IV_CURRENT_INJECTION_STOP.',
                 'IV_avg_spike_threshold':'spike threshold. average computed on first frame with more than cfg.IV_MIN_SPIKES_FOR_MEASURE spikes.',
                 'IV_avg_spike_peak':'spike peak. averagecomputed on first frame with more than cfg.IV_MIN_SPIKES_FOR_MEASURE spikes.',
@@ -1358,61 +1368,61 @@ class ivprotocol(BaseProtocol):
                 'IV_firing_pattern':'spike firing pattern. buggy and meaningless',
                 'IV_fano':'fano factor. computed on frames with the more spikes',
                 }
-        for c in cfg.IV_CURRENT_STEPS:
+        for c in self.cfg.IV_CURRENT_STEPS:
             r.update({f'IV_evoked_spikes_({c})pA':f'number of evoked spikes for {c}pA injected current.'})
-        for c in cfg.IV_CURRENT_STEPS:
+        for c in self.cfg.IV_CURRENT_STEPS:
             r.update({f'IV_rebound_spikes_({c})pA':f'number of rebound spikes for {c}pA injected current.'})
         return r
 
     def results(self):
         self.r={}
-        self.r['IV_baseline']                                        =np.nanmean([f.baseline for f in self.frames if f.enabled ]) / cfg.OUTPUT_V_SCALE
-        self.r['IV_resistance']                                      =np.nanmean([f.resistance for f in self.frames if f.current<0 and f.sagratio>0.90 and f.enabled]) / cfg.OUTPUT_OHM_SCALE
-        self.r['IV_resistance_interp']=np.nanmean([f.resistance_interp for f in self.frames if f.current<0 and f.enabled]) / cfg.OUTPUT_OHM_SCALE
-        self.r['IV_tc']=np.nanmean([f.fitter.tc for f in self.frames if f.current<cfg.IV_TCFIT_THRESHOLD and f.enabled]) / cfg.OUTPUT_S_SCALE
-        self.r[f'IV_sagratio_I={cfg.IV_SAG_TARGET_CURRENT}pA']           =np.nanmean([f.sagratio for f in self.frames if f.current==cfg.IV_SAG_TARGET_CURRENT and f.enabled])
-        self.r[f'IV_sagratio_I={cfg.IV_SAG_TARGET_CURRENT}pA_pct']       =np.nanmean([f.sagratio_pct for f in self.frames if f.current==cfg.IV_SAG_TARGET_CURRENT and f.enabled])
-        frames_for_sag=sorted([f for f in self.frames if f.enabled],key=lambda f:np.fabs((f.baseline-f.sagss)-cfg.IV_SAG_SS_TARGET_VOLTAGE))
-        self.r[f'IV_sagratio_tgt={cfg.IV_SAG_SS_TARGET_VOLTAGE}V']       =frames_for_sag[0].sagratio
-        self.r[f'IV_sagratio_tgt={cfg.IV_SAG_SS_TARGET_VOLTAGE}V_pct']   =frames_for_sag[0].sagratio_pct
+        self.r['IV_baseline']                                        =np.nanmean([f.baseline for f in self.frames if f.enabled ]) / self.cfg.OUTPUT_V_SCALE
+        self.r['IV_resistance']                                      =np.nanmean([f.resistance for f in self.frames if f.current<0 and f.sagratio>0.90 and f.enabled]) / self.cfg.OUTPUT_OHM_SCALE
+        self.r['IV_resistance_interp']=np.nanmean([f.resistance_interp for f in self.frames if f.current<0 and f.enabled]) / self.cfg.OUTPUT_OHM_SCALE
+        self.r['IV_tc']=np.nanmean([f.fitter.tc for f in self.frames if f.current<self.cfg.IV_TCFIT_THRESHOLD and f.enabled]) / self.cfg.OUTPUT_S_SCALE
+        self.r[f'IV_sagratio_I={self.cfg.IV_SAG_TARGET_CURRENT}pA']           =np.nanmean([f.sagratio for f in self.frames if f.current==self.cfg.IV_SAG_TARGET_CURRENT and f.enabled])
+        self.r[f'IV_sagratio_I={self.cfg.IV_SAG_TARGET_CURRENT}pA_pct']       =np.nanmean([f.sagratio_pct for f in self.frames if f.current==self.cfg.IV_SAG_TARGET_CURRENT and f.enabled])
+        frames_for_sag=sorted([f for f in self.frames if f.enabled],key=lambda f:np.fabs((f.baseline-f.sagss)-self.cfg.IV_SAG_SS_TARGET_VOLTAGE))
+        self.r[f'IV_sagratio_tgt={self.cfg.IV_SAG_SS_TARGET_VOLTAGE}V']       =frames_for_sag[0].sagratio
+        self.r[f'IV_sagratio_tgt={self.cfg.IV_SAG_SS_TARGET_VOLTAGE}V_pct']   =frames_for_sag[0].sagratio_pct
         frames_with_evoked_spikes=[f for f in self.frames if f.current>=0 and len(f.evokedspikes)>0 and f.enabled]
         if len(frames_with_evoked_spikes)>0:
-            self.r[f'IV_rheobase']=frames_with_evoked_spikes[0].current/1.0e12 / cfg.OUTPUT_A_SCALE
+            self.r[f'IV_rheobase']=frames_with_evoked_spikes[0].current/1.0e12 / self.cfg.OUTPUT_A_SCALE
         ##
-        frames_with_min_spikes=[f for f in self.frames if len(f.evokedspikes)>=cfg.IV_MIN_SPIKES_FOR_MEASURE and f.enabled]
+        frames_with_min_spikes=[f for f in self.frames if len(f.evokedspikes)>=self.cfg.IV_MIN_SPIKES_FOR_MEASURE and f.enabled]
         if len(frames_with_min_spikes)>0:
             reference_frame=frames_with_min_spikes[0]
-            self.r['IV_avg_spike_threshold']                 =np.nanmean([s.threshold for s in reference_frame.evokedspikes]) / cfg.OUTPUT_V_SCALE
-            self.r['IV_avg_spike_peak']                      =np.nanmean([s.peak for s in reference_frame.evokedspikes]) / cfg.OUTPUT_V_SCALE
-            self.r['IV_avg_spike_amplitude']                 =np.nanmean([s.amplitude for s in reference_frame.evokedspikes]) / cfg.OUTPUT_V_SCALE
-            self.r['IV_avg_spike_half_width']                =np.nanmean([s.halfwidth for s in reference_frame.evokedspikes]) / cfg.OUTPUT_S_SCALE
-            self.r['IV_avg_spike_max_rise_slope']            =np.nanmean([s.maxrise for s in reference_frame.evokedspikes]) / cfg.OUTPUT_S_SCALE
-            self.r['IV_avg_spike_max_fall_slope']            =np.nanmean([s.maxfall for s in reference_frame.evokedspikes]) / cfg.OUTPUT_S_SCALE
-            self.r['IV_avg_spike_ahp']                       =np.nanmean([reference_frame.ahpbaseline-s.ahp for s in reference_frame.evokedspikes if s.complete ]) / cfg.OUTPUT_V_SCALE
-            self.r['IV_avg_spike_thr2ahp']                   =np.nanmean([s.threshold-s.ahp for s in reference_frame.evokedspikes if s.complete ]) / cfg.OUTPUT_V_SCALE
+            self.r['IV_avg_spike_threshold']                 =np.nanmean([s.threshold for s in reference_frame.evokedspikes]) / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_avg_spike_peak']                      =np.nanmean([s.peak for s in reference_frame.evokedspikes]) / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_avg_spike_amplitude']                 =np.nanmean([s.amplitude for s in reference_frame.evokedspikes]) / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_avg_spike_half_width']                =np.nanmean([s.halfwidth for s in reference_frame.evokedspikes]) / self.cfg.OUTPUT_S_SCALE
+            self.r['IV_avg_spike_max_rise_slope']            =np.nanmean([s.maxrise for s in reference_frame.evokedspikes]) / self.cfg.OUTPUT_S_SCALE
+            self.r['IV_avg_spike_max_fall_slope']            =np.nanmean([s.maxfall for s in reference_frame.evokedspikes]) / self.cfg.OUTPUT_S_SCALE
+            self.r['IV_avg_spike_ahp']                       =np.nanmean([reference_frame.ahpbaseline-s.ahp for s in reference_frame.evokedspikes if s.complete ]) / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_avg_spike_thr2ahp']                   =np.nanmean([s.threshold-s.ahp for s in reference_frame.evokedspikes if s.complete ]) / self.cfg.OUTPUT_V_SCALE
             #same with first spike instead of average
-            self.r['IV_first_spike_threshold']                 =reference_frame.evokedspikes[0].threshold / cfg.OUTPUT_V_SCALE
-            self.r['IV_first_spike_peak']                      =reference_frame.evokedspikes[0].peak / cfg.OUTPUT_V_SCALE
-            self.r['IV_first_spike_amplitude']                 =reference_frame.evokedspikes[0].amplitude / cfg.OUTPUT_V_SCALE
-            self.r['IV_first_spike_half_width']                =reference_frame.evokedspikes[0].halfwidth / cfg.OUTPUT_S_SCALE
-            self.r['IV_first_spike_max_rise_slope']            =reference_frame.evokedspikes[0].maxrise / cfg.OUTPUT_S_SCALE
-            self.r['IV_first_spike_max_fall_slope']            =reference_frame.evokedspikes[0].maxfall / cfg.OUTPUT_S_SCALE
+            self.r['IV_first_spike_threshold']                 =reference_frame.evokedspikes[0].threshold / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_first_spike_peak']                      =reference_frame.evokedspikes[0].peak / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_first_spike_amplitude']                 =reference_frame.evokedspikes[0].amplitude / self.cfg.OUTPUT_V_SCALE
+            self.r['IV_first_spike_half_width']                =reference_frame.evokedspikes[0].halfwidth / self.cfg.OUTPUT_S_SCALE
+            self.r['IV_first_spike_max_rise_slope']            =reference_frame.evokedspikes[0].maxrise / self.cfg.OUTPUT_S_SCALE
+            self.r['IV_first_spike_max_fall_slope']            =reference_frame.evokedspikes[0].maxfall / self.cfg.OUTPUT_S_SCALE
             if reference_frame.evokedspikes[0].complete:
-                self.r['IV_first_spike_ahp']                   =(reference_frame.ahpbaseline-reference_frame.evokedspikes[0].ahp) / cfg.OUTPUT_V_SCALE
-                self.r['IV_first_spike_thr2ahp']               =(reference_frame.evokedspikes[0].threshold-reference_frame.evokedspikes[0].ahp) / cfg.OUTPUT_V_SCALE
+                self.r['IV_first_spike_ahp']                   =(reference_frame.ahpbaseline-reference_frame.evokedspikes[0].ahp) / self.cfg.OUTPUT_V_SCALE
+                self.r['IV_first_spike_thr2ahp']               =(reference_frame.evokedspikes[0].threshold-reference_frame.evokedspikes[0].ahp) / self.cfg.OUTPUT_V_SCALE
             else:
                 self.r['IV_first_spike_ahp']                   =np.nan
                 self.r['IV_first_spike_thr2ahp']               =np.nan
             ##
-            self.r['IV_first_spike_delay']                   =(reference_frame.evokedspikes[0].time-cfg.IV_CURRENT_INJECTION_START) / cfg.OUTPUT_S_SCALE
+            self.r['IV_first_spike_delay']                   =(reference_frame.evokedspikes[0].time-self.cfg.IV_CURRENT_INJECTION_START) / self.cfg.OUTPUT_S_SCALE
         ## in order to compute ISI, we need at least 3 spikes!
-        frames_with_min_spikes=[f for f in self.frames if len(f.evokedspikes)>=max(3,cfg.IV_MIN_SPIKES_FOR_MEASURE) and f.enabled]
+        frames_with_min_spikes=[f for f in self.frames if len(f.evokedspikes)>=max(3,self.cfg.IV_MIN_SPIKES_FOR_MEASURE) and f.enabled]
         if len(frames_with_min_spikes)>0:
             reference_frame=frames_with_min_spikes[0]
-            self.r['IV_first_spike_interval']                =reference_frame.evokedspikes[1].ISI / cfg.OUTPUT_S_SCALE
-            self.r['IV_last_spike_interval']                 =reference_frame.evokedspikes[-1].ISI / cfg.OUTPUT_S_SCALE
+            self.r['IV_first_spike_interval']                =reference_frame.evokedspikes[1].ISI / self.cfg.OUTPUT_S_SCALE
+            self.r['IV_last_spike_interval']                 =reference_frame.evokedspikes[-1].ISI / self.cfg.OUTPUT_S_SCALE
             self.r['IV_first_div_last_spike_interval']       =self.r['IV_first_spike_interval']/self.r['IV_last_spike_interval']
-        frames_with_max_spikes=sorted([f for f in self.frames if len(f.evokedspikes)>cfg.IV_MIN_SPIKES_FOR_SFADAPT and f.enabled],key=lambda f:len(f.evokedspikes))
+        frames_with_max_spikes=sorted([f for f in self.frames if len(f.evokedspikes)>self.cfg.IV_MIN_SPIKES_FOR_SFADAPT and f.enabled],key=lambda f:len(f.evokedspikes))
         if len(frames_with_max_spikes)>0:
             self.r['IV_sfa_freq_lin']                        =frames_with_max_spikes[-1].sfa_freq_lin
             self.r['IV_sfa_freq_log']                        =frames_with_max_spikes[-1].sfa_freq_log
@@ -1426,11 +1436,11 @@ class ivprotocol(BaseProtocol):
             #self.r['IV_third_spike_threshold']               =fr[0].evokedspikes[2].threshold / cfg.OUTPUT_V_SCALE
             #self.r['IV_third_spike_peak']                    =fr[0].evokedspikes[2].peak / cfg.OUTPUT_V_SCALE
             #self.r['IV_third_spike_amplitude']               =fr[0].evokedspikes[2].amplitude / cfg.OUTPUT_V_SCALE
-            self.r['IV_third_spike_half_width']              =fr[0].evokedspikes[2].halfwidth / cfg.OUTPUT_S_SCALE
+            self.r['IV_third_spike_half_width']              =fr[0].evokedspikes[2].halfwidth / self.cfg.OUTPUT_S_SCALE
             #self.r['IV_third_spike_max_rise_slope']          =fr[0].evokedspikes[2].maxrise / cfg.OUTPUT_S_SCALE
             #self.r['IV_third_spike_max_fall_slope']          =fr[0].evokedspikes[2].maxfall / cfg.OUTPUT_S_SCALE
         self.r['IV_max_nb_spikes']                           =np.max([len(f.evokedspikes) for f in self.frames])            
-        self.r['IV_max_freq']                                =self.r['IV_max_nb_spikes'] /(cfg.IV_CURRENT_INJECTION_STOP-cfg.IV_CURRENT_INJECTION_START)
+        self.r['IV_max_freq']                                =self.r['IV_max_nb_spikes'] /(self.cfg.IV_CURRENT_INJECTION_STOP-self.cfg.IV_CURRENT_INJECTION_START)
         for f in self.frames:
             self.r[f'IV_evoked_spikes_({f.current})pA']     =len(f.evokedspikes)
         for f in self.frames:
@@ -1439,7 +1449,7 @@ class ivprotocol(BaseProtocol):
         self.r['IV_firing_pattern']                          =frames_with_max_spikes[-1].pattern
         self.r['IV_fano']                                    =frames_with_max_spikes[-1].fano
         ## custom measurements:
-        extrameasurements={k:v for k,v in cfg.__dict__.items() if not k.isupper() and k.startswith('IV_')}
+        extrameasurements={k:v for k,v in self.cfg.__dict__.items() if not k.isupper() and k.startswith('IV_')}
         for k,v in extrameasurements.items():
             try:
                 self.r[k]=eval(v)
@@ -1449,17 +1459,22 @@ class ivprotocol(BaseProtocol):
         return self.r
 
 class rheobaseprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive):
-        cfg.IV_CURRENT_INJECTION_START=cfg.RHEO_CURRENT_INJECTION_START
-        cfg.IV_CURRENT_INJECTION_STOP=cfg.RHEO_CURRENT_INJECTION_STOP+0.05 ## a spike may occur short after end of pulse
-        cfg.IV_BASELINE_START=cfg.RHEO_BASELINE_START
-        cfg.IV_BASELINE_STOP=cfg.RHEO_BASELINE_STOP
+    def __init__(self,sigs,interactive,context=None):
+        ctx=_context(context)
+        self.cfg=ctx.derive(IV_CURRENT_INJECTION_START=ctx.RHEO_CURRENT_INJECTION_START,
+                            IV_CURRENT_INJECTION_STOP=ctx.RHEO_CURRENT_INJECTION_STOP+0.05, ## a spike may occur short after end of pulse
+                            IV_BASELINE_START=ctx.RHEO_BASELINE_START,
+                            IV_BASELINE_STOP=ctx.RHEO_BASELINE_STOP)
+        self.stats=SweepStats.fromsignals(sigs)
+        _precompute(self,sigs,[5*e for e in range(len(sigs))])
         self.frames=[ivframe(s,idx=e,parent=self, current=5*e) for e,s in enumerate(sigs) ]
         ## get the first frame with at least one spike
         self.BaseFrame=[f for f in self.frames if len(f.evokedspikes)==0][-1].voltage
         ## rebuild list of frames
         # self.frames=[ivframe(s-self.BaseFrame,idx=e,parent=self, current=5*e) for e,s in enumerate(sigs) ]
         super(rheobaseprotocol,self).__init__(interactive)
+    def precompute(self):
+        _precompute(self,[f.voltage for f in self.frames],[f.current for f in self.frames])
 
     def provides(self):
         r={"RHEO_baseline":"average baseline (all frames)",
@@ -1476,42 +1491,48 @@ class rheobaseprotocol(BaseProtocol):
 
     def results(self):
         self.r={}
-        self.r['RHEO_baseline']                                        =np.nanmean([f.baseline for f in self.frames if f.enabled ]) / cfg.OUTPUT_V_SCALE
+        self.r['RHEO_baseline']                                        =np.nanmean([f.baseline for f in self.frames if f.enabled ]) / self.cfg.OUTPUT_V_SCALE
         frames_with_evoked_spikes=[f for f in self.frames if f.current>=0 and len(f.evokedspikes)>0 and f.enabled]
         if len(frames_with_evoked_spikes)>0:
-            self.r[f'RHEO_rheobase']=frames_with_evoked_spikes[0].current/1.0e12 / cfg.OUTPUT_A_SCALE
+            self.r[f'RHEO_rheobase']=frames_with_evoked_spikes[0].current/1.0e12 / self.cfg.OUTPUT_A_SCALE
         ##
         frames_with_min_spikes=[f for f in self.frames if len(f.evokedspikes)==1 and f.enabled]
         if len(frames_with_min_spikes)>0:
             reference_frame=frames_with_min_spikes[0]
-            self.r['RHEO_spike_threshold']                 =reference_frame.evokedspikes[0].threshold / cfg.OUTPUT_V_SCALE
-            self.r['RHEO_spike_peak']                      =reference_frame.evokedspikes[0].peak  / cfg.OUTPUT_V_SCALE
-            self.r['RHEO_spike_amplitude']                 =reference_frame.evokedspikes[0].amplitude  / cfg.OUTPUT_V_SCALE
-            self.r['RHEO_spike_half_width']                =reference_frame.evokedspikes[0].halfwidth / cfg.OUTPUT_S_SCALE
-            self.r['RHEO_spike_max_rise_slope']            =reference_frame.evokedspikes[0].maxrise  / cfg.OUTPUT_S_SCALE
-            self.r['RHEO_spike_max_fall_slope']            =reference_frame.evokedspikes[0].maxfall  / cfg.OUTPUT_S_SCALE
+            self.r['RHEO_spike_threshold']                 =reference_frame.evokedspikes[0].threshold / self.cfg.OUTPUT_V_SCALE
+            self.r['RHEO_spike_peak']                      =reference_frame.evokedspikes[0].peak  / self.cfg.OUTPUT_V_SCALE
+            self.r['RHEO_spike_amplitude']                 =reference_frame.evokedspikes[0].amplitude  / self.cfg.OUTPUT_V_SCALE
+            self.r['RHEO_spike_half_width']                =reference_frame.evokedspikes[0].halfwidth / self.cfg.OUTPUT_S_SCALE
+            self.r['RHEO_spike_max_rise_slope']            =reference_frame.evokedspikes[0].maxrise  / self.cfg.OUTPUT_S_SCALE
+            self.r['RHEO_spike_max_fall_slope']            =reference_frame.evokedspikes[0].maxfall  / self.cfg.OUTPUT_S_SCALE
             if reference_frame.idx==0:
                 self.r['RHEO_spike_ahp']=np.nan
             else:
                 t0=reference_frame.evokedspikes[0].time-0.005
                 t1=reference_frame.evokedspikes[0].time+0.05
                 sub=self.frames[reference_frame.idx].voltage-self.frames[reference_frame.idx-1].voltage
-                plt.plot(sub.ms(),sub.mV())
-                plt.plot(sub.ms(t0,t1),sub.mV(t0,t1))
-                plt.pause(-1)
-                self.r['RHEO_spike_ahp']=np.min(sub.V(t0,t1))  / cfg.OUTPUT_V_SCALE
+                if self.interactive:
+                    import matplotlib.pyplot as plt
+                    plt.plot(sub.ms(),sub.mV())
+                    plt.plot(sub.ms(t0,t1),sub.mV(t0,t1))
+                    plt.pause(-1)
+                self.r['RHEO_spike_ahp']=np.min(sub.V(t0,t1))  / self.cfg.OUTPUT_V_SCALE
         return self.r
 
 class spontaneousactivityprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive):
+    def __init__(self,sigs,interactive,context=None):
+        self.cfg=_context(context)
         ## awfull hack here:
         ## ivframe calculates baseline for  AHP between cfg.IV_CURRENT_INJECTION_START and cfg.IV_CURRENT_INJECTION_STOP
         ## as we want to take baseline for all trace, we save these values for later restoration, and update the values...
-        ## may not be necessary as params are reparsed before every protocol analysis...
+        ## may not be necessary as params are reparsed before every protocol analysis... (and each protocol now owns its cfg context)
         #oldstart, oldstop= cfg.IV_CURRENT_INJECTION_START, cfg.IV_CURRENT_INJECTION_STOP
-        cfg.IV_CURRENT_INJECTION_START, cfg.IV_CURRENT_INJECTION_STOP=0, sigs[0].times.magnitude.flatten()[-1]
+        self.cfg=self.cfg.derive(IV_CURRENT_INJECTION_START=0,IV_CURRENT_INJECTION_STOP=sigs[0].times.magnitude.flatten()[-1])
+        _precompute(self,sigs,[0]*len(sigs))
         self.frames=[ivframe(s,idx=0,parent=self,current=0) for e,s in enumerate(sigs) ]
         super(spontaneousactivityprotocol,self).__init__(interactive)
+    def precompute(self):
+        _precompute(self,[f.voltage for f in self.frames],[f.current for f in self.frames])
     def provides(self):
         return {'SPON_baseline':'average baseline.',
                 'SPON_frequency':'average frequency.',
@@ -1527,16 +1548,16 @@ class spontaneousactivityprotocol(BaseProtocol):
 
     def results(self):
         self.r={}
-        self.r['SPON_baseline']=self.frames[0].ahpbaseline/cfg.OUTPUT_V_SCALE
-        self.r['SPON_frequency']=len(self.frames[0].spikes)/(cfg.IV_CURRENT_INJECTION_STOP - cfg.IV_CURRENT_INJECTION_START)
+        self.r['SPON_baseline']=self.frames[0].ahpbaseline/self.cfg.OUTPUT_V_SCALE
+        self.r['SPON_frequency']=len(self.frames[0].spikes)/(self.cfg.IV_CURRENT_INJECTION_STOP - self.cfg.IV_CURRENT_INJECTION_START)
         if len(self.frames[0].spikes)>0:
-            self.r['SPON_avg_spike_threshold']=np.nanmean([s.threshold for s in self.frames[0].spikes])/cfg.OUTPUT_OHM_SCALE
-            self.r['SPON_avg_spike_peak']=np.nanmean([s.peak for s in self.frames[0].spikes])/cfg.OUTPUT_V_SCALE
-            self.r['SPON_avg_spike_amplitude']=np.nanmean([s.amplitude for s in self.frames[0].spikes])/cfg.OUTPUT_V_SCALE
-            self.r['SPON_avg_spike_half_width']=np.nanmean([s.halfwidth for s in self.frames[0].spikes])/cfg.OUTPUT_S_SCALE
+            self.r['SPON_avg_spike_threshold']=np.nanmean([s.threshold for s in self.frames[0].spikes])/self.cfg.OUTPUT_OHM_SCALE
+            self.r['SPON_avg_spike_peak']=np.nanmean([s.peak for s in self.frames[0].spikes])/self.cfg.OUTPUT_V_SCALE
+            self.r['SPON_avg_spike_amplitude']=np.nanmean([s.amplitude for s in self.frames[0].spikes])/self.cfg.OUTPUT_V_SCALE
+            self.r['SPON_avg_spike_half_width']=np.nanmean([s.halfwidth for s in self.frames[0].spikes])/self.cfg.OUTPUT_S_SCALE
             self.r['SPON_avg_spike_max_rise_slope']=np.nanmean([s.maxrise for s in self.frames[0].spikes])
             self.r['SPON_avg_spike_max_fall_slope']=np.nanmean([s.maxfall for s in self.frames[0].spikes])
-            self.r['SPON_avg_spike_ahp']=np.nanmean([s.ahp for s in self.frames[0].spikes if s.complete])/cfg.OUTPUT_V_SCALE
+            self.r['SPON_avg_spike_ahp']=np.nanmean([s.ahp for s in self.frames[0].spikes if s.complete])/self.cfg.OUTPUT_V_SCALE
             self.r['SPON_fano']=self.frames[0].fano
         return self.r
 
@@ -1581,7 +1602,7 @@ class resonnanceframe(BaseFrame):
         volts=self.voltage.V()[self.start:self.stop]
         ref=self.current.A()[self.start:self.stop]
         self.amplitude=int(5*np.rint((np.max(ref)-np.min(ref))*1e11)) ## round to nearest integer
-        if not self.amplitude in cfg.RES_AMPLITUDES:
+        if not self.amplitude in self.cfg.RES_AMPLITUDES:
             logging.getLogger(__name__).warning(f"Unexpected current amplitude in resonnance protocol {self.amplitude}")
         self.sig_freq,self.sig_pow=scipy.signal.periodogram(volts,fs=self.voltage._sampling_rate)
         self.ref_freq,self.ref_pow=scipy.signal.periodogram(ref,fs=self.current._sampling_rate)
@@ -1591,7 +1612,7 @@ class resonnanceframe(BaseFrame):
         self.sig_pow*=1e6  ## 1mV**2
 
         self.impedence=self.sig_pow/self.ref_pow
-        self.keep=np.where((self.sig_freq<cfg.RES_HIGH_BAND)&(self.sig_freq>cfg.RES_LOW_BAND))
+        self.keep=np.where((self.sig_freq<self.cfg.RES_HIGH_BAND)&(self.sig_freq>self.cfg.RES_LOW_BAND))
         self.res_pos=np.argmax(self.impedence[self.keep])
         self.res_freq=float(self.ref_freq[self.keep][self.res_pos])
         self.res_imp=float(self.impedence[self.keep][self.res_pos])
@@ -1629,20 +1650,21 @@ class resonnanceframe(BaseFrame):
             self._axes(2).loglog(self.ref_freq[self.keep],self.impedence[self.keep],c='#1f77b4',gid="traces")
             #self._axes(2).set_title("Impedance",fontdict={'fontsize':10})
             _autoscale(self._axes(2),self.ref_freq[self.keep],self.impedence[self.keep])
-            self._axes(3).plot(self.voltage.mV(), color='k',gid="traces")
+            self._trace(self._axes(3),np.arange(len(self.voltage)),self.voltage.mV(), color='k',gid="traces")
             #self._axes(3).set_title("Voltage",fontdict={'fontsize':10})
-        self._clf(['markers'])
-        self._axes(2).loglog([self.res_freq],self.res_imp,'o',color='orange',gid="markers")
-        self._axes(2).loglog([0.5],self.imp05,'x',color='green',gid="markers")
+        self._marker(self._axes(2),'res',[self.res_freq],[self.res_imp],'o',color='orange')
+        self._marker(self._axes(2),'imp05',[0.5],[self.imp05],'x',color='green')
         self._fig().tight_layout()
 
 class resonnanceprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive):
+    def __init__(self,sigs,interactive,context=None):
+        self.cfg=_context(context)
         self.frames=[ resonnanceframe(sigs[0],sigs[1],idx=0,parent=self)  ]
         super(resonnanceprotocol,self).__init__(interactive)
     def provides(self):
         r={}
-        for amp in cfg.RES_AMPLITUDES:
+        ctx=getattr(self,'cfg',cfg)   ## provides(None) describes the global cfg
+        for amp in ctx.RES_AMPLITUDES:
             r.update({f'RES_resonnance_{amp}pA':'resonnance frequency',
                 f'RES_impedance_{amp}pA':'impedence of neurone at resonnance frequency',
                 f'RES_impedance_05Hz_{amp}pA':'impedence of neurone at 0.5Hz'}
@@ -1650,8 +1672,8 @@ class resonnanceprotocol(BaseProtocol):
         return r
     def results(self):
         self.r= {f'RES_resonnance_{self.frames[0].amplitude}pA':float(self.frames[0].res_freq),
-                f'RES_impedance_{self.frames[0].amplitude}pA':1e6*float(self.frames[0].res_imp*1000)/cfg.OUTPUT_OHM_SCALE,
-                f'RES_impedance_05Hz_{self.frames[0].amplitude}pA':1e6*float(self.frames[0].imp05*1000)/cfg.OUTPUT_OHM_SCALE}
+                f'RES_impedance_{self.frames[0].amplitude}pA':1e6*float(self.frames[0].res_imp*1000)/self.cfg.OUTPUT_OHM_SCALE,
+                f'RES_impedance_05Hz_{self.frames[0].amplitude}pA':1e6*float(self.frames[0].imp05*1000)/self.cfg.OUTPUT_OHM_SCALE}
         return self.r
 
 class rampframe(BaseFrame):
@@ -1664,53 +1686,53 @@ class rampframe(BaseFrame):
     def process(self,bitmask=0xFFFF):
         volts=self.voltage.V()
         amps=self.current.A()
-        self.fitter1=XYFitter(self.current.s(cfg.RAMP_BOUNDARIES[0],cfg.RAMP_BOUNDARIES[0]+0.2),
-                              self.current.pA(cfg.RAMP_BOUNDARIES[0],cfg.RAMP_BOUNDARIES[0]+0.2),
+        self.fitter1=XYFitter(self.current.s(self.cfg.RAMP_BOUNDARIES[0],self.cfg.RAMP_BOUNDARIES[0]+0.2),
+                              self.current.pA(self.cfg.RAMP_BOUNDARIES[0],self.cfg.RAMP_BOUNDARIES[0]+0.2),
                               0,True,
-                              maxfev=cfg.ITSQ_FIT_ITERATION_COUNT,
-                              version=cfg.ITSQ_FITTER_VERSION)
-        times1=self.current.s(cfg.RAMP_BOUNDARIES[0],cfg.RAMP_BOUNDARIES[1])
+                              maxfev=self.cfg.ITSQ_FIT_ITERATION_COUNT,
+                              version=self.cfg.ITSQ_FITTER_VERSION)
+        times1=self.current.s(self.cfg.RAMP_BOUNDARIES[0],self.cfg.RAMP_BOUNDARIES[1])
         self.line1=[times1,self.fitter1.line(times1)]
-        self.fitter2=XYFitter(self.current.s(cfg.RAMP_BOUNDARIES[1]-0.2,cfg.RAMP_BOUNDARIES[1]),
-                              self.current.pA(cfg.RAMP_BOUNDARIES[1]-0.2,cfg.RAMP_BOUNDARIES[1]),
+        self.fitter2=XYFitter(self.current.s(self.cfg.RAMP_BOUNDARIES[1]-0.2,self.cfg.RAMP_BOUNDARIES[1]),
+                              self.current.pA(self.cfg.RAMP_BOUNDARIES[1]-0.2,self.cfg.RAMP_BOUNDARIES[1]),
                               0,True,
-                              maxfev=cfg.ITSQ_FIT_ITERATION_COUNT,
-                              version=cfg.ITSQ_FITTER_VERSION)
-        times2=self.current.s(cfg.RAMP_BOUNDARIES[0],cfg.RAMP_BOUNDARIES[1])
+                              maxfev=self.cfg.ITSQ_FIT_ITERATION_COUNT,
+                              version=self.cfg.ITSQ_FITTER_VERSION)
+        times2=self.current.s(self.cfg.RAMP_BOUNDARIES[0],self.cfg.RAMP_BOUNDARIES[1])
         self.line2=[times2,self.fitter2.line(times2)]
 
     @once
     def setup(self):
         self._fig().subplots(2, 1,gridspec_kw={'height_ratios': [3, 1],"top":0.9},sharex = True)
         ## tried with for loop and partial, but does not work!
-        self._cursor(self._axes(),'v',cfg.RAMP_BOUNDARIES[0],
-                lambda x:cfg.RAMP_BOUNDARIES.__setitem__(0,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False)
-                )
-        self._cursor(self._axes(),'v',cfg.RAMP_BOUNDARIES[1],
-                lambda x:cfg.RAMP_BOUNDARIES.__setitem__(1,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False)
-                )
-        self._cursor(self._axes(),'v',cfg.RAMP_BOUNDARIES[2],
-                lambda x:cfg.RAMP_BOUNDARIES.__setitem__(1,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False)
-                )
-        self._cursor(self._axes(),'v',cfg.RAMP_BOUNDARIES[3],
-                lambda x:cfg.RAMP_BOUNDARIES.__setitem__(1,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False)
-                )
+        self._cursor(self._axes(),'v',self.cfg.RAMP_BOUNDARIES[0],
+                lambda x:self.cfg.RAMP_BOUNDARIES.__setitem__(0,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False),
+                preview=True)
+        self._cursor(self._axes(),'v',self.cfg.RAMP_BOUNDARIES[1],
+                lambda x:self.cfg.RAMP_BOUNDARIES.__setitem__(1,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False),
+                preview=True)
+        self._cursor(self._axes(),'v',self.cfg.RAMP_BOUNDARIES[2],
+                lambda x:self.cfg.RAMP_BOUNDARIES.__setitem__(1,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False),
+                preview=True)
+        self._cursor(self._axes(),'v',self.cfg.RAMP_BOUNDARIES[3],
+                lambda x:self.cfg.RAMP_BOUNDARIES.__setitem__(1,x) or self.parent.process(ivframe.bitmask_SPIKES) or self.parent.draw (False),
+                preview=True)
 
     def draw(self,drawall=True):
         self.setup() ## ensure that axes are ready!
         self._fig().canvas.TopLevelParent.SetTitle("Ramp protocol")
         if drawall:  ## avoid redrawing signals if not required
             self._clf(['traces'])
-            self._axes(0).plot(self.current.s(),self.current.pA(),color='blue',gid='traces')
-            self._axes(1).plot(self.voltage.s(),self.voltage.mV(),color='green',gid='traces')
-        self._clf(['markers'])
+            self._trace(self._axes(0),self.current.s(),self.current.pA(),color='blue',gid='traces')
+            self._trace(self._axes(1),self.voltage.s(),self.voltage.mV(),color='green',gid='traces')
         if self.fitter1.success:
-           self._axes(0).plot(*self.line1,color='red',gid='markers')
+           self._marker(self._axes(0),'fit1',*self.line1,color='red')
         if self.fitter2.success:
-           self._axes(0).plot(*self.line2,color='darkred',gid='markers')
+           self._marker(self._axes(0),'fit2',*self.line2,color='darkred')
 
 class rampprotocol(BaseProtocol):
-    def __init__(self,sigs,interactive):
+    def __init__(self,sigs,interactive,context=None):
+        self.cfg=_context(context)
         self.frames=[ rampframe(sig[0],sig[1],idx=0,parent=self) for sig in sigs ]
         super(rampprotocol,self).__init__(interactive)
     def provides(self):
@@ -1740,65 +1762,181 @@ class rampprotocol(BaseProtocol):
 ##################################################################################################
 ##################################################################################################
 
-def HOOK_ADJUST_STEP_HEIGHT():
+def HOOK_ADJUST_STEP_HEIGHT(ctx):
     ## this hook attempts to correct step protocol amplitude
     ## when parsing protocol in axgd / axgx files, we can read the start level and level inc rement,
     ## but the units are unknown (sometimes pA, sometimes nA)
     ## this hook will divide all values by 1000 if values are all higher than 2nA
-    if not cfg.ITSQ_ENABLE_HOOKS:
-        return
-    if all([abs(s)>=2000 for s in cfg.IV_CURRENT_STEPS if s!=0]):
+    ## returns the adjusted cfg context
+    if not ctx.ITSQ_ENABLE_HOOKS:
+        return ctx
+    if all([abs(s)>=2000 for s in ctx.IV_CURRENT_STEPS if s!=0]):
         logging.getLogger(__name__).warning("Attempting to rescale pA to nA in axg* protocol")
-        cfg.IV_CURRENT_STEPS=[s//1000 for s in cfg.IV_CURRENT_STEPS]
-    if all([abs(s)>=2000 for s in cfg.SAG_CURRENT_STEPS if s!=0]):
+        ctx=ctx.derive(IV_CURRENT_STEPS=[s//1000 for s in ctx.IV_CURRENT_STEPS])
+    if all([abs(s)>=2000 for s in ctx.SAG_CURRENT_STEPS if s!=0]):
         logging.getLogger(__name__).warning("Attempting to rescale pA to nA in axg* protocol")
-        cfg.SAG_CURRENT_STEPS=[s//1000 for s in cfg.SAG_CURRENT_STEPS]
-    if abs(cfg.INPUTR_CURRENT_STEP)>1000:
+        ctx=ctx.derive(SAG_CURRENT_STEPS=[s//1000 for s in ctx.SAG_CURRENT_STEPS])
+    if abs(ctx.INPUTR_CURRENT_STEP)>1000:
         logging.getLogger(__name__).warning("Attempting to rescale pA to nA in axg* protocol")
-        cfg.INPUTR_CURRENT_STEP=cfg.INPUTR_CURRENT_STEP//1000
+        ctx=ctx.derive(INPUTR_CURRENT_STEP=ctx.INPUTR_CURRENT_STEP//1000)
     ## same for sag protocol!
-
+    return ctx
+
+
+_batchmode=False                        ## True in batch worker processes. no interactive frame, no nested pool
+_cfgsnapshot=None                       ## cfg state once parameter files are parsed by process(), while it runs. each file starts from a context built on it
+
+def _interactive(flag):
+    '''debug frames are never displayed in batch worker processes'''
+    return flag and not _batchmode
+
+def _batch_init(state):
+    '''initializes a batch worker process once: non interactive backend, monkey patches and parent config'''
+    global _batchmode,_cfgsnapshot
+    _batchmode=True
+    import matplotlib
+    matplotlib.use('agg')
+    neomonkey.installmonkey()
+    _cfgsnapshot=state
+
+## protocol families, in the order they are tested: (key in cfg.PROCESS_PROTOCOLS, cfg list of protocol names, cfg debug frame flag)
+PROTOCOL_DISPATCH=[('iv','IV_PROTOCOL_NAMES','IV_DEBUG_FRAME'),
+                   ('ahpv','AHPV_PROTOCOL_NAMES','AHP_DEBUG_FRAME'),
+                   ('ahp','AHP_PROTOCOL_NAMES','AHP_DEBUG_FRAME'),
+                   ('resonnance','ZAP_PROTOCOL_NAMES','RES_DEBUG_FRAME'),
+                   ('timeconstant','TC_PROTOCOL_NAMES','TC_DEBUG_FRAME'),
+                   ('resistance','INPUTR_PROTOCOL_NAMES','INPUTR_DEBUG_FRAME'),
+                   ('sag','SAG_PROTOCOL_NAMES','SAG_DEBUG_FRAME'),
+                   ('spontaneousactivity','SPONTANEOUS_PROTOCOL_NAMES','SPONTANEOUS_DEBUG_FRAME'),
+                   ('ramp','RAMP_PROTOCOL_NAMES','RAMP_DEBUG_FRAME'),
+                   ('rheobase','RHEO_PROTOCOL_NAMES','RHEO_DEBUG_FRAME')]
+
+def dispatch(protocolname,context=cfg):
+    '''returns the key of the first enabled protocol family matching protocolname, or None'''
+    for key,names,_ in PROTOCOL_DISPATCH:
+        if any([fnmatch.fnmatchcase(protocolname,x) for x in getattr(context,names,[])]) and key in context.PROCESS_PROTOCOLS:
+            return key
+    return None
+
+def _debugframe(kind,context):
+    ## results of files analysed interactively depend on cursors moved by hand: they are never recorded nor reused
+    debug=[flag for key,_,flag in PROTOCOL_DISPATCH if key==kind][0]
+    return _interactive(getattr(context,debug,False))
+
+## parameters that change how files are processed, but not the results
+RESULT_CACHE_IGNORE=['ITSQ_LOG_LEVEL','ITSQ_PANZOOM_WHEEL_ONLY','ITSQ_MPL_BACKEND','ITSQ_OUTPUT_FIELDS_FILE',
+                     'ITSQ_ENABLE_MULTIPROCESSING','ITSQ_FRAME_JOBS','ITSQ_BATCH_JOBS','ITSQ_PROTOCOL_SAVE_DATA',
+                     'ITSQ_LAZY_LOADING','ITSQ_CACHE_SIZE','ITSQ_CACHE_FOLDER','ITSQ_SELECTIVE_RERUN',
+                     'ITSQ_RESULT_CACHE_SIZE','ITSQ_RESULT_CACHE_FOLDER','ITSQ_RESULT_STORE','ITSQ_RESUME',
+                     'ITSQ_BATCH_PREFETCH','ITSQ_MANIFEST_FILE','ITSQ_CURSOR_PREVIEW','ITSQ_CURSOR_PREVIEW_INTERVAL',
+                     'OUTPUT_CSV','OUTPUT_CSVSEP','OUTPUT_JSON','OUTPUT_EXCEL','OUTPUT_CLIPBOARD','OUTPUT_CLIPBOARD_EXCEL','OUTPUT_CLIPBOARD_ROWNAMES']
+
+def _configvalues(context):
+    ## resolved values of all parameters that may change results
+    values={}
+    for k in context.dump():
+        if not k in RESULT_CACHE_IGNORE:
+            try:
+                values[k]=getattr(context,k)
+            except Exception as e:
+                values[k]=f"@error {e!r}"
+    return values
+
+def _resultkey(inpath,protocolname,context):
+    ## key of the result cache: file fingerprint and resolved values of all parameters
+    values=_configvalues(context)
+    values['@protocol']=protocolname
+    return resultcache.key(inpath,values)
+
+def _runkey():
+    ## hash of the configuration of a run: generic parameters, protocol parameter files and analysis code
+    h=hashlib.blake2b(digest_size=16)
+    h.update(f"{resultcache.confighash(_configvalues(cfg))}|{rerun.codeversion()}".encode('utf-8'))
+    params=Path(__file__).resolve().parent/"params"
+    for p in sorted(params.glob("*_params.py")):
+        if p.name!="default_params.py" and p.resolve()!=Path(gen_cfg_file).resolve():
+            h.update(p.name.encode('utf-8'))
+            h.update(p.read_bytes())
+    return h.hexdigest()
+
+def _cellkey(runkey,files):
+    ## hash of the configuration of a run and of the list, size and modification time of the files of a cell
+    h=hashlib.blake2b(digest_size=16)
+    h.update(runkey.encode('utf-8'))
+    for f in files:
+        st=os.stat(f)
+        h.update(f"|{Path(f).resolve()}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8'))
+    return h.hexdigest()
 
 def process_file(inpath):
-    cfg.parse(Path(__file__).resolve().parent/gen_cfg_file) ## gen_cfg_file already contains the params folder!
+    ## each file is analysed with its own cfg context, built from the same config whatever the files previously processed
+    if _cfgsnapshot is None:
+        ctx=cfg.context().parse(Path(__file__).resolve().parent/gen_cfg_file) ## gen_cfg_file already contains the params folder!
+    else:
+        ctx=cfg.context(_cfgsnapshot)
+    ## with ITSQ_SELECTIVE_RERUN, the context records the parameters read during analysis
+    reads=set()
+    if ctx.ITSQ_SELECTIVE_RERUN:
+        ctx=ctx.trace(reads)
     neuronprops={}
     protocol=None
-    if str(Path(inpath).name)[0] in cfg.ITSQ_SKIP_FILES:
+    if str(Path(inpath).name)[0] in ctx.ITSQ_SKIP_FILES:
         logging.getLogger(__name__).info(f"Skipping file {str(inpath)}")
         return {}
-    myexp=Experiment(inpath)
-    protocolname=myexp.protocol.name
+    ## read protocol name from file header and decide whether file should be loaded
+    info=probe(inpath,lazy=ctx.ITSQ_LAZY_LOADING,cache=ctx.ITSQ_CACHE_SIZE!=0,cachefolder=ctx.ITSQ_CACHE_FOLDER)
+    protocolname=info['protocol']
     logging.getLogger(__name__).info(f"{protocolname} : {str(inpath)}")
-    if any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.IV_PROTOCOL_NAMES])  and 'iv' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    kind=dispatch(protocolname,ctx)
+    if kind is None:
+        logging.getLogger(__name__).warning(f"Unknown / disabled protocol {protocolname}. Check protocol association and PROCESS__ flags.")
+        return {}
+    ctx=ctx.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    ## protocol overrides (ITSQ_PARSE_PROTOCOLS) only depend on file content and on these parameters: they are covered by the key
+    resultkey=None
+    if ctx.ITSQ_RESULT_CACHE_SIZE!=0 and not _debugframe(kind,ctx):
+        resultkey=_resultkey(inpath,protocolname,ctx.untraced())
+        cached=resultcache.lookup(inpath,resultkey,ctx.ITSQ_RESULT_CACHE_FOLDER)
+        if cached is not None:
+            logging.getLogger(__name__).info(f"Cached results for {str(inpath)}")
+            return cached
+    rerunnable=ctx.ITSQ_SELECTIVE_RERUN and not _debugframe(kind,ctx)
+    if rerunnable:
+        recorded=rerun.lookup(inpath,ctx.untraced())
+        if recorded is not None:
+            logging.getLogger(__name__).info(f"Reusing results of {str(inpath)}: file and parameters unchanged")
+            return recorded
+    basectx=ctx
+    myexp=info.get('experiment')             ## files without header only probing were opened by probe()
+    if myexp is None:
+        myexp=Experiment(inpath,lazy=ctx.ITSQ_LAZY_LOADING,cache=ctx.ITSQ_CACHE_SIZE!=0,cachefolder=ctx.ITSQ_CACHE_FOLDER)
+    if kind=='iv':
         sigs=myexp.signal(0)
-        if cfg.ITSQ_PARSE_PROTOCOLS: ## get pulses info
-            cfg.IV_CURRENT_INJECTION_START=myexp.protocol.ascurrentsteps()['steps'][0]['start']
-            cfg.IV_CURRENT_INJECTION_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop']
-            cfg.IV_CURRENT_STEPS=[step['lvl'] for step in myexp.protocol.ascurrentsteps()['steps'] ]
-            HOOK_ADJUST_STEP_HEIGHT()
+        if ctx.ITSQ_PARSE_PROTOCOLS: ## get pulses info
+            ctx=ctx.derive(IV_CURRENT_INJECTION_START=myexp.protocol.ascurrentsteps()['steps'][0]['start'],
+                           IV_CURRENT_INJECTION_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop'],
+                           IV_CURRENT_STEPS=[step['lvl'] for step in myexp.protocol.ascurrentsteps()['steps'] ])
+            ctx=HOOK_ADJUST_STEP_HEIGHT(ctx)
         ## detect start and stop. not heavily tested, but should be ok for simple square pulses
-        protocol=ivprotocol(sigs,cfg.IV_DEBUG_FRAME)
+        protocol=ivprotocol(sigs,_interactive(ctx.IV_DEBUG_FRAME),context=ctx)
         neuronprops.update(protocol.results())
 
     ## processing AHPVprotocol protocol 
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.AHPV_PROTOCOL_NAMES])  and 'ahpv' in cfg.PROCESS_PROTOCOLS :
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='ahpv':
         sigs=myexp.signal(0)
-        assert(len(cfg.AHPV_FREQS)==len(sigs))
+        assert(len(ctx.AHPV_FREQS)==len(sigs))
         for idx,s in enumerate(sigs):
             apcount=int(protocolname[0])
-            freq=cfg.AHPV_FREQS[idx]
-            cfg.AHP_VALID_COMBO.append((apcount,freq))
-            protocol=ahpprotocol([s],cfg.AHP_DEBUG_FRAME,freq,apcount)
+            freq=ctx.AHPV_FREQS[idx]
+            ctx=ctx.derive(AHP_VALID_COMBO=ctx.AHP_VALID_COMBO+[(apcount,freq)])
+            protocol=ahpprotocol([s],_interactive(ctx.AHP_DEBUG_FRAME),freq,apcount,context=ctx)
             neuronprops.update(protocol.results())
 
     ## processing AHPprotocol protocol 
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.AHP_PROTOCOL_NAMES])  and 'ahp' in cfg.PROCESS_PROTOCOLS :
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='ahp':
         sigs=myexp.signal(0)
         ## read frequency from protocol name
-        if cfg.AHP_CHECK_NONE:
+        if ctx.AHP_CHECK_NONE:
             #apstr=re.search(r'\d*AP',protocolname,re.MULTILINE)
             ## obviously the protocol same is not consistent between 5AP procotols and 15 AP protocols. The following regexp should match both
             freqstr=re.search(r'\d+[ ]{0,1}[H,h]z',protocolname,re.MULTILINE)
@@ -1821,13 +1959,12 @@ def process_file(inpath):
             freq=None
             apcount=None
         ## AF version has one frame, whereas I have many frames... Just keep the last one
-        protocol=ahpprotocol([sigs[-1]],cfg.AHP_DEBUG_FRAME,freq,apcount)
-        ##protocol=ahpprotocol(sigs,cfg.AHP_DEBUG_FRAME,freq)
+        protocol=ahpprotocol([sigs[-1]],_interactive(ctx.AHP_DEBUG_FRAME),freq,apcount,context=ctx)
+        ##protocol=ahpprotocol(sigs,ctx.AHP_DEBUG_FRAME,freq)
         neuronprops.update(protocol.results())
         
     ## processing ZAP protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.ZAP_PROTOCOL_NAMES]) and 'resonnance' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='resonnance':
         sigs=myexp.signal(0)
         ## quite complex here! on some setups / protocols, the current is not recorded, so we have to load an external stimulus file!
         try:
@@ -1845,129 +1982,212 @@ def process_file(inpath):
         #assert(sigs[0].sampling_rate==current[0].sampling_rate)
         #assert(len(sigs[0])==len(current[0]))
         if len(sigs[0])==len(current[0]):
-            protocol=resonnanceprotocol([sigs[0],current[0]],cfg.RES_DEBUG_FRAME)
+            protocol=resonnanceprotocol([sigs[0],current[0]],_interactive(ctx.RES_DEBUG_FRAME),context=ctx)
             neuronprops.update(protocol.results())
         else:
             logging.getLogger(__name__).error(resonnance_error_string)
             return {}
 
     ## processing Time Constant protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.TC_PROTOCOL_NAMES])  and 'timeconstant' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='timeconstant':
         sigs=myexp.signal(0)
-        if cfg.ITSQ_PARSE_PROTOCOLS: ## get pulses info
-            cfg.TC_FIT_START=myexp.protocol.ascurrentsteps()['steps'][0]['stop']+0.001
-            #cfg.TC_FIT_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop'] ##dynamic var
-            #cfg.TC_FIT_CURRENT_STEPS=[myexp.protocol.ascurrentsteps()['steps'][i]['lvl'] for i in range()
-            #print(cfg.TC_FIT_CURRENT_STEPS)
-        protocol=timeconstantprotocol(sigs,cfg.TC_DEBUG_FRAME)
+        if ctx.ITSQ_PARSE_PROTOCOLS: ## get pulses info
+            ctx=ctx.derive(TC_FIT_START=myexp.protocol.ascurrentsteps()['steps'][0]['stop']+0.001)
+            #ctx.TC_FIT_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop'] ##dynamic var
+            #ctx.TC_FIT_CURRENT_STEPS=[myexp.protocol.ascurrentsteps()['steps'][i]['lvl'] for i in range()
+            #print(ctx.TC_FIT_CURRENT_STEPS)
+        protocol=timeconstantprotocol(sigs,_interactive(ctx.TC_DEBUG_FRAME),context=ctx)
         neuronprops.update(protocol.results())
     
     ## processing resistance protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.INPUTR_PROTOCOL_NAMES])  and 'resistance' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
-        sigs=myexp.signal(0)
+    elif kind=='resistance':
+        sweeps=myexp.matrix(0)
         ## for resistance, average signals
-        avgsig=neo.AnalogSignal( np.mean(np.array([s.magnitude.flatten() for s in sigs]),axis=0),
+        avgsig=neo.AnalogSignal( np.mean(sweeps.data,axis=0),
             units='V', 
-            sampling_rate=sigs[0].sampling_rate
+            sampling_rate=sweeps.sampling_rate*pq.Hz
             )
-        if cfg.ITSQ_PARSE_PROTOCOLS: ## get pulses info
-            cfg.INPUTR_CURRENT_INJECTION_START=myexp.protocol.ascurrentsteps()['steps'][0]['start']
-            cfg.INPUTR_CURRENT_INJECTION_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop']
-            cfg.INPUTR_CURRENT_STEP=myexp.protocol.ascurrentsteps()['steps'][0]['lvl']
-            HOOK_ADJUST_STEP_HEIGHT()
-        protocol=resistanceprotocol([avgsig],cfg.INPUTR_DEBUG_FRAME,currentstep=cfg.INPUTR_CURRENT_STEP)
+        if ctx.ITSQ_PARSE_PROTOCOLS: ## get pulses info
+            ctx=ctx.derive(INPUTR_CURRENT_INJECTION_START=myexp.protocol.ascurrentsteps()['steps'][0]['start'],
+                           INPUTR_CURRENT_INJECTION_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop'],
+                           INPUTR_CURRENT_STEP=myexp.protocol.ascurrentsteps()['steps'][0]['lvl'])
+            ctx=HOOK_ADJUST_STEP_HEIGHT(ctx)
+        protocol=resistanceprotocol([avgsig],_interactive(ctx.INPUTR_DEBUG_FRAME),currentstep=ctx.INPUTR_CURRENT_STEP,context=ctx)
         neuronprops.update(protocol.results())
 
     ## processing sag protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.SAG_PROTOCOL_NAMES])  and 'sag' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='sag':
         sigs=myexp.signal(0)
         ## for sag, average signals by groups of 3
         from neomonkey import average,groupaverage
-        #cnt=cfg.SAG_AVERAGE_COUNT
+        #cnt=ctx.SAG_AVERAGE_COUNT
         cnt=myexp.protocol.episode_repeat
         #avgsig=[average(sigs[cnt*i],sigs[cnt*i+1],sigs[cnt*i+2]) for i in range(len(sigs)//cnt) ]
         avgsig=groupaverage(sigs,cnt,'framerepeat')
-        if cfg.ITSQ_PARSE_PROTOCOLS: ## get pulses info
-            cfg.SAG_CURRENT_INJECTION_START=myexp.protocol.ascurrentsteps()['steps'][0]['start']
-            cfg.SAG_CURRENT_INJECTION_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop']
-            cfg.SAG_CURRENT_STEPS=[step['lvl'] for step in myexp.protocol.ascurrentsteps()['steps'] ]
-            cfg.SAG_CURRENT_STEPS=sorted(list(set(cfg.SAG_CURRENT_STEPS)))
-            HOOK_ADJUST_STEP_HEIGHT()
-        protocol=sagprotocol(avgsig,cfg.SAG_DEBUG_FRAME,currentstep=cfg.SAG_CURRENT_STEPS)
+        if ctx.ITSQ_PARSE_PROTOCOLS: ## get pulses info
+            ctx=ctx.derive(SAG_CURRENT_INJECTION_START=myexp.protocol.ascurrentsteps()['steps'][0]['start'],
+                           SAG_CURRENT_INJECTION_STOP=myexp.protocol.ascurrentsteps()['steps'][0]['stop'],
+                           SAG_CURRENT_STEPS=sorted(list(set([step['lvl'] for step in myexp.protocol.ascurrentsteps()['steps'] ]))))
+            ctx=HOOK_ADJUST_STEP_HEIGHT(ctx)
+        protocol=sagprotocol(avgsig,_interactive(ctx.SAG_DEBUG_FRAME),currentstep=ctx.SAG_CURRENT_STEPS,context=ctx)
         neuronprops.update(protocol.results())
 
     ## spontaneous activity protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.SPONTANEOUS_PROTOCOL_NAMES])  and 'spontaneousactivity' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='spontaneousactivity':
         sigs=myexp.signal(0)
-        cfg.IV_CURRENT_INJECTION_START, cfg.IV_CURRENT_INJECTION_STOP=0, sigs[0].times.magnitude.flatten()[-1]
-        protocol=spontaneousactivityprotocol(sigs,cfg.SPONTANEOUS_DEBUG_FRAME)
+        ctx=ctx.derive(IV_CURRENT_INJECTION_START=0,IV_CURRENT_INJECTION_STOP=sigs[0].times.magnitude.flatten()[-1])
+        protocol=spontaneousactivityprotocol(sigs,_interactive(ctx.SPONTANEOUS_DEBUG_FRAME),context=ctx)
         neuronprops.update(protocol.results())
 
     ## ramp protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.RAMP_PROTOCOL_NAMES])  and 'ramp' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='ramp':
         sigs=myexp.signal(0)
         voltage=myexp.signal(1)
-        protocol=rampprotocol([ (sigs[e],voltage[e]) for e in range(len(sigs))],cfg.RAMP_DEBUG_FRAME)
+        protocol=rampprotocol([ (sigs[e],voltage[e]) for e in range(len(sigs))],_interactive(ctx.RAMP_DEBUG_FRAME),context=ctx)
         neuronprops.update(protocol.results())
 
     ## rheobase protocol
-    elif any([fnmatch.fnmatchcase(protocolname,x) for x in cfg.RHEO_PROTOCOL_NAMES])  and 'rheobase' in cfg.PROCESS_PROTOCOLS:
-        cfg.parse(Path(__file__).resolve().parent/"params"/(protocolname+"_params.py"))
+    elif kind=='rheobase':
         sigs=myexp.signal(0)
-        protocol=rheobaseprotocol([ sigs[e] for e in range(len(sigs))],cfg.RHEO_DEBUG_FRAME)
+        protocol=rheobaseprotocol([ sigs[e] for e in range(len(sigs))],_interactive(ctx.RHEO_DEBUG_FRAME),context=ctx)
         neuronprops.update(protocol.results())
 
-    ## unknown protocol/disabled protocol. warn the user
-    else:
-        logging.getLogger(__name__).warning(f"Unknown / disabled protocol {protocolname}. Check protocol association and PROCESS__ flags.")
-    
     if not protocol is None:
-        if cfg.ITSQ_PROTOCOL_SAVE_DATA:protocol.savedata(inpath,protocolname)
-    
+        if ctx.ITSQ_PROTOCOL_SAVE_DATA:protocol.savedata(inpath,protocolname)
+    ## only the sweeps decoded by the analysis are cached
+    if ctx.ITSQ_CACHE_SIZE!=0:
+        myexp.tocache(ctx.ITSQ_CACHE_FOLDER,max(0,ctx.ITSQ_CACHE_SIZE)*1024*1024)
+    if resultkey is not None:
+        resultcache.store(inpath,resultkey,neuronprops,ctx.ITSQ_RESULT_CACHE_FOLDER,max(0,ctx.ITSQ_RESULT_CACHE_SIZE)*1024*1024)
+    if rerunnable:
+        rerun.store(inpath,basectx.untraced(),reads,neuronprops)
     return neuronprops
 
-def processfolder(fpath):
+def processfolder(fpath,files=None):
     ## get meta info from folder
     neuronprops={}
     protocol=foldernameprotocol(fpath)
     neuronprops.update(protocol.results())
-    ## search all files with required extension _prefix(cfg.PROCESS_EXTENSIONS,'*')
-    allfiles=[f for ext in _prefix(cfg.PROCESS_EXTENSIONS,'*') for f in fpath.glob(ext) ]
+    ## files with required extension, as listed by _discover(), or listed now
+    allfiles=files if files is not None else _folderfiles(fpath)
     for inpath in allfiles:
         neuronprops.update(process_file(inpath))
     return neuronprops
 
-def process(inpath,disable_filter=False):
+def _manifest():
+    return manifest.Manifest(_prefix(cfg.PROCESS_EXTENSIONS,''),cfg.ITSQ_SKIP_FILES,cfg.ITSQ_MANIFEST_FILE)
+
+def _folderfiles(fpath):
+    return [f for f,_,_ in _manifest().files(fpath)]
+
+def processfolders(folders,jobs=1,prefetch=0):
+    '''processes a list of folders and yields (folder,neuronprops) as soon as each folder is done.
+    folders is either a list of folders, or a dict {folder: files} as returned by _discover().
+    with jobs!=1, files are analysed by a pool of worker processes (0: one per cpu), and folders are yielded
+    in the same order as sequential processing. at most prefetch files (0: twice the number of workers) are submitted
+    ahead of the results consumed by the caller: a slow consumer pauses the analysis instead of accumulating results
+    '''
+    if not isinstance(folders,dict):
+        folders={folder:None for folder in folders}
+    if jobs==1 or len(folders)==0:
+        for folder,files in folders.items():
+            yield folder,processfolder(folder,files)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    from collections import deque
+    jobs=jobs if jobs>0 else (os.cpu_count() or 1)
+    prefetch=prefetch if prefetch>0 else 2*jobs
+    tasks=[(folder,files if files is not None else _folderfiles(folder)) for folder,files in folders.items()]
+    allfiles=iter([f for _,files in tasks for f in files])
+    with ProcessPoolExecutor(max_workers=jobs,initializer=_batch_init,initargs=(cfg.snapshot(),)) as pool:
+        inflight=deque()
+        def refill():
+            while len(inflight)<prefetch:
+                f=next(allfiles,None)
+                if f is None:
+                    break
+                inflight.append(pool.submit(process_file,f))
+        for folder,files in tasks:
+            neuronprops={}
+            neuronprops.update(foldernameprotocol(folder).results())
+            for _ in files:
+                refill()
+                neuronprops.update(inflight.popleft().result())
+            refill()
+            yield folder,neuronprops
+
+def _discover(inpath):
+    ## cells to analyse in inpath: a single file, a folder with files, or all folders with files below inpath
+    ## returns {cell: files}. the tree is walked once, and files starting with ITSQ_SKIP_FILES are left out
+    inpath=Path(inpath)
+    if inpath.is_file() and inpath.suffix in _prefix(cfg.PROCESS_EXTENSIONS,''):
+        return {inpath:[inpath]}
+    if not inpath.is_dir():
+        return {}
+    m=_manifest()
+    files=m.files(inpath)
+    ## folder with mess. sorted, so that output order does not change between runs
+    found={inpath:files} if len(files)>0 else m.walk(inpath)
+    m.save()
+    logging.getLogger(__name__).debug(f"Found {sum(len(v) for v in found.values())} files in {len(found)} folders ({m.reused} listings reused)")
+    return {cell:[f for f,_,_ in files] for cell,files in found.items()}
+
+def _setup():
+    global _cfgsnapshot
     cfg.parse(Path(__file__).resolve().parent/gen_cfg_file)
-    ## start processing
-    allneurons=[]
-    ## single file
-    if Path(inpath).is_file() and Path(inpath).suffix in _prefix(cfg.PROCESS_EXTENSIONS,''):
-        neuron={}
-        neuron.update(process_file(Path(inpath)))
-        allneurons.append(neuron)
-
-    ## folder with files
-    if Path(inpath).is_dir():
-        if len([f for ext in _prefix(cfg.PROCESS_EXTENSIONS,'*') for f in Path(inpath).glob(ext) ])>0:
-            neuron={}
-            neuron.update(processfolder(Path(inpath)))
-            allneurons.append(neuron)
-        else:
-            ## folder with mess
-            folders=set([f.parents[0] for ext in _prefix(cfg.PROCESS_EXTENSIONS,'**/*') for f in Path(inpath).glob(ext) ])
-            for folder in folders:
-                neuron={}
-                neuron.update(processfolder(folder))
-                allneurons.append(neuron)
-    ## before we output to csv,excel, ..., we have to make sure that we have exactly the same fields for all neurons
-    ## fortunately, pandas takes care of this for us, provided that an index is given
-    df=pd.DataFrame(allneurons).T
+    _cfgsnapshot=cfg.snapshot()
+
+def _teardown():
+    ## the snapshot is only valid during one run: later direct calls to process_file parse parameter files again
+    global _cfgsnapshot
+    _cfgsnapshot=None
+
+def _itercells(cells,jobs):
+    ## cells are either files or folders, as returned by _discover()
+    if len(cells)>0 and next(iter(cells)).is_file():
+        for c in cells:
+            yield c,process_file(c)
+    else:
+        yield from processfolders(cells,jobs,cfg.ITSQ_BATCH_PREFETCH)
+
+def iter_process(inpath,jobs=None):
+    '''yields (cell path,neuronprops) for each cell (folder, or single file) of inpath, as soon as it is analysed.
+    cells are yielded in the same order as the columns of process() results.
+    analysis runs ahead of the consumer by at most ITSQ_BATCH_PREFETCH files
+    '''
+    _setup()
+    try:
+        if jobs is None:
+            jobs=cfg.ITSQ_BATCH_JOBS
+        yield from _itercells(_discover(inpath),jobs)
+    finally:
+        _teardown()
+
+def process(inpath,disable_filter=False,jobs=None):
+    _setup()
+    try:
+        if jobs is None:
+            jobs=cfg.ITSQ_BATCH_JOBS
+        ## results of each cell are committed to the store as soon as they are available, with a hash of the config and files
+        ## with ITSQ_RESUME, cells already in the store (from an interrupted run) with the same hash are not analysed again
+        cells=_discover(inpath)
+        runkey=_runkey()
+        keys={c:_cellkey(runkey,files) for c,files in cells.items()}
+        with ResultStore(cfg.ITSQ_RESULT_STORE or ":memory:") as store:
+            if not cfg.ITSQ_RESUME:
+                store.clear()
+            done=store.cells()
+            pending={c:files for c,files in cells.items() if done.get(str(c.resolve()))!=keys[c]}
+            if len(pending)<len(cells):
+                logging.getLogger(__name__).info(f"Resuming: {len(cells)-len(pending)} cells already analysed")
+            for e,(cell,neuronprops) in enumerate(_itercells(pending,jobs)):
+                store.commit(str(cell.resolve()),neuronprops,keys[cell])
+                logging.getLogger(__name__).info(f"Cell {e+1}/{len(pending)} done: {str(cell)}")
+            ## before we output to csv,excel, ..., we have to make sure that we have exactly the same fields for all neurons
+            ## fortunately, pandas takes care of this for us, provided that an index is given
+            df=store.dataframe([str(c.resolve()) for c in cells])
+    finally:
+        _teardown()
     ## optionnally read output fields from specified file
     ## python should be easy to read! sorry!
     ## filtering is now performed dynamically when updating grid
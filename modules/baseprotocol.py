@@ -9,7 +9,7 @@
 # modification, are permitted under the terms of the BSD License. See
 # LICENSE file in the root of the Project.
 
-import os
+import os,weakref
 from pathlib import Path
 
 from collections.abc import Iterable
@@ -17,18 +17,19 @@ import pickle,json
 import jsonpickle
 import jsonpickle.ext.numpy as jsonpickle_numpy
 import jsonpicklehandlers
+import lod
+from mpl_layers import layers
+from spiketable import derivatives
 from functools import partial
 
-import matplotlib
-import matplotlib.pyplot as plt
-from mpl_interaction import PanAndZoom
-from mpl_toolbutton import TriggerBtn,ToggleBtn
-from mpl_draggable import draggable_line
+## matplotlib and the interactive tools are only imported when a protocol needs a figure
 
 ######################################################################################
 ## baseframe and baseprotocol
 ## ancestors to any **frame and **procotol
 #######################################################################################
+_derivatives=weakref.WeakKeyDictionary()    ## frame -> (signal,smoothing,(dv,d2v)). kept out of frames, so that it is never saved
+
 def once(method):
     def inner(ref):
         if len(ref._axes())==0:
@@ -36,12 +37,19 @@ def once(method):
     return inner
 
 class BaseFrame:
+    background=True                         ## process() can run in a background thread (see processall)
+
     def __init__(self,idx,parent):
         self.idx=idx
         self.parent=parent
         self.enabled=True
         self.process() ## only exists in derived class
 
+    @property
+    def cfg(self):
+        ## frames read the parameters of their protocol
+        return self.parent.cfg
+
     def activate(self):
         ## to be called when the frame becomes current.
         pass
@@ -50,18 +58,57 @@ class BaseFrame:
         ## to be called when the frame becomes current. currently unused
         pass
 
-    def _cursor(self,ax,dir,value,cb):
+    def _cursor(self,ax,dir,value,cb,preview=None):
         ## keep a reference to created cursor in figure, otherwise the cursor object disappears (while the line is still present on graph!)
         ## TODO super trivial, but requires testing...
         ## cursors should be attached to protocol, not to fig()
         ## _cursor should return the draggable line (return self.parent.cursors[-1])
+        ## preview(x) runs while the cursor is dragged (rate limited), cb(x) on release. preview should be a cheap
+        ## approximation of cb (see _preview). preview=True uses cb itself, for callbacks that are already cheap
+        from mpl_draggable import draggable_line
+        previewcb=(cb if preview is True else preview) if self.cfg.ITSQ_CURSOR_PREVIEW else None
         if isinstance(ax,Iterable):
-            self.parent.cursors.append(draggable_line(ax,dir, value, cb))
+            self.parent.cursors.append(draggable_line(ax,dir, value, cb,preview=previewcb,interval=self.cfg.ITSQ_CURSOR_PREVIEW_INTERVAL))
             return self.parent.cursors[-1]
         else:
-            self.parent.cursors.append(draggable_line([ax],dir, value, cb))
+            self.parent.cursors.append(draggable_line([ax],dir, value, cb,preview=previewcb,interval=self.cfg.ITSQ_CURSOR_PREVIEW_INTERVAL))
             return self.parent.cursors[-1]
 
+    def _trace(self,ax,x,y,*args,**kwargs):
+        ## long traces are drawn from a min/max pyramid, at the level of detail of current x limits
+        return lod.plot(ax,x,y,*args,**kwargs)
+
+    def _derivatives(self,sig,smooth=0):
+        ## first and second derivatives (per sample) of sig, shared by detection and display.
+        ## computed once, and again only if the frame gets another signal or another smoothing
+        cached=_derivatives.get(self)
+        if cached is None or cached[0] is not sig or cached[1]!=smooth:
+            cached=(sig,smooth,derivatives(sig.V(),smooth))
+            _derivatives[self]=cached
+        return cached[2]
+
+    def _marker(self,ax,key,x,y,*args,**kwargs):
+        ## markers are created once and updated in place. markers that a draw does not update are hidden
+        return layers(self._fig()).line(ax,'markers',key,x,y,*args,**kwargs)
+
+    def _hmarker(self,ax,key,y,**kwargs):
+        return layers(self._fig()).hline(ax,'markers',key,y,**kwargs)
+
+    def _title(self,ax,text):
+        return layers(self._fig()).title(ax,'markers',text)
+
+    def _preview(self,ax,key,x,y,stale,*args,**kwargs):
+        ## live preview while a cursor is dragged: marker key is updated over the background, and the markers in stale
+        ## (no longer valid until the frame is processed again) are hidden. the next draw of the frame hides the preview
+        self._marker(ax,key,x,y,*args,**kwargs)
+        layers(self._fig()).hide(ax,'markers',stale)
+        layers(self._fig()).update()
+
+    def _previewwindow(self,ax,sig,start,stop,stale=()):
+        ## preview of a fit cursor: the part of the trace that would be fitted. the fit itself only runs on release
+        x,y=(sig.s(start,stop),sig.V(start,stop)) if stop>start else ([],[])
+        self._preview(ax,'fitwindow',x,y,stale,color='orange',linewidth=2)
+
     def _get_cursor(self,x):
         return self.parent.cursors[x]
 
@@ -83,52 +130,24 @@ class BaseFrame:
 
     def _axes(self,idx=-1):
         return self.parent._axes(idx)
-import wx
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_wxagg import (
-    FigureCanvasWxAgg as FigureCanvas,
-    NavigationToolbar2WxAgg
-    )
-class ModalFrame(wx.Frame):
-    def __init__(self, parent, title):
-        wx.Frame.__init__(self, parent, title=title, style=wx.DEFAULT_FRAME_STYLE|wx.STAY_ON_TOP)
-        self.fig = Figure((1,1))
-        #plt.gcf=lambda:self.fig ## awfull hack! (really awfull)
-        super().__init__(parent, -1)
-        self.canvas = FigureCanvas(self, -1, self.fig)
-        self.toolbar = NavigationToolbar2WxAgg(self.canvas)  # matplotlib toolbar
-        self.toolbar.Realize()
-
-        # Now put all into a sizer
-        sizer = wx.BoxSizer(wx.VERTICAL)
-        # Best to allow the toolbar to resize!
-        sizer.Add(self.toolbar, 0, wx.EXPAND)
-        # This way of adding to sizer allows resizing
-        sizer.Add(self.canvas, 1, wx.LEFT | wx.TOP | wx.EXPAND)
-        self.SetSizer(sizer)
-        self.Fit()
-        self.Bind(wx.EVT_CLOSE, self.onClose) # (Allows main window close to work)
-
-    def onClose(self, event):
-        self.MakeModal(False) # (Re-enables parent window)
-        self.eventLoop.Exit()
-        self.Destroy() # (Closes window without recursion errors)
-
-    def ShowModal(self):
-        self.MakeModal(True) # (Explicit call to MakeModal)
-        self.Show()
-        self.eventLoop = wx.EventLoop()
-        self.eventLoop.Run()
-
 class BaseProtocol:
     def __init__(self,interactive,fig=None,pzwheelonly=True):
         self.f=0
         self.cursors=[]
+        self.interactive=interactive
+        ## headless protocols (not interactive, no figure given) never create a figure, cursor or button, and never draw
+        if fig is None and not interactive:
+            self.fig=None
+            return
+        import matplotlib
+        import matplotlib.pyplot as plt
         if fig is None:
             self.fig=plt.gcf()
         else:
             self.fig=fig
         if interactive:
+            from mpl_interaction import PanAndZoom
+            from mpl_toolbutton import TriggerBtn,ToggleBtn
             pan_zoom = PanAndZoom(self._fig(),pzwheelonly)
             iconpath=Path(os.getcwd()).resolve()
             #iconpath=Path(__file__).parent.resolve()
@@ -139,7 +158,7 @@ class BaseProtocol:
                 allbtn=TriggerBtn(self._fig(),"all",'alt+a',str(iconpath/'resources/fa-redo-solid.png'),'Apply parameters to all frames',self.processall)
             else:
                 trashbtn=ToggleBtn(self._fig(),"disable",'alt+d',str(iconpath/'resources/fa-trash-solid.png'),'Disable/enable this frame',self.toggleframe)
-            self.frames[self.f].draw()
+            self._drawframe()
             self._fig().canvas.draw()
             ## quite complex situation here:
             ## if fig is None, it is created through the pyplot module, 
@@ -163,10 +182,19 @@ class BaseProtocol:
                 else:
                     plt.show()
 
+    def setcfg(self,**values):
+        ## parameters changed from the gui only affect this protocol. returns None, so that it can be chained in cursor callbacks
+        self.cfg=self.cfg.derive(**values)
+
     def _fig(self):
         return self.fig
 
+    def headless(self):
+        return self.fig is None
+
     def _axes(self,idx=-1):
+        if self.headless():
+            return []
         if idx==-1:
             return self.fig.get_axes()
         else:
@@ -179,7 +207,7 @@ class BaseProtocol:
         self.frames[self.f].deactivate()
         self.f=max(0, min(self.f+1, len(self.frames)-1)) ## quick clamp
         self.frames[self.f].activate()
-        self.frames[self.f].draw()
+        self._drawframe()
         self.colorize()
         self._fig().canvas.draw()
 
@@ -187,7 +215,7 @@ class BaseProtocol:
         self.frames[self.f].deactivate()
         self.f=max(0, min(self.f-1, len(self.frames)-1)) ## quick clamp
         self.frames[self.f].activate()
-        self.frames[self.f].draw()
+        self._drawframe()
         self.colorize()
         self._fig().canvas.draw()
 
@@ -203,14 +231,43 @@ class BaseProtocol:
 
     def process(self, bitmask=0xFFFF):
         self.frames[self.f].process(bitmask)
+        job=getattr(self,'job',None)
+        if job is not None and job.running():
+            job.touched.add(self.f)
+
+    def precompute(self):
+        ## measurements of all frames that can be done ahead in the frame pool. called by processall
+        pass
 
     def processall(self,*args,**kwargs):
-        for f in self.frames:
-            f.process(0xFFFF)
-        self.draw(False)
+        ## frames are processed in the background, and replaced all at once when done. calling again cancels
+        job=getattr(self,'job',None)
+        if job is not None and job.running():
+            job.cancel()
+            return
+        if self.headless() or not all(f.background for f in self.frames):
+            for f in self.frames:
+                f.process(0xFFFF)
+            self.draw(False)
+            return
+        from framejob import framejob
+        self.job=framejob(self,0xFFFF)
 
-    def draw(self,drawall=True):
+    def _drawframe(self,drawall=True):
+        markers=layers(self._fig())
+        markers.begin('markers')
         self.frames[self.f].draw(drawall)
+        markers.end('markers')
+
+    def draw(self,drawall=True):
+        ## without drawall, only markers changed: they are drawn over the saved background
+        if self.headless():
+            return
+        self._drawframe(drawall)
+        if drawall:
+            self._fig().canvas.draw_idle()
+        else:
+            layers(self._fig()).update()
 
     def savedata(self,basefile,protocolname):
         parentdir=Path(basefile).resolve().parent
@@ -221,7 +278,12 @@ class BaseProtocol:
         # since cursors are now bound to protocol, and theyr reference axes() which references fig(), jsonpickle fails
         # we can just transform cursors to tupple (orientation/value)
         self.cursors=[(c.o,c.getpos()) for c in self.cursors]
-        del self.fig
+        self.__dict__.pop('fig',None)
+        self.__dict__.pop('stats',None)     ## window statistics are not saved
+        self.__dict__.pop('precomputed',None)
+        self.__dict__.pop('lastfitter',None)
+        self.__dict__.pop('cfg',None)       ## cfg context is not saved
+        self.__dict__.pop('job',None)
         with open(filename, 'w') as outfile:
             self.protocolname=protocolname
             outfile.write(json.dumps(json.loads(jsonpickle.encode(self,unpicklable=True)), indent=4))
\ No newline at end of file
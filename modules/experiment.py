@@ -14,19 +14,156 @@ import neo
 import quantities as pq
 import numbers
 import pathlib,logging,pprint
+from collections.abc import Sequence
+import experimentcache
 
-def Experiment(filename):
+def Experiment(filename,lazy=False,cache=False,cachefolder=None):
+    '''opens an experiment file. with lazy=True, only the headers are parsed
+    and sweeps are decoded on demand by signal() (abf, axgd and axgx files only)
+    with cache=True, decoded signals and protocol are read from the on disk cache (see experimentcache) when available.
+    call tocache() once the signals have been used to write them to the cache
+    '''
     if pathlib.Path(filename).is_file():
-        suffix=pathlib.Path(filename).suffix
+        if cache:
+            entry=experimentcache.lookup(filename,cachefolder)
+            if entry is not None:
+                try:
+                    return CACHEDexperiment(filename,entry,lazy=lazy)
+                except Exception as e:
+                    logging.getLogger(__name__).warning(f"Could not read cache for {filename}: {e}")
+        return _open(filename,lazy)
+
+def probe(filename,lazy=False,cache=False,cachefolder=None):
+    '''returns protocol name, sweep/channel/sample counts and sampling rate of an experiment file
+    only headers are parsed for abf, axgd and axgx files. other files (maty) have to be opened with Experiment(filename,lazy,cache,cachefolder),
+    as NeoMatlabIO has no header only mode: the opened experiment is returned as 'experiment', so that it is not read twice
+    '''
+    suffix=pathlib.Path(filename).suffix
+    if suffix in[".abf",".axgd",".axgx"]:
         if suffix in[".abf"]:
-            return ABFexperiment(filename)
-        if suffix in[".axgd",".axgx"]:
-            return AXGexperiment(filename)
-        if suffix in[".maty"]:
-            return MATYexperiment(filename)
+            r=neo.rawio.AxonRawIO(str(filename))
+            r.parse_header()
+            name=str(r._axon_info["sProtocolPath"]).split('/')[-1]
+        else:
+            r=neo.rawio.AxographRawIO(str(filename))
+            r.parse_header()
+            name=r.info["comment"].split(':')[1].rstrip().lstrip()
+        return {'protocol':name,
+                'sweepcount':r.segment_count(0),
+                'chancount':len(r.header['signal_channels']),
+                'samplecount':r.get_signal_size(0,0,stream_index=0),
+                'sampling_rate':r.get_signal_sampling_rate(stream_index=0)*pq.Hz
+                }
+    exp=Experiment(filename,lazy=lazy,cache=cache,cachefolder=cachefolder)
+    if exp is not None:
+        return {'protocol':exp.protocol.name,
+                'sweepcount':exp.sweepcount,
+                'chancount':exp.chancount,
+                'samplecount':exp.samplecount,
+                'sampling_rate':exp.sampling_rate,
+                'experiment':exp
+                }
+
+def _open(filename,lazy):
+    suffix=pathlib.Path(filename).suffix
+    if suffix in[".abf"]:
+        return ABFexperiment(filename,lazy=lazy)
+    if suffix in[".axgd",".axgx"]:
+        return AXGexperiment(filename,lazy=lazy)
+    if suffix in[".maty"]:
+        return MATYexperiment(filename)
         #if suffix in[".txt",".ascii"]:
         #    return ASCIIexperiment(filename)
 
+def _si(sig):
+    '''rescales a signal to V or A and resets its start time'''
+    sig._t_start=0.0*pq.s
+    if sig.units in [pq.V,pq.mV,pq.uV]:
+        sig=sig.rescale(pq.V)
+    elif sig.units in [pq.A,pq.mA,pq.uA,pq.nA,pq.pA]:
+        sig=sig.rescale(pq.A)
+    else:
+        logging.getLogger(__name__).warning("Unknowmn quantity.Can't rescale")
+    return sig
+
+def _siunits(sig):
+    '''units of sig once rescaled by _si. works with proxies'''
+    if sig.units in [pq.V,pq.mV,pq.uV]:
+        return 'V'
+    if sig.units in [pq.A,pq.mA,pq.uA,pq.nA,pq.pA]:
+        return 'A'
+    return sig.units.dimensionality.string
+
+class LazySignals(Sequence):
+    '''list-like access to the sweeps of one channel, built from neo proxies.
+    each sweep is decoded (and rescaled) the first time it is indexed, then kept
+    '''
+    def __init__(self,proxies):
+        self.proxies=proxies
+        self.sigs=[None]*len(proxies)
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def __getitem__(self,idx):
+        if isinstance(idx,slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx<0:
+            idx+=len(self)
+        if self.sigs[idx] is None:
+            self.sigs[idx]=_si(self.proxies[idx].load())
+        return self.sigs[idx]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+class SweepMatrix:
+    '''all sweeps of one channel as a single C-contiguous (sweepcount,samplecount) array, in V or A
+    sweeps share the same time base (t0,dt). levels are the command levels of each sweep, as returned by
+    protocol.ascurrentsteps(), or None if the protocol could not be parsed
+    the dtype of decoded signals is preserved
+    '''
+    def __init__(self,data,units,dt,t0=0.0,levels=None):
+        self.data=np.ascontiguousarray(data)
+        self.units=units
+        self.dt=dt
+        self.t0=t0
+        self.levels=levels
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def sampling_rate(self):
+        return 1.0/self.dt
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self,idx):
+        return self.data[idx]
+
+    def idx(self,t):
+        ## same rounding as neomonkey
+        return int(round((t-self.t0)*self.sampling_rate))
+
+    def times(self):
+        return self.t0+np.arange(self.data.shape[1])*self.dt
+
+    def window(self,start=None,stop=None):
+        '''returns a (sweepcount,n) view of samples between start and stop (s)'''
+        i0=None if start is None else self.idx(start)
+        i1=None if stop is None else self.idx(stop)
+        return self.data[:,i0:i1]
+
+    def signal(self,idx):
+        return neo.AnalogSignal(self.data[idx].reshape(-1,1),units=self.units,sampling_rate=self.sampling_rate*pq.Hz,t_start=self.t0*pq.s)
+
+    def signals(self):
+        return [self.signal(i) for i in range(len(self))]
+
 class GENexperiment:
     def __init__(self,filename):
         self.path=filename
@@ -35,32 +172,144 @@ class GENexperiment:
         self.signalcount=len(self.blk.segments[0].analogsignals)
         self.sweepcount=len(self.blk.segments)
         self.chancount=len(self.blk.segments[0].analogsignals)
-        self.samplecount=len(self.blk.segments[0].analogsignals[0]) ##assumes uniform sampling
+        self.samplecount=self.blk.segments[0].analogsignals[0].shape[0] ##assumes uniform sampling. shape also works with proxies
         self.sampling_rate=self.blk.segments[0].analogsignals[0].sampling_rate
+        self.decoded={}                     ## channel index -> sweeps returned by signal(). written by tocache()
     
     def signal(self,channel,filter='V'):
         '''returns the list of signals corresponding to one channel. signals are scaled to V or A
            if a filter is provided (V or A), the program will only look with signals with specified units
+           for lazy experiments, the list only decodes the sweeps that are actually indexed
+           sweeps are decoded once per experiment, whatever the number of calls
         '''
 
         sigs=[]
+        chans=set()
         for seg in self.blk.segments:
-            validsigs=[seg.analogsignals[i] for i in range(len(seg.analogsignals)) if str(seg.analogsignals[i].units).endswith(filter)]
-            if len(validsigs):
-                sig=validsigs[channel]
+            valid=[i for i in range(len(seg.analogsignals)) if str(seg.analogsignals[i].units).endswith(filter)]
+            if len(valid):
+                chans.add(valid[channel])
             else:
                 logging.getLogger(__name__).error(f"No signal with units {filter}")
                 return
             #sig=seg.analogsignals[channel]
-            sig._t_start=0.0*pq.s
-            if sig.units in [pq.V,pq.mV,pq.uV]:
-                sig=sig.rescale(pq.V)
-            elif sig.units in [pq.A,pq.mA,pq.uA,pq.nA,pq.pA]:
-                sig=sig.rescale(pq.A)
-            else:
-                logging.getLogger(__name__).warning("Unknowmn quantity.Can't rescale")
-            sigs.append(sig)
-        return sigs
+            sigs.append(seg.analogsignals[valid[channel]])
+        c=chans.pop() if len(chans)==1 else None
+        if c in self.decoded:
+            sigs=self.decoded[c]
+        else:
+            sigs=LazySignals(sigs) if self.lazy else [_si(s) for s in sigs]
+            if c is not None:
+                self.decoded[c]=sigs
+        return sigs if self.lazy else list(sigs)
+
+    def matrix(self,channel,filter='V'):
+        '''same as signal(), but returns a SweepMatrix'''
+        sigs=self.signal(channel,filter)
+        if sigs is None:
+            return
+        if any(s.shape[0]!=self.samplecount for s in sigs):
+            logging.getLogger(__name__).error(f"Sweeps of {self.name} have different lengths")
+            return
+        data=np.empty((len(sigs),self.samplecount),dtype=sigs[0].dtype)
+        for i,s in enumerate(sigs):
+            data[i]=s.magnitude.reshape(-1)
+        return SweepMatrix(data,sigs[0].units.dimensionality.string,1.0/float(self.sampling_rate.rescale(pq.Hz).magnitude),levels=self._levels(len(sigs)))
+
+    def _levels(self,count):
+        try:
+            levels=[step['lvl'] for step in self.protocol.ascurrentsteps()['steps']]
+        except Exception:
+            return None
+        return levels if len(levels)==count else None
+
+    def tocache(self,folder=None,maxsize=0):
+        '''writes the channels already decoded by signal() and the protocol to the on disk cache. nothing is decoded:
+        channels of which some sweeps were not used are left out, and nothing is written if no channel is complete
+        '''
+        channels={}
+        for c,sweeps in self.decoded.items():
+            if isinstance(sweeps,LazySignals) and any(s is None for s in sweeps.sigs):
+                continue
+            if any(s.shape[0]!=self.samplecount for s in sweeps):
+                logging.getLogger(__name__).debug(f"Not caching {self.name}: sweeps have different lengths")
+                return
+            channels[c]=[s.magnitude for s in sweeps]
+        if not len(channels):
+            return
+        meta={'name':self.name,
+              'suffix':self.suffix,
+              'sweepcount':self.sweepcount,
+              'chancount':self.chancount,
+              'samplecount':self.samplecount,
+              'sampling_rate':float(self.sampling_rate.rescale(pq.Hz).magnitude),
+              'units':[_siunits(s) for s in self.blk.segments[0].analogsignals]
+              }
+        experimentcache.store(self.path,meta,channels,self.protocol,folder,maxsize)
+
+class _CachedSweep:
+    '''mimics neo proxy interface for one sweep of a cached channel'''
+    def __init__(self,arr,idx,units,sampling_rate):
+        self.arr=arr
+        self.idx=idx
+        self.units=pq.Quantity(1.0,units)
+        self.shape=(arr.shape[1],1)
+        self.sampling_rate=sampling_rate
+
+    def load(self):
+        return neo.AnalogSignal(np.array(self.arr[self.idx]).reshape(-1,1),units=self.units,sampling_rate=self.sampling_rate)
+
+class CACHEDexperiment(GENexperiment):
+    '''experiment restored from the on disk cache. signals are memory mapped and built on demand
+    channels that are not in the cache entry are read from the data file
+    '''
+    def __init__(self,filename,entry,lazy=False):
+        meta,self.arrays,self.protocol=experimentcache.load(entry)
+        self.lazy=lazy
+        self.source=None
+        self.units=meta['units']
+        self.path=filename
+        self.name=pathlib.Path(filename).resolve().name
+        self.suffix=pathlib.Path(filename).resolve().suffix
+        self.signalcount=meta['chancount']
+        self.sweepcount=meta['sweepcount']
+        self.chancount=meta['chancount']
+        self.samplecount=meta['samplecount']
+        self.sampling_rate=meta['sampling_rate']*pq.Hz
+
+    def _channel(self,channel,filter):
+        valid=[c for c in range(self.chancount) if str(pq.Quantity(1.0,self.units[c]).units).endswith(filter)]
+        if not len(valid):
+            logging.getLogger(__name__).error(f"No signal with units {filter}")
+            return
+        return valid[channel]
+
+    def _source(self):
+        if self.source is None:
+            logging.getLogger(__name__).debug(f"Reading uncached channels from {self.path}")
+            self.source=_open(self.path,self.lazy)
+        return self.source
+
+    def signal(self,channel,filter='V'):
+        c=self._channel(channel,filter)
+        if c is None:
+            return
+        if self.arrays[c] is None:
+            return self._source().signal(channel,filter)
+        sigs=LazySignals([_CachedSweep(self.arrays[c],s,self.units[c],self.sampling_rate) for s in range(self.sweepcount)])
+        return sigs if self.lazy else list(sigs)
+
+    def matrix(self,channel,filter='V'):
+        ## no need to build signals. just copy the memory mapped array
+        c=self._channel(channel,filter)
+        if c is None:
+            return
+        if self.arrays[c] is None:
+            return self._source().matrix(channel,filter)
+        return SweepMatrix(np.array(self.arrays[c]),self.units[c],1.0/float(self.sampling_rate.magnitude),levels=self._levels(self.sweepcount))
+
+    def tocache(self,folder=None,maxsize=0):
+        pass
 
 class ABFprotocol:
     def __init__(self,exp):
@@ -75,7 +324,7 @@ class ABFprotocol:
         self.name=str(exp.file._axon_info["sProtocolPath"]).split('/')[-1]
         ## epochtype:enum(step,ramp,pulse,train,biphasic_train,triangle_train,cosine_train).old versions do not have trains
         ## units are pA and samples!
-        self.samplecount=len(exp.blk.segments[0].analogsignals[0]) ##assumes uniform sampling
+        self.samplecount=exp.blk.segments[0].analogsignals[0].shape[0] ##assumes uniform sampling
         self.sampling_rate=int(exp.blk.segments[0].analogsignals[0].sampling_rate)
         self.offset_p=np.floor(self.samplecount/64)
         self.offset_t=float(np.floor(self.samplecount/64)/self.sampling_rate)
@@ -112,7 +361,7 @@ class ABFprotocol:
         self.name=str(exp.file._axon_info["sProtocolPath"]).split('/')[-1]
         ## epochtype:enum(step,ramp,pulse,train,biphasic_train,triangle_train,cosine_train).old versions do not have trains
         ## units are pA and samples!
-        self.samplecount=len(exp.blk.segments[0].analogsignals[0]) ##assumes uniform sampling
+        self.samplecount=exp.blk.segments[0].analogsignals[0].shape[0] ##assumes uniform sampling
         self.sampling_rate=int(exp.blk.segments[0].analogsignals[0].sampling_rate)
         self.offset_p=np.floor(self.samplecount/64)
         self.offset_t=float(np.floor(self.samplecount/64)/self.sampling_rate)
@@ -143,9 +392,10 @@ class ABFprotocol:
         return {'steps':steps}
   
 class ABFexperiment(GENexperiment):
-    def __init__(self,filename,**kwargs):
+    def __init__(self,filename,lazy=False,**kwargs):
         self.file=neo.io.AxonIO(str(filename))
-        self.blk=self.file.read_block(signal_group_mode='split-all')
+        self.lazy=lazy
+        self.blk=self.file.read_block(lazy=lazy,signal_group_mode='split-all')
         #self.protocol=ABFprotocol(self,exp)
         #super(ABFexperiment,self).__init__(filename)
         super(ABFexperiment,self).__init__(filename)
@@ -254,9 +504,10 @@ class AXGprotocol:
         #[s['lvl'] for i in exp.protocol.assteps()['steps'] ]
 
 class AXGexperiment(GENexperiment):
-    def __init__(self,filename):
+    def __init__(self,filename,lazy=False):
         self.file=neo.io.AxographIO(str(filename))
-        self.blk=self.file.read_block(signal_group_mode='split-all')
+        self.lazy=lazy
+        self.blk=self.file.read_block(lazy=lazy,signal_group_mode='split-all')
         self.protocol=AXGprotocol(self)
         super(AXGexperiment,self).__init__(filename)
 
@@ -284,6 +535,7 @@ class MATYexperiment(GENexperiment):
     """only used for merged ccsteps files"""
     def __init__(self,filename):
         self.file=neo.io.NeoMatlabIO(str(filename))
+        self.lazy=False                     ## NeoMatlabIO does not support lazy loading
         self.blk=self.file.read_block()
         self.protocol=MATYprotocol(self)
         super(MATYexperiment,self).__init__(filename)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''on disk cache for decoded experiments.
+each entry is a folder named after the fingerprint of the source file and holds
+    meta.json   : experiment fields (sampling rate, counts, channel units, cached channels,...)
+    chanN.npy   : one (sweepcount,samplecount) array per cached channel, rescaled to V or A
+    protocol.pkl: the parsed protocol object
+only the channels used by the analysis are cached. arrays are stored as plain .npy files, so that they can be memory
+mapped on load. all entries are in a single folder (CACHE_FOLDER by default), so that its size bounds the disk space
+used by the cache. the modification time of meta.json is touched on each hit and used for LRU eviction
+'''
+
+import os,json,pickle,shutil,hashlib,pathlib,logging,uuid
+import numpy as np
+
+CACHE_FOLDER=pathlib.Path.home()/".cache"/"intrinsic"/"experiments"
+CHUNK=1<<20                                 ## size of head and tail chunks used for content hash
+_usage={}                                   ## estimated size of each cache folder for this process
+
+def cachefolder(filename,folder=None):
+    '''returns the cache folder for filename. defaults to CACHE_FOLDER, shared by all files'''
+    if folder:
+        return pathlib.Path(folder)
+    return CACHE_FOLDER
+
+def fingerprint(filename):
+    '''hash of path, size, mtime and of the first and last CHUNK bytes of filename'''
+    path=pathlib.Path(filename).resolve()
+    st=path.stat()
+    h=hashlib.blake2b(digest_size=16)
+    h.update(f"{path}|{st.st_size}|{st.st_mtime_ns}".encode('utf-8'))
+    with open(path,'rb') as f:
+        h.update(f.read(CHUNK))
+        if st.st_size>CHUNK:
+            f.seek(max(CHUNK,st.st_size-CHUNK))
+            h.update(f.read(CHUNK))
+    return h.hexdigest()
+
+def lookup(filename,folder=None):
+    '''returns the entry folder for filename, or None if file is not cached'''
+    try:
+        entry=cachefolder(filename,folder)/fingerprint(filename)
+        if (entry/"meta.json").is_file():
+            os.utime(entry/"meta.json")     ## LRU
+            return entry
+    except OSError:
+        pass
+    return None
+
+def load(entry,mmap=True):
+    '''returns meta, list of channel arrays and protocol for a cache entry'''
+    with open(entry/"meta.json",'r') as f:
+        meta=json.load(f)
+    cached=meta.get('channels',range(meta['chancount']))
+    arrays=[np.load(entry/f"chan{c}.npy",mmap_mode='r' if mmap else None) if c in cached else None for c in range(meta['chancount'])]
+    with open(entry/"protocol.pkl",'rb') as f:
+        protocol=pickle.load(f)
+    return meta,arrays,protocol
+
+def store(filename,meta,channels,protocol,folder=None,maxsize=0):
+    '''writes a cache entry for filename.
+    channels is a dict {channel index: sweeps} where sweeps is a sequence of 1d arrays (magnitudes in V or A)
+    meta must hold the units of all channels of the file
+    the entry is written to a temporary folder and renamed, so that concurrent readers never see partial entries
+    maxsize is the size (bytes) of the cache folder above which least recently used entries are removed
+    '''
+    root=cachefolder(filename,folder)
+    entry=root/fingerprint(filename)
+    if entry.is_dir():
+        return entry
+    tmp=root/f".tmp-{uuid.uuid4().hex}"
+    try:
+        tmp.mkdir(parents=True)
+        meta=dict(meta,source=str(pathlib.Path(filename).resolve()),channels=sorted(channels))
+        for c,sweeps in channels.items():
+            first=np.asarray(sweeps[0])
+            arr=np.lib.format.open_memmap(tmp/f"chan{c}.npy",mode='w+',dtype=first.dtype,shape=(len(sweeps),first.shape[0]))
+            for s in range(len(sweeps)):
+                arr[s]=np.asarray(sweeps[s]).reshape(-1)
+            arr.flush()
+            del arr
+        with open(tmp/"protocol.pkl",'wb') as f:
+            pickle.dump(protocol,f,protocol=pickle.HIGHEST_PROTOCOL)
+        with open(tmp/"meta.json",'w') as f:
+            json.dump(meta,f)
+        os.replace(tmp,entry)
+    except Exception as e:
+        shutil.rmtree(tmp,ignore_errors=True)
+        if entry.is_dir():                  ## another process created the same entry
+            return entry
+        logging.getLogger(__name__).warning(f"Could not cache {filename}: {e}")
+        return None
+    if maxsize>0:
+        if str(root) not in _usage:
+            _usage[str(root)]=_foldersize(root)
+        else:
+            _usage[str(root)]+=_foldersize(entry)
+        if _usage[str(root)]>maxsize:
+            _usage[str(root)]=evict(root,maxsize)
+    return entry
+
+def _foldersize(path):
+    size=0
+    for e in os.scandir(path):
+        if e.is_dir(follow_symlinks=False):
+            size+=_foldersize(e.path)
+        else:
+            size+=e.stat(follow_symlinks=False).st_size
+    return size
+
+def evict(root,maxsize):
+    '''removes least recently used entries from root until its size is below maxsize. returns new size'''
+    entries=[]
+    for e in os.scandir(root):
+        if e.is_dir(follow_symlinks=False) and not e.name.startswith('.'):
+            try:
+                entries.append( (os.stat(os.path.join(e.path,"meta.json")).st_mtime,_foldersize(e.path),e.path) )
+            except OSError:
+                continue
+    entries.sort()
+    size=sum(s for _,s,_ in entries)
+    for _,s,path in entries:
+        if size<=maxsize:
+            break
+        shutil.rmtree(path,ignore_errors=True)
+        logging.getLogger(__name__).debug(f"Evicted {path} from cache")
+        size-=s
+    return size
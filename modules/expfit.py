@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''exponential fitting engine used by XYFitter.
+models are sums of decaying exponentials plus a constant:
+    exp1: y=a*exp(-(x-o)/b)+c
+    exp2: y=a*exp(-(x-o)/b)+c*exp(-(x-o)/d)+e
+initial time constants are obtained without any guess nor iteration, by linear regression of the data on its integrals
+(J. Jacquelin, regressions et equations integrales). amplitudes and offset are then solved by linear least squares.
+estimates are refined by scipy.optimize.curve_fit with analytic jacobians
+'''
+
+import numpy as np
+import scipy
+
+def _integrals(x,y):
+    ## first and second cumulative integrals of y (trapezoidal rule), starting at x[0]
+    s1=np.concatenate([[0.0],np.cumsum((y[1:]+y[:-1])*np.diff(x)/2)])
+    s2=np.concatenate([[0.0],np.cumsum((s1[1:]+s1[:-1])*np.diff(x)/2)])
+    return s1,s2
+
+def _valid(taus):
+    return all(np.isfinite(t) and t>0 for t in taus)
+
+def taus1(x,y):
+    '''time constant of y=a*exp(-x/b)+c, or None.
+    y-y0 = -1/b*S1 + c/b*(x-x0), where S1 is the integral of y
+    '''
+    x=np.asarray(x,dtype=np.float64)
+    y=np.asarray(y,dtype=np.float64)
+    if len(x)<4:
+        return None
+    s1,_=_integrals(x,y)
+    m=np.column_stack([s1,x-x[0]])
+    try:
+        (p,q),*_=np.linalg.lstsq(m,y-y[0],rcond=None)
+    except np.linalg.LinAlgError:
+        return None
+    taus=[-1.0/p] if p!=0 else [np.nan]
+    return taus if _valid(taus) else None
+
+def taus2(x,y):
+    '''time constants (slow first) of y=a*exp(-x/b)+c*exp(-x/d)+e, or None.
+    y''-(r1+r2)y'+r1*r2*y=r1*r2*e integrates twice to y-y0 = (r1+r2)*S1 - r1*r2*S2 + polynomial of degree 2 in (x-x0)
+    r1 and r2 (=-1/b, -1/d) are the roots of r^2-A*r-B, A and B being the regression coefficients of S1 and S2
+    '''
+    x=np.asarray(x,dtype=np.float64)
+    y=np.asarray(y,dtype=np.float64)
+    if len(x)<6:
+        return None
+    s1,s2=_integrals(x,y)
+    dx=x-x[0]
+    m=np.column_stack([s1,s2,dx,dx*dx])
+    try:
+        (A,B,_,_),*_=np.linalg.lstsq(m,y-y[0],rcond=None)
+    except np.linalg.LinAlgError:
+        return None
+    delta=A*A+4*B
+    if not np.isfinite(delta) or delta<=0:
+        return None
+    r=[(A-np.sqrt(delta))/2,(A+np.sqrt(delta))/2]
+    if r[0]>=0 or r[1]>=0:
+        return None
+    taus=sorted([-1.0/r[0],-1.0/r[1]],reverse=True)
+    return taus if _valid(taus) else None
+
+def amplitudes(x,y,taus,o=0.0):
+    '''linear least squares amplitudes for fixed time constants: returns [a1,...,an,c]'''
+    x=np.asarray(x,dtype=np.float64)
+    m=np.column_stack([np.exp(-(x-o)/t) for t in taus]+[np.ones_like(x)])
+    p,*_=np.linalg.lstsq(m,np.asarray(y,dtype=np.float64),rcond=None)
+    return list(p)
+
+def estimate(x,y,order,o=0.0):
+    '''initial parameters [a,b,c] (order 1) or [a,b,c,d,e] (order 2) for exponentials starting at o, or None.
+    x is shifted to start at 0 for time constant estimation. when a double exponential can not be resolved,
+    the single exponential time constant is split in a slow and a fast component
+    '''
+    x=np.asarray(x,dtype=np.float64)
+    taus=taus1(x-x[0],y) if order==1 else taus2(x-x[0],y)
+    if taus is None and order==2:
+        t=taus1(x-x[0],y)
+        taus=None if t is None else [t[0],t[0]/10]
+    if taus is None:
+        return None
+    p=amplitudes(x,y,taus,o)
+    if order==1:
+        return [p[0],taus[0],p[1]]
+    return [p[0],taus[0],p[1],taus[1],p[2]]
+
+## analytic jacobians, in the parameter order of XYFitter fit functions
+def jac1expnoo(x,a,b,c):
+    e=np.exp(-x/b)
+    return np.column_stack([e,a*e*x/b**2,np.ones_like(x)])
+
+def jac2expnoo(x,a,b,c,d,e):
+    e1=np.exp(-x/b)
+    e2=np.exp(-x/d)
+    return np.column_stack([e1,a*e1*x/b**2,e2,c*e2*x/d**2,np.ones_like(x)])
+
+def jac1exp(x,a,b,c,o):
+    e=np.exp(-(x-o)/b)
+    return np.column_stack([e,a*e*(x-o)/b**2,np.ones_like(x),a*e/b])
+
+def jac2exp(x,a,b,c,d,e,o):
+    e1=np.exp(-(x-o)/b)
+    e2=np.exp(-(x-o)/d)
+    return np.column_stack([e1,a*e1*(x-o)/b**2,e2,c*e2*(x-o)/d**2,np.ones_like(x),a*e1/b+c*e2/d])
+
+def fit(func,jac,x,y,p0,maxfev):
+    '''least squares refinement of p0. raises on failure, as curve_fit does'''
+    pot,_=scipy.optimize.curve_fit(func,x,y,p0=tuple(p0),jac=jac,maxfev=maxfev)
+    if not np.all(np.isfinite(pot)):
+        raise RuntimeError("Fit did not converge")
+    return pot
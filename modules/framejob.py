@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''background processing of all the frames of an interactive protocol.
+copies of the frames are processed in a thread (the heavy measurements of some protocols being first done in the frame
+pool, see BaseProtocol.precompute), while the gui keeps running. a timer of the figure reports progress, and replaces
+all the frames at once when the copies are done. frames processed from the gui in the meantime are kept. if the
+parameters of the protocol changed during the run, results are discarded and the job starts again
+'''
+
+import copy,threading,logging
+
+class framejob:
+    def __init__(self,protocol,bitmask=0xFFFF,period=100):
+        self.protocol=protocol
+        self.bitmask=bitmask
+        self.context=protocol.cfg
+        self.frames=[copy.copy(f) for f in protocol.frames]
+        self.done=0
+        self.error=None
+        self.touched=set()                  ## frames processed from the gui while the job runs. they are not replaced
+        self.cancelled=threading.Event()
+        self.thread=threading.Thread(target=self._run,daemon=True)
+        self.timer=protocol._fig().canvas.new_timer(interval=period)
+        self.timer.add_callback(self._poll)
+        self.thread.start()
+        self.timer.start()
+
+    def _run(self):
+        try:
+            self.protocol.precompute()
+            for f in self.frames:
+                if self.cancelled.is_set():
+                    return
+                f.process(self.bitmask)
+                self.done+=1
+        except Exception as e:
+            self.error=e
+
+    def running(self):
+        return self.thread.is_alive() or self.timer is not None
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _message(self,text):
+        canvas=self.protocol._fig().canvas
+        toolmanager=getattr(canvas.manager,'toolmanager',None) if canvas.manager else None
+        if toolmanager is not None:
+            toolmanager.message_event(text)
+        elif getattr(canvas,'toolbar',None) is not None:
+            canvas.toolbar.set_message(text)
+
+    def _poll(self):
+        ## runs in the gui thread
+        if self.thread.is_alive():
+            self._message(f"Processing frames {self.done}/{len(self.frames)}. Apply to all again to cancel")
+            return
+        self.timer.stop()
+        self.timer=None
+        if self.cancelled.is_set():
+            self._message("Processing cancelled")
+            return
+        if self.error is not None:
+            logging.getLogger(__name__).error(f"Could not process all frames: {self.error}")
+            self._message("Processing failed")
+            return
+        if self.protocol.cfg is not self.context:
+            logging.getLogger(__name__).info("Parameters changed while processing frames. Processing again")
+            self.protocol.job=framejob(self.protocol,self.bitmask)
+            return
+        for e,f in enumerate(self.frames):
+            if not e in self.touched:
+                f.enabled=self.protocol.frames[e].enabled
+                self.protocol.frames[e]=f
+        self._message("")
+        self.protocol.draw(False)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''frame level parallelism.
+the sweeps of a protocol are copied once into a shared memory block (sweepcount,samplecount), and their time vector in another one.
+a long lived pool of worker processes attaches to these blocks by name, and runs peak detection, spike measurements
+and membrane time constant fits for the rows it is given. only compact results (peak positions, spike tables, fitters) are sent back.
+the pool is created on first use and kept until the program exits
+'''
+
+import os,atexit,logging
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from spiketable import findpeaks,spiketable
+from xyfitter import XYFitter
+
+_executor=None                              ## parent process: the worker pool
+_jobs=0
+_attached={}                                ## worker process: name -> (SharedMemory, array) for current blocks
+
+def pool(jobs=0):
+    '''returns the worker pool, creating it if required. jobs=0: one worker per cpu'''
+    global _executor,_jobs
+    jobs=jobs if jobs>0 else (os.cpu_count() or 1)
+    if _executor is not None and _jobs!=jobs:
+        shutdown()
+    if _executor is None:
+        _executor=ProcessPoolExecutor(max_workers=jobs)
+        _jobs=jobs
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True,cancel_futures=True)
+        _executor=None
+
+atexit.register(shutdown)
+
+class SharedArray:
+    '''numpy array in a shared memory block. the parent creates it, workers rebuild it from its description'''
+    def __init__(self,data):
+        data=np.ascontiguousarray(data)
+        self.shm=shared_memory.SharedMemory(create=True,size=max(1,data.nbytes))
+        self.array=np.ndarray(data.shape,dtype=data.dtype,buffer=self.shm.buf)
+        self.array[...]=data
+
+    def description(self):
+        return (self.shm.name,self.array.shape,self.array.dtype.str)
+
+    def close(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+def _attach(desc):
+    ## workers keep the blocks of the current protocol attached, and release the previous ones
+    name,shape,dtype=desc
+    if not name in _attached:
+        shm=shared_memory.SharedMemory(name=name)
+        _attached[name]=(shm,np.ndarray(shape,dtype=np.dtype(dtype),buffer=shm.buf))
+    return _attached[name][1]
+
+def _release(keep):
+    for name in [n for n in _attached if not n in keep]:
+        shm,_=_attached.pop(name)
+        shm.close()
+
+def _measure(vdesc,tdesc,row,spikeargs,fitargs):
+    '''worker task: spikes and/or time constant fit for one row of the shared sweeps'''
+    _release((vdesc[0],tdesc[0]))
+    volts=_attach(vdesc)[row]
+    times=_attach(tdesc)
+    r={}
+    if spikeargs is not None:
+        sr,height,prominence,distance,pre,post,dvthreshold,lowest,smooth=spikeargs
+        peaks=findpeaks(volts,sr,height,prominence,distance,pre,post)
+        r['spikes']=(peaks,)+spiketable(volts,times,sr,peaks,pre,post,dvthreshold,lowest,smooth)
+    if fitargs is not None:
+        i0,i1,order,weighted,fitstart,maxfev,version=fitargs
+        r['fitter']=XYFitter(times[i0:i1].copy(),volts[i0:i1].copy(),order,weighted,fitstart,maxfev=maxfev,version=version)
+    return r
+
+def measure(data,times,tasks,jobs=0):
+    '''runs tasks [(row,spikeargs,fitargs),...] on rows of data (sweepcount,samplecount) in the worker pool.
+    spikeargs: (sr,height,prominence,distance,pre,post,dvthreshold,lowest,smooth) or None
+    fitargs:   (i0,i1,order,weighted,fitstart,maxfev,version) or None
+    returns the list of results (dicts with keys 'spikes' and 'fitter'), or None if the pool failed
+    '''
+    if len(tasks)==0:
+        return []
+    vblock=SharedArray(data)
+    tblock=SharedArray(times)
+    try:
+        futures=[pool(jobs).submit(_measure,vblock.description(),tblock.description(),row,s,f) for row,s,f in tasks]
+        return [f.result() for f in futures]
+    except (BrokenProcessPool,OSError) as e:
+        logging.getLogger(__name__).warning(f"Frame pool failed, frames will be processed sequentially: {e}")
+        shutdown()
+        return None
+    finally:
+        vblock.close()
+        tblock.close()
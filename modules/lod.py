@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''level of detail rendering of long traces.
+a min/max pyramid is built (once, level by level as required) for each long trace: each level keeps the minimum and the
+maximum of groups of FACTOR bins of the previous level, in time order, so that the envelope of the trace is exact at all
+levels. when the x limits of an axes change, its traces are replaced by the part of the coarsest level that still gives
+two points per pixel column in view. x must be increasing
+'''
+
+import weakref
+import numpy as np
+
+MINPOINTS=20000                             ## traces shorter than this are plotted as is
+FACTOR=4                                    ## each level has FACTOR times less points than the previous one
+DEFAULT_PIXELS=2000                         ## used when the axes is not laid out yet
+
+_pyramids=weakref.WeakKeyDictionary()       ## line -> pyramid
+_connected=weakref.WeakSet()                ## axes that update their traces when x limits change
+
+def _reduce(x,y,group):
+    ## min and max of each group of points, in time order
+    n=len(y)//group*group
+    xs,ys=[],[]
+    if n>0:
+        yv=y[:n].reshape(-1,group)
+        idx=np.stack([np.argmin(yv,axis=1),np.argmax(yv,axis=1)],axis=1)
+        idx.sort(axis=1)
+        idx=(idx+np.arange(0,n,group)[:,None]).ravel()
+        xs.append(x[idx])
+        ys.append(y[idx])
+    if n<len(y):
+        tail=np.sort([n+np.argmin(y[n:]),n+np.argmax(y[n:])])
+        xs.append(x[tail])
+        ys.append(y[tail])
+    return np.concatenate(xs),np.concatenate(ys)
+
+class Pyramid:
+    def __init__(self,x,y):
+        self.levels=[(np.asarray(x),np.asarray(y))]
+
+    def level(self,k):
+        ## builds missing levels up to k (or up to the coarsest useful one)
+        while len(self.levels)<=k and len(self.levels[-1][1])>4*FACTOR:
+            self.levels.append(_reduce(*self.levels[-1],2*FACTOR))
+        return self.levels[min(k,len(self.levels)-1)]
+
+    def view(self,xlo,xhi,pixels):
+        '''x and y data of the trace between xlo and xhi, for an axes pixels wide'''
+        x,_=self.levels[0]
+        lo,hi=np.searchsorted(x,[xlo,xhi])
+        visible=max(hi-lo,1)
+        k=0
+        while visible/FACTOR**(k+1)>=2*pixels:
+            k+=1
+        x,y=self.level(k)
+        lo,hi=np.searchsorted(x,[xlo,xhi])
+        lo=max(lo-1,0)
+        hi=min(hi+1,len(x))
+        return x[lo:hi],y[lo:hi]
+
+def _pixels(ax):
+    w=int(ax.bbox.width)
+    return w if w>0 else DEFAULT_PIXELS
+
+def plot(ax,x,y,*args,**kwargs):
+    '''same as ax.plot(x,y,...) for a single trace, but long traces are rendered from their min/max pyramid. returns the line'''
+    x=np.asarray(x)
+    y=np.asarray(y)
+    if len(y)<MINPOINTS:
+        return ax.plot(x,y,*args,**kwargs)[0]
+    p=Pyramid(x,y)
+    line,=ax.plot(*p.view(x[0],x[-1],_pixels(ax)),*args,**kwargs)
+    _pyramids[line]=p
+    if not ax in _connected:
+        ax.callbacks.connect('xlim_changed',update)
+        _connected.add(ax)
+    return line
+
+def update(ax):
+    '''swaps in the level of each trace of ax that matches current x limits and axes width'''
+    xlo,xhi=ax.get_xlim()
+    pixels=_pixels(ax)
+    for line in ax.lines:
+        p=_pyramids.get(line)
+        if p is not None:
+            line.set_data(*p.view(xlo,xhi,pixels))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''single pass discovery of data files.
+the tree is walked once with os.scandir, and each folder is listed once, whatever the number of extensions.
+the manifest maps each folder to its candidate files (path, size, mtime), in the order pathlib.glob would give them
+(grouped by extension, directory order within each extension). as with glob, hidden files and folders are included:
+hidden files are only left out through skip (ITSQ_SKIP_FILES).
+the listings can be saved to a json file and reused for the folders whose modification time did not change
+(adding or removing a file changes the modification time of its folder)
+'''
+
+import os,json,time,pathlib,logging
+
+VERSION=2                                   ## listings saved by previous versions left hidden entries out
+MARGIN=2.0                                  ## listings made less than MARGIN s after a folder was modified are never reused
+
+class Manifest:
+    def __init__(self,extensions,skip=(),path=None):
+        self.extensions=list(extensions)
+        self.skip=tuple(skip)
+        self.path=path
+        self.listings={}                    ## folder -> (mtime_ns,scanned,[subfolder names],[(name,size,mtime_ns),...])
+        self.reused=0
+        self.fresh=set()                    ## folders listed by this object
+        if path and os.path.isfile(path):
+            try:
+                with open(path,'r') as f:
+                    d=json.load(f)
+                if d['version']==VERSION and d['extensions']==self.extensions:
+                    self.listings={k:(v[0],v[1],v[2],[tuple(e) for e in v[3]]) for k,v in d['listings'].items()}
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"Could not read manifest {path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        tmp=f"{self.path}.tmp"
+        try:
+            with open(tmp,'w') as f:
+                json.dump({'version':VERSION,'extensions':self.extensions,'listings':self.listings},f)
+            os.replace(tmp,self.path)
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Could not save manifest {self.path}: {e}")
+
+    def _match(self,name):
+        ## index of the extension of name, or None
+        name=os.path.normcase(name)
+        for i,ext in enumerate(self.extensions):
+            if name.endswith(os.path.normcase(ext)):
+                return i
+        return None
+
+    def _list(self,folder):
+        ## subfolders and candidate files of folder, from the saved listing if folder did not change
+        try:
+            mtime=os.stat(folder).st_mtime_ns
+        except OSError:
+            return [],[]
+        cached=self.listings.get(folder)
+        if folder in self.fresh:
+            return cached[2],cached[3]
+        if cached is not None and cached[0]==mtime and cached[1]-mtime/1e9>MARGIN:
+            self.reused+=1
+            return cached[2],cached[3]
+        subfolders,files=[],[]
+        scanned=time.time()
+        try:
+            with os.scandir(folder) as it:
+                for e in it:
+                    try:
+                        if e.is_dir(follow_symlinks=False):
+                            subfolders.append(e.name)
+                        elif self._match(e.name) is not None and e.is_file():
+                            st=e.stat()
+                            files.append((e.name,st.st_size,st.st_mtime_ns))
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Could not list {folder}: {e}")
+            return [],[]
+        self.listings[folder]=(mtime,scanned,subfolders,files)
+        self.fresh.add(folder)
+        return subfolders,files
+
+    def files(self,folder):
+        '''candidate files of folder [(path,size,mtime_ns),...], grouped by extension. files starting with one of skip are left out'''
+        folder=str(folder)
+        _,files=self._list(folder)
+        files=[f for f in files if not f[0].startswith(self.skip)]
+        files.sort(key=lambda f:self._match(f[0]))  ## stable: directory order within each extension
+        return [(pathlib.Path(folder)/name,size,mtime) for name,size,mtime in files]
+
+    def walk(self,root):
+        '''returns {folder: files} for root and all folders below it that hold candidate files. folders are sorted'''
+        found={}
+        stack=[str(root)]
+        while stack:
+            folder=stack.pop()
+            subfolders,_=self._list(folder)
+            files=self.files(folder)
+            if len(files)>0:
+                found[pathlib.Path(folder)]=files
+            stack.extend(os.path.join(folder,s) for s in subfolders)
+        return {k:found[k] for k in sorted(found)}
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''wx frame hosting a matplotlib figure. kept apart from baseprotocol, so that protocols can be imported without wx'''
+
+import wx
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_wxagg import (
+    FigureCanvasWxAgg as FigureCanvas,
+    NavigationToolbar2WxAgg
+    )
+class ModalFrame(wx.Frame):
+    def __init__(self, parent, title):
+        wx.Frame.__init__(self, parent, title=title, style=wx.DEFAULT_FRAME_STYLE|wx.STAY_ON_TOP)
+        self.fig = Figure((1,1))
+        #plt.gcf=lambda:self.fig ## awfull hack! (really awfull)
+        super().__init__(parent, -1)
+        self.canvas = FigureCanvas(self, -1, self.fig)
+        self.toolbar = NavigationToolbar2WxAgg(self.canvas)  # matplotlib toolbar
+        self.toolbar.Realize()
+
+        # Now put all into a sizer
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        # Best to allow the toolbar to resize!
+        sizer.Add(self.toolbar, 0, wx.EXPAND)
+        # This way of adding to sizer allows resizing
+        sizer.Add(self.canvas, 1, wx.LEFT | wx.TOP | wx.EXPAND)
+        self.SetSizer(sizer)
+        self.Fit()
+        self.Bind(wx.EVT_CLOSE, self.onClose) # (Allows main window close to work)
+
+    def onClose(self, event):
+        self.MakeModal(False) # (Re-enables parent window)
+        self.eventLoop.Exit()
+        self.Destroy() # (Closes window without recursion errors)
+
+    def ShowModal(self):
+        self.MakeModal(True) # (Explicit call to MakeModal)
+        self.Show()
+        self.eventLoop = wx.EventLoop()
+        self.eventLoop.Run()
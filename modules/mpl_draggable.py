@@ -9,22 +9,33 @@
 # modification, are permitted under the terms of the BSD License. See
 # LICENSE file in the root of the Project.
 
+import time
 import matplotlib.pyplot as plt
 import matplotlib.lines as lines
+from mpl_layers import layers
 
 class draggable_line:
     cursorpositions=[]
-    def __init__(self, axes, kind, XorY, callback=None,colors=["black","red"],dashes=[1,1],blit=True):
+    def __init__(self, axes, kind, XorY, callback=None,colors=["black","red"],dashes=[1,1],blit=True,preview=None,interval=0.1):
         ## could add a spancolor that would go from cursor(n) to cursor(n+1)
         self.idx=len(draggable_line.cursorpositions)     ## index in the array of cursor positions
         self.cursorpositions.append(XorY)                ## mark position
         self.callback=callback                           ## callback to be called when cursor is released callback(idx,action,positions)
+        self.preview=preview                             ## callback called while the cursor is dragged preview(XorY). None: no live preview
+                                                         ## if preview is callback, callback is not called again on release at the last previewed position
+        self.interval=interval                           ## minimum time (s) between the end of a preview and the start of the next one
+        self.timer=None
+        self.pending=None                                ## last position not previewed yet
+        self.lastpreview=0.0
+        self.cost=0.0                                    ## duration of last preview
+        self.previewed=None                              ## last previewed position
         self.axes = axes
         self.o = kind
         self.XorY = XorY
         self.colors=colors
         self.lines=[]
         self.dashes=dashes
+        self.blit=blit
         for ax in self.axes:
             if kind == "h":
                 self.lines.append(ax.axhline(XorY,picker=2,color=self.colors[0],dashes=dashes,gid='hcursors'))
@@ -32,10 +43,11 @@ class draggable_line:
                 self.lines.append(ax.axvline(XorY,picker=2,color=self.colors[0],dashes=dashes,gid='vcursors'))
             ax.get_figure().canvas.draw_idle()
             if blit:
+                ## cursors are drawn over the background saved by the layer manager, with the markers
+                layers(ax.get_figure()).add('cursors',(ax,self),self.lines[-1])
                 ax.get_figure().canvas.mpl_connect('pick_event', self.clickonline_blit)
             else:
                 ax.get_figure().canvas.mpl_connect('pick_event', self.clickonline_draw)
-        self.bg=None
         self.fig=self.axes[0].get_figure()
 
     def clickonline_blit(self, event):
@@ -46,18 +58,9 @@ class draggable_line:
             index=clicks.index(True)
             self.follower = self.axes[index].get_figure().canvas.mpl_connect("motion_notify_event", self.followmouse_blit)
             self.releaser = self.axes[index].get_figure().canvas.mpl_connect("button_press_event", self.releaseonclick)
-            
             for e in range(len(self.lines)):
-                self.lines[e].set_linestyle('None')
-            self.axes[0].get_figure().canvas.draw()
-            self.bg = self.fig.canvas.copy_from_bbox(self.fig.bbox)
-
-            for e in range(len(self.lines)):
-                self.lines[e].set_linestyle('-')
-                self.lines[e].set_dashes(self.dashes)
                 self.lines[e].set_color(self.colors[1])
-                self.axes[e].draw_artist(self.lines[e])
-                self.axes[e].get_figure().canvas.draw_idle()
+            layers(self.fig).update()
 
     def clickonline_draw(self, event):
         clicks=[event.artist == l for l in self.lines]
@@ -73,15 +76,20 @@ class draggable_line:
         if self.o == "h":
             for e in range(len(self.lines)):
                 self.lines[e].set_ydata([XorY, XorY])
-            self.axes[0].get_figure().canvas.draw_idle()    ## drawing the figure canvas will draw all the lines!
             self.XorY = self.lines[0].get_ydata()[0]        ## need only one value (all lines share the same value)
         else:
             for e in range(len(self.lines)):
                 self.lines[e].set_xdata([XorY,XorY])
-            self.axes[0].get_figure().canvas.draw_idle()
             self.XorY = self.lines[0].get_xdata()[0]
+        self._redraw()
         self.cursorpositions[self.idx]=self.XorY
 
+    def _redraw(self):
+        if self.blit:
+            layers(self.fig).update()
+        else:
+            self.axes[0].get_figure().canvas.draw_idle()    ## drawing the figure canvas will draw all the lines!
+
     def getpos(self):
         if self.o == "h":
             self.XorY = self.lines[0].get_ydata()[0]        ## need only one value (all lines share the same value)
@@ -90,19 +98,16 @@ class draggable_line:
         return self.XorY
 
     def followmouse_blit(self, event):
-        self.fig.canvas.restore_region(self.bg)
         if self.o == "h":
             for e in range(len(self.lines)):
                 self.lines[e].set_ydata([event.ydata, event.ydata])
-                self.axes[e].draw_artist(self.lines[e])
-            self.fig.canvas.blit(self.fig.bbox)
             self.XorY = self.lines[0].get_ydata()[0]        ## need only one value (all lines share the same value)
         else:
             for e in range(len(self.lines)):
                 self.lines[e].set_xdata([event.xdata, event.xdata])
-                self.axes[e].draw_artist(self.lines[e])
-            self.fig.canvas.blit(self.fig.bbox)
             self.XorY = self.lines[0].get_xdata()[0]
+        layers(self.fig).update()
+        self._schedule()
         self.cursorpositions[self.idx]=self.XorY
         #if self.callback!=None:
         #    self.callback(self.idx,'motion',self.neighbours)
@@ -119,11 +124,40 @@ class draggable_line:
             self.axes[0].get_figure().canvas.draw_idle()
             self.XorY = self.lines[0].get_xdata()[0]
         self.cursorpositions[self.idx]=self.XorY
-        #if self.callback!=None:
-        #    self.callback(self.idx,'motion',self.neighbours)
+        self._schedule()
+
+    def _schedule(self):
+        ## motion events are coalesced: only the last position is previewed, and previews are spaced by
+        ## at least interval (or by the duration of the last preview, if longer), so that dragging stays smooth
+        if self.preview is None:
+            return
+        self.pending=self.XorY
+        if self.timer is None:
+            wait=max(self.interval,self.cost)-(time.perf_counter()-self.lastpreview)
+            self.timer=self.fig.canvas.new_timer(interval=max(int(wait*1000),1))
+            self.timer.single_shot=True
+            self.timer.add_callback(self._runpreview)
+            self.timer.start()
+
+    def _cancelpreview(self):
+        if self.timer is not None:
+            self.timer.stop()
+        self.timer=None
+        self.pending=None
+
+    def _runpreview(self):
+        self.timer=None
+        if self.pending is None:                         ## cancelled by release
+            return
+        XorY,self.pending=self.pending,None
+        start=time.perf_counter()
+        self.preview(XorY)
+        self.previewed=XorY
+        self.lastpreview=time.perf_counter()
+        self.cost=self.lastpreview-start
 
     def releaseonclick(self, event):
-        self.fig.canvas.blit(self.fig.bbox)
+        self._cancelpreview()
         if self.o == "h":
             self.XorY = self.lines[0].get_ydata()[0]
         else:
@@ -133,7 +167,10 @@ class draggable_line:
             self.lines[e].set_color(self.colors[0])
             self.axes[e].get_figure().canvas.mpl_disconnect(self.releaser)
             self.axes[e].get_figure().canvas.mpl_disconnect(self.follower)
-        self.axes[0].get_figure().canvas.draw_idle()
+        self._redraw()
+        previewed,self.previewed=self.previewed,None
+        if self.preview is self.callback and previewed==self.XorY:  ## already done by the last preview
+            return
         if self.callback!=None:
             #self.callback(self.idx,'release',self.neighbours)
             self.callback(self.XorY)
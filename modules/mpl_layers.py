@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''persistent artists drawn over a cached background (blitting).
+artists are grouped in layers, and identified in their layer by their axes and a key. they are created once, and updated
+in place afterwards (set_data, set_ydata, set_text). artists of a layer that are not updated between begin() and end()
+are hidden. the background (everything but layered artists) is saved after each full draw of the figure, so that
+update() only has to restore it and draw the layered artists over it.
+on backends that can not blit, layered artists are ordinary artists and update() falls back to draw_idle()
+'''
+
+import weakref
+
+_managers=weakref.WeakKeyDictionary()       ## figure -> layermanager
+
+def layers(fig):
+    '''the layer manager of fig'''
+    if not fig in _managers:
+        _managers[fig]=layermanager(fig)
+    return _managers[fig]
+
+class layermanager:
+    def __init__(self,fig):
+        self.fig=fig
+        self.layers={}                      ## layer -> {(axes,key): artist}
+        self.used=set()
+        self.bg=None
+        self.canvas=None
+        self._connect()
+
+    def _connect(self):
+        ## the canvas of a figure changes when the figure is embedded in a window
+        if self.fig.canvas is self.canvas:
+            return
+        self.canvas=self.fig.canvas
+        self.bg=None
+        self.blit=getattr(self.canvas,'supports_blit',False)
+        self.canvas.mpl_connect('draw_event',self._ondraw)
+
+    def _ondraw(self,event):
+        if not self.blit or event.canvas is not self.canvas:
+            return
+        self.bg=self.canvas.copy_from_bbox(self.fig.bbox)
+        self._drawartists()
+
+    def _drawartists(self):
+        for layer in self.layers.values():
+            for (ax,_),a in list(layer.items()):
+                if a.get_visible() and a.axes is ax and ax.figure is self.fig:
+                    ax.draw_artist(a)
+
+    def add(self,layer,key,artist):
+        '''puts artist (that belongs to axes key[0]) in layer'''
+        self._connect()
+        artist.set_animated(self.blit)
+        self.layers.setdefault(layer,{})[key]=artist
+        self.used.add((layer,key))
+        return artist
+
+    def _get(self,layer,key):
+        a=self.layers.get(layer,{}).get(key)
+        if a is None or a.axes is not key[0]:     ## removed from its axes
+            return None
+        self.used.add((layer,key))
+        a.set_visible(True)
+        return a
+
+    def begin(self,layer):
+        '''starts updating layer'''
+        self.used.difference_update([(layer,k) for k in self.layers.get(layer,{})])
+
+    def end(self,layer):
+        '''hides the artists of layer that were not updated since begin()'''
+        for k,a in self.layers.get(layer,{}).items():
+            if not (layer,k) in self.used:
+                a.set_visible(False)
+
+    def hide(self,ax,layer,keys):
+        '''hides the artists of ax in layer identified by keys, until they are updated again'''
+        for k in keys:
+            a=self.layers.get(layer,{}).get((ax,k))
+            if a is not None:
+                a.set_visible(False)
+
+    def line(self,ax,layer,key,x,y,*args,**kwargs):
+        '''same as ax.plot(x,y,*args,**kwargs). style arguments are only used when the line is created'''
+        a=self._get(layer,(ax,key))
+        if a is None:
+            a,=ax.plot(x,y,*args,**kwargs)
+            return self.add(layer,(ax,key),a)
+        a.set_data(x,y)
+        return a
+
+    def hline(self,ax,layer,key,y,**kwargs):
+        '''same as ax.axhline(y,**kwargs)'''
+        a=self._get(layer,(ax,key))
+        if a is None:
+            return self.add(layer,(ax,key),ax.axhline(y,**kwargs))
+        a.set_ydata([y,y])
+        return a
+
+    def title(self,ax,layer,text):
+        '''same as ax.set_title(text)'''
+        a=self._get(layer,(ax,'title'))
+        if a is None:
+            self.add(layer,(ax,'title'),ax.title)
+        ax.set_title(text)
+        return ax.title
+
+    def update(self):
+        '''draws the layered artists over the background'''
+        self._connect()
+        if not self.blit or self.bg is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.bg)
+        self._drawartists()
+        self.canvas.blit(self.fig.bbox)
@@ -14,10 +14,8 @@ from pathlib import Path
 import neo
 import numpy as np
 import quantities as pq
-import pandas as pd
 
 import scipy
-from scipy.signal import butter, lfilter, freqz
 
 def neo_idx(cls,t):
     return round(t*cls._sample_rate)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''selective re-analysis.
+when a file is analysed, the names of the parameters read during the analysis (the read set) are recorded,
+together with their values, the fingerprint of the file and the results, in @itsq/<stem>.rerun next to the data file.
+on the next run, the results are reused as long as the file and the values of these parameters did not change.
+changing a parameter that a protocol never reads (say, a spike threshold for a time constant protocol) does not trigger
+any new analysis. records made by another version of the analysis code (see codeversion) are never reused
+'''
+
+import os,pickle,hashlib,logging,pathlib,uuid
+
+from experimentcache import fingerprint
+
+VERSION=2                                   ## format of records
+SOURCES=['intrinsic.py','config.py','modules/*.py']   ## code that may change analysis results, relative to program folder
+_MISSING='@missing'                         ## value recorded for parameters that do not exist
+_codeversion=None
+
+def codeversion():
+    '''hash of the source files of the program (SOURCES). any change to the analysis code gives another value'''
+    global _codeversion
+    if _codeversion is None:
+        root=pathlib.Path(__file__).resolve().parent.parent
+        h=hashlib.blake2b(digest_size=16)
+        for pattern in SOURCES:
+            for path in sorted(root.glob(pattern)):
+                h.update(path.relative_to(root).as_posix().encode('utf-8'))
+                h.update(path.read_bytes().replace(b'\r\n',b'\n'))
+        _codeversion=h.hexdigest()
+    return _codeversion
+
+def recordfile(inpath):
+    path=pathlib.Path(inpath).resolve()
+    return path.parent/"@itsq"/f"{path.stem}.rerun"
+
+def _values(context,keys):
+    d={}
+    for k in keys:
+        try:
+            d[k]=getattr(context,k,_MISSING)
+        except Exception:                   ## dynamic parameter that can not be evaluated
+            d[k]=_MISSING
+    return d
+
+def _same(a,b):
+    try:
+        return bool(a==b)
+    except Exception:
+        return False
+
+def lookup(inpath,context):
+    '''returns the recorded results of inpath if the file and all the parameters recorded for it are unchanged, otherwise None'''
+    try:
+        with open(recordfile(inpath),'rb') as f:
+            record=pickle.load(f)
+        if record['version']!=VERSION or record['code']!=codeversion() or record['fingerprint']!=fingerprint(inpath):
+            return None
+    except Exception:
+        return None
+    current=_values(context,record['params'].keys())
+    if all(_same(v,current[k]) for k,v in record['params'].items()):
+        return record['results']
+    return None
+
+def store(inpath,context,reads,results):
+    '''records results of inpath, with the values in context of the parameters in reads'''
+    target=recordfile(inpath)
+    tmp=target.parent/f".{target.name}.{uuid.uuid4().hex}"
+    try:
+        target.parent.mkdir(exist_ok=True)
+        record={'version':VERSION,
+                'code':codeversion(),
+                'fingerprint':fingerprint(inpath),
+                'params':_values(context,sorted(reads)),
+                'results':results}
+        with open(tmp,'wb') as f:
+            pickle.dump(record,f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp,target)
+    except Exception as e:
+        if tmp.exists():
+            tmp.unlink()
+        logging.getLogger(__name__).warning(f"Could not record dependencies of {inpath}: {e}")
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''content addressed cache of analysis results.
+the results of a file are stored under a key that hashes the fingerprint of the file, a canonical
+representation of the resolved parameter values used for its analysis and the version of the analysis code (a hash of
+its source files, see rerun.codeversion). any change to the file, to any of these values or to the code gives another
+key, so that entries never need to be invalidated: unused ones are removed when the cache grows above its maximum size
+(least recently used first, the modification time of entries being touched on each hit). all entries are in a single
+folder (CACHE_FOLDER by default), so that its size bounds the disk space used by the cache
+'''
+
+import os,pickle,hashlib,pathlib,logging,uuid
+
+from experimentcache import fingerprint
+from rerun import codeversion
+
+CACHE_FOLDER=pathlib.Path.home()/".cache"/"intrinsic"/"results"
+VERSION=2                                   ## format of entries
+_usage={}                                   ## estimated size of each cache folder for this process
+
+def cachefolder(filename,folder=None):
+    '''returns the result cache folder for filename. defaults to CACHE_FOLDER, shared by all files'''
+    if folder:
+        return pathlib.Path(folder)
+    return CACHE_FOLDER
+
+def _canonical(value):
+    ## representation that does not depend on dict or set ordering
+    if isinstance(value,dict):
+        return ('dict',tuple(sorted((repr(k),_canonical(v)) for k,v in value.items())))
+    if isinstance(value,(set,frozenset)):
+        return ('set',tuple(sorted(repr(_canonical(v)) for v in value)))
+    if isinstance(value,(list,tuple)):
+        return (type(value).__name__,tuple(_canonical(v) for v in value))
+    return repr(value)
+
+def confighash(values):
+    '''canonical hash of a dict of parameter values'''
+    return hashlib.blake2b(repr(_canonical(values)).encode('utf-8'),digest_size=16).hexdigest()
+
+def key(filename,values):
+    '''cache key for the analysis of filename with parameter values'''
+    h=hashlib.blake2b(digest_size=16)
+    h.update(f"{VERSION}|{codeversion()}|{fingerprint(filename)}|{confighash(values)}".encode('utf-8'))
+    return h.hexdigest()
+
+def lookup(filename,key,folder=None):
+    '''returns the results stored under key, or None'''
+    entry=cachefolder(filename,folder)/f"{key}.pkl"
+    try:
+        with open(entry,'rb') as f:
+            results=pickle.load(f)
+        os.utime(entry)                     ## LRU
+        return results
+    except Exception:
+        return None
+
+def store(filename,key,results,folder=None,maxsize=0):
+    '''stores results under key. maxsize is the size (bytes) of the cache folder above which least recently used entries are removed'''
+    root=cachefolder(filename,folder)
+    entry=root/f"{key}.pkl"
+    tmp=root/f".tmp-{uuid.uuid4().hex}"
+    try:
+        root.mkdir(parents=True,exist_ok=True)
+        with open(tmp,'wb') as f:
+            pickle.dump(results,f,protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp,entry)
+    except Exception as e:
+        if tmp.exists():
+            tmp.unlink()
+        logging.getLogger(__name__).warning(f"Could not cache results of {filename}: {e}")
+        return
+    if maxsize>0:
+        if str(root) not in _usage:
+            _usage[str(root)]=_foldersize(root)
+        else:
+            _usage[str(root)]+=entry.stat().st_size
+        if _usage[str(root)]>maxsize:
+            _usage[str(root)]=evict(root,maxsize)
+
+def _foldersize(root):
+    return sum(e.stat().st_size for e in os.scandir(root) if e.is_file(follow_symlinks=False))
+
+def evict(root,maxsize):
+    '''removes least recently used entries from root until its size is below maxsize. returns new size'''
+    entries=[]
+    for e in os.scandir(root):
+        if e.is_file(follow_symlinks=False) and e.name.endswith('.pkl'):
+            try:
+                st=e.stat()
+                entries.append( (st.st_mtime,st.st_size,e.path) )
+            except OSError:
+                continue
+    entries.sort()
+    size=sum(s for _,s,_ in entries)
+    for _,s,path in entries:
+        if size<=maxsize:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        logging.getLogger(__name__).debug(f"Evicted {path} from result cache")
+        size-=s
+    return size
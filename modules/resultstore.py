@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''append only store of analysis results (sqlite).
+the results of each cell (a folder, or a single file) are committed as soon as they are available, so that an
+interrupted batch keeps everything analysed so far and can be resumed. each row also holds the key of the cell (a hash
+of the configuration and of the files of the cell), so that cells analysed with other parameters or files are not
+taken as done. csv, json and excel outputs are exported from the store
+'''
+
+import sqlite3,pickle,time,logging
+
+class ResultStore:
+    '''results of cells, by cell path. path=":memory:" gives a store that lives as long as the object'''
+    def __init__(self,path):
+        self.path=str(path)
+        self.db=sqlite3.connect(self.path)
+        if self.path!=":memory:":
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS cells (cell TEXT PRIMARY KEY, props BLOB NOT NULL, committed REAL NOT NULL, key TEXT)")
+        if not 'key' in [c[1] for c in self.db.execute("PRAGMA table_info(cells)")]:  ## store written by a previous version
+            self.db.execute("ALTER TABLE cells ADD COLUMN key TEXT")
+        self.db.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def clear(self):
+        with self.db:
+            self.db.execute("DELETE FROM cells")
+
+    def cells(self):
+        '''{cell: key} of committed cells'''
+        return dict(self.db.execute("SELECT cell,key FROM cells"))
+
+    def commit(self,cell,props,key=None):
+        '''stores (or replaces) the results of cell, and commits immediately'''
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO cells (cell,props,committed,key) VALUES (?,?,?,?)",
+                            (str(cell),pickle.dumps(props,protocol=pickle.HIGHEST_PROTOCOL),time.time(),key))
+        logging.getLogger(__name__).debug(f"Committed results of {cell}")
+
+    def get(self,cell,default=None):
+        row=self.db.execute("SELECT props FROM cells WHERE cell=?",(str(cell),)).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def dataframe(self,cells):
+        '''results of cells as a DataFrame, one column per cell (in the order of cells) and one row per field'''
+        import pandas as pd
+        return pd.DataFrame([self.get(c,{}) for c in cells]).T
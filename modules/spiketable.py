@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+'''spike feature extraction for all spikes of a frame at once.
+the windows [time-pre,time+post] of all spikes are stacked in a (spikes,samples) array,
+and thresholds and half widths are computed along axis 1. derivatives are computed once for the whole frame
+(optionally smoothed by a savitzky-golay filter), and the windows are taken from them.
+'''
+
+import numpy as np
+import scipy
+
+def findpeaks(volts,sr,height,prominence,distance,pre,post):
+    '''positions of spike peaks (samples). peaks too close to the edges of the frame to take pre and post points are skipped'''
+    sr=int(sr)
+    peaks,_=scipy.signal.find_peaks(volts,height=height,prominence=prominence,distance=int(distance*sr))
+    return [p for p in peaks if p>pre*sr and p<len(volts)-post*sr]
+
+def derivatives(volts,smooth=0,polyorder=3):
+    '''first and second derivatives of volts, per sample. with smooth>0, derivatives of a savitzky-golay fit
+    over smooth samples (rounded up to the next odd number)
+    '''
+    if smooth>0:
+        window=max(int(smooth)|1,polyorder+2|1)
+        return (scipy.signal.savgol_filter(volts,window,polyorder,deriv=1),
+                scipy.signal.savgol_filter(volts,window,polyorder,deriv=2))
+    dv=np.gradient(volts)
+    return dv,np.gradient(dv)
+
+def spike_dtype(vdtype=np.float64):
+    '''fields of the spike table. voltages keep the dtype of the signal'''
+    return np.dtype([('pos',np.int64),
+                     ('time',np.float64),
+                     ('peak',vdtype),
+                     ('maxrisepos',np.int64),
+                     ('maxrise',np.float64),            ## V/s
+                     ('maxfallpos',np.int64),
+                     ('maxfall',np.float64),            ## V/s
+                     ('thresholdpos1',np.float64),      ## threshold on 2nd derivative. nan if not found
+                     ('thresholdpos2',np.float64),      ## threshold on 1st derivative. nan if not found
+                     ('thresholdpos',np.float64),
+                     ('threshold',vdtype),
+                     ('amplitude',vdtype),
+                     ('halfvoltage',vdtype),
+                     ('hwstart',np.float64),
+                     ('hwstop',np.float64),
+                     ('halfwidth',np.float64),
+                     ('complete',np.bool_)])
+
+def _index(x,n):
+    ## python slice semantics for start/stop indices
+    x=np.where(x<0,x+n,x)
+    return np.clip(x,0,n)
+
+def _firstcrossing(d):
+    ## index of first True in each row, and whether there is one
+    return np.argmax(d,axis=1),d.any(axis=1)
+
+def _windowedges(w,dv,d2v):
+    ## unsmoothed derivatives are one sided at the edges of each spike window, as np.gradient of the window would give
+    if w.shape[1]<3:
+        dv[:]=np.gradient(w,axis=1)
+        d2v[:]=np.gradient(dv,axis=1)
+        return
+    dv[:,0]=w[:,1]-w[:,0]
+    dv[:,-1]=w[:,-1]-w[:,-2]
+    d2v[:,0]=dv[:,1]-dv[:,0]
+    d2v[:,1]=(dv[:,2]-dv[:,0])/2.
+    d2v[:,-2]=(dv[:,-1]-dv[:,-3])/2.
+    d2v[:,-1]=dv[:,-1]-dv[:,-2]
+
+def spiketable(volts,times,sr,peaks,pre,post,dvthreshold,lowest=True,smooth=0,derivs=None):
+    '''measures all spikes of a frame.
+    volts, times: 1d arrays (V,s). sr: sampling rate (Hz). peaks: positions of spike peaks (samples)
+    smooth: savitzky-golay window for derivatives (see derivatives()). 0: no smoothing
+    derivs: first and second derivatives of volts, as returned by derivatives(volts,smooth). computed if not given
+    returns the spike table (structured array, see spike_dtype), and for each spike
+    the voltage window and its first derivative (per sample) for phase plane analysis
+    '''
+    peaks=np.asarray(peaks,dtype=np.int64)
+    table=np.zeros(len(peaks),dtype=spike_dtype(volts.dtype))
+    ppv=[None]*len(peaks)
+    ppdv=[None]*len(peaks)
+    if len(peaks)==0:
+        return table,ppv,ppdv
+    dvs,d2vs=derivs if derivs is not None else derivatives(volts,smooth)
+    n=len(volts)
+    t=times[peaks]
+    i0=_index(np.rint((t-pre)*sr).astype(np.int64),n)
+    i1=_index(np.rint((t+post)*sr).astype(np.int64),n)
+    length=np.maximum(i1-i0,0)
+    off=peaks-int(pre*sr)
+    table['pos']=peaks
+    table['time']=t
+    table['peak']=volts[peaks]
+    ## rounding may change window length by one sample. process each length separately
+    for L in np.unique(length):
+        sel=np.flatnonzero(length==L)
+        idx=i0[sel,np.newaxis]+np.arange(L)
+        w=volts[idx]
+        dv=dvs[idx]
+        d2v=d2vs[idx]
+        if not smooth>0 and L>0:
+            _windowedges(w,dv,d2v)
+        o=off[sel]
+        table['maxrisepos'][sel]=np.argmax(dv,axis=1)+o
+        table['maxrise'][sel]=np.max(dv,axis=1).astype(np.float64)*sr
+        table['maxfallpos'][sel]=np.argmin(dv,axis=1)+o
+        table['maxfall'][sel]=np.min(dv,axis=1).astype(np.float64)*sr
+        pos1,has1=_firstcrossing(np.diff(np.signbit(d2v-float(dvthreshold)),axis=1))
+        pos2,has2=_firstcrossing(np.diff(np.signbit(dv-float(dvthreshold)),axis=1))
+        thr1=np.where(has1,pos1+o,np.nan)
+        thr2=np.where(has2,pos2+o,np.nan)
+        table['thresholdpos1'][sel]=thr1
+        table['thresholdpos2'][sel]=thr2
+        thr=np.fmin(thr1,thr2) if lowest else thr1
+        table['thresholdpos'][sel]=thr
+        ok=~np.isnan(thr)
+        threshold=np.full(len(sel),np.nan,dtype=volts.dtype)
+        threshold[ok]=volts[thr[ok].astype(np.int64)]
+        peak=table['peak'][sel]
+        halfvoltage=peak-(peak-threshold)/2
+        table['threshold'][sel]=threshold
+        table['amplitude'][sel]=peak-threshold
+        table['halfvoltage'][sel]=halfvoltage
+        ## first two crossings of half voltage
+        d=np.diff(np.signbit(w-halfvoltage[:,np.newaxis]),axis=1)
+        count=d.sum(axis=1)
+        first,_=_firstcrossing(d)
+        d[np.arange(len(sel)),first]=False
+        second,_=_firstcrossing(d)
+        hwstart=np.where(ok&(count>=1),first+o,np.nan)
+        hwstop=np.where(ok&(count>=2),second+o,np.nan)
+        table['hwstart'][sel]=hwstart
+        table['hwstop'][sel]=hwstop
+        table['halfwidth'][sel]=(hwstop-hwstart)/sr
+        table['complete'][sel]=ok&(count>=2)
+        for k,s in enumerate(sel):
+            ppv[s]=w[k]
+            ppdv[s]=dv[k]
+    return table,ppv,ppdv
+
+def ahpminima(volts,sr,pos,starts,stops):
+    '''position of voltage minimum between starts and stops (s) for each spike.
+    as for spike positions, the offset is the position of spike peak, not the start of window
+    '''
+    return np.array([p+np.argmin(volts[slice(int(round(t0*sr)),int(round(t1*sr)))]) for p,t0,t1 in zip(pos,starts,stops)],dtype=np.int64)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# Copyright (c)2020-2022, Yves Le Feuvre <yves.le-feuvre@u-bordeaux.fr>
+#
+# All rights reserved.
+#
+# This file is prt of the intrinsic program
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted under the terms of the BSD License. See
+# LICENSE file in the root of the Project.
+
+import numpy as np
+
+class SweepStats:
+    '''window statistics (mean, min, argmin, max) computed for all sweeps at once.
+    data is a (sweepcount,samplecount) array in SI units. windows are given in seconds and converted to samples
+    with the same rounding as neomonkey (sig.V(start,stop)), so that values are identical to per sweep measurements.
+    results are memoized by sample bounds: frames sharing the same windows only pay for the first one
+    '''
+    def __init__(self,data,sampling_rate):
+        self.data=np.ascontiguousarray(data)
+        self.sr=float(sampling_rate)
+        self._memo={}
+
+    @classmethod
+    def fromsignals(cls,sigs):
+        '''builds stats from a list of neo.AnalogSignal in V. returns None if sweeps have different lengths'''
+        if len(sigs)==0 or len(set([len(s) for s in sigs]))!=1:
+            return None
+        data=np.empty((len(sigs),len(sigs[0])),dtype=sigs[0].dtype)
+        for i,s in enumerate(sigs):
+            data[i]=s.V()
+        return cls(data,float(sigs[0].sampling_rate))
+
+    def bounds(self,start=None,stop=None):
+        ## python slice semantics, including negative indices
+        i0=None if start is None else int(round(start*self.sr))
+        i1=None if stop is None else int(round(stop*self.sr))
+        i0,i1,_=slice(i0,i1).indices(self.data.shape[1])
+        return i0,max(i0,i1)
+
+    def window(self,start=None,stop=None):
+        i0,i1=self.bounds(start,stop)
+        return self.data[:,i0:i1]
+
+    def row(self,idx,start=None,stop=None):
+        '''samples of one sweep between start and stop. no copy'''
+        i0,i1=self.bounds(start,stop)
+        return self.data[idx,i0:i1]
+
+    def _reduce(self,op,start,stop):
+        key=(op,)+self.bounds(start,stop)
+        if not key in self._memo:
+            self._memo[key]=getattr(np,op)(self.window(start,stop),axis=1)
+        return self._memo[key]
+
+    def mean(self,start=None,stop=None):
+        return self._reduce('mean',start,stop)
+
+    def min(self,start=None,stop=None):
+        return self._reduce('min',start,stop)
+
+    def argmin(self,start=None,stop=None):
+        return self._reduce('argmin',start,stop)
+
+    def max(self,start=None,stop=None):
+        return self._reduce('max',start,stop)
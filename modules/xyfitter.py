@@ -12,6 +12,7 @@
 import logging
 import numpy as np
 import scipy
+import expfit
 
 ######################################################################################
 ## fitter object
@@ -19,6 +20,8 @@ import scipy
 ## for linear f(x)=a*x+b:                       : params are f.a and f.b
 ## for single exp f(x)=a*exp(-(x-o)/tc)) +b     : params are f.tc
 ## for double exp f(x)=a*exp(-(x-o)/tc1)) +b exp(-(x-o)/tc2)) +c : params are f.wtc (weighted average tc), f.atc (arythmetic average), f.tc1 and f.tc2
+## exponential fits start from data driven estimates and use analytic jacobians (see expfit.py)
+## warmstart: a previous fitter whose parameters are tried first (e.g. previous fit of same frame)
 ## usage 
 #> f=xyfitter(xvalues,yvalues)
 #> if f.success and fitter.r2>some_value:
@@ -42,7 +45,27 @@ class XYFitter():
     def fit2expnoo(self,x,a,b,c,d,e):
         return a*np.exp(-(x)/b)+c*np.exp(-(x)/d)+e
 
-    def __init__(self,x,y,fitmode,weighted=True,o=0.0,maxfev=10000,version=1):
+    def _cost(self,x,y,p0):
+        with np.errstate(all='ignore'):
+            c=np.sum((self.fitfunc(x,*p0)-y)**2)
+        return c if np.isfinite(c) else np.inf
+
+    def _fitexp(self,x,y,jac,candidates,fallback):
+        ## refines initial parameters, closest to data first, until one fit succeeds. fallback is tried last
+        candidates=sorted([p0 for p0 in candidates if p0 is not None and len(p0)==len(fallback)],key=lambda p0:self._cost(x,y,p0))
+        for p0 in candidates+[fallback]:
+            try:
+                return expfit.fit(self.fitfunc,jac,x,y,p0,self.maxfev)
+            except Exception:
+                continue
+        raise RuntimeError("Exponential fit failed")
+
+    def _warmpot(self,warmstart):
+        if warmstart is not None and warmstart.success and warmstart.fitmode==self.fitmode and warmstart.version==self.version:
+            return list(warmstart.pot)
+        return None
+
+    def __init__(self,x,y,fitmode,weighted=True,o=0.0,maxfev=10000,version=1,warmstart=None):
         self.fitmode=fitmode
         self.version=version
         self.maxfev=maxfev
@@ -62,19 +85,24 @@ class XYFitter():
         if fitmode==1:
             if self.version==1:
                 self.o=o ## should be x[0]?
-                self.fitfunc=self.fit2expnoo
+                self.fitfunc=self.fit1expnoo
                 self.pot=[1.0,0.02,-70] ## approximate initial parameters for mb time constants
                 x=x-x[0]
+                jac,guess=expfit.jac1expnoo,expfit.estimate(x,y,1)
             else:
                 self.fitfunc=self.fit1exp
                 self.pot=[1.0,0.02,-70,o]  ## approximate initial parameters for mb time constants
+                guess=expfit.estimate(x,y,1,o)
+                jac,guess=expfit.jac1exp,None if guess is None else guess+[o]
             try:
-                self.pot,pcov=scipy.optimize.curve_fit(self.fitfunc,x,y,p0=tuple(self.pot), maxfev=self.maxfev)
+                self.pot=self._fitexp(x,y,jac,[self._warmpot(warmstart),guess],self.pot)
                 self.tc=self.pot[1]
                 self.success=True
+                self.r2=self._r2(x,y)
             except:
                 logging.getLogger(__name__).debug(f"First order exponential fit failed")
                 self.tc=np.nan
+                self.r2=0.0
                 self.success=False
         if fitmode==2:
             if self.version==1:
@@ -82,11 +110,14 @@ class XYFitter():
                 self.fitfunc=self.fit2expnoo
                 self.pot=[1.0,0.02,1.0,0.0015,-0.07] ## approximate initial parameters for mb time constants
                 x=x-x[0]
+                jac,guess=expfit.jac2expnoo,expfit.estimate(x,y,2)
             else:
                 self.fitfunc=self.fit2exp
                 self.pot=[1.0,0.02,1.0,0.0015,-0.07,o] ## approximate initial parameters for mb time constants
+                guess=expfit.estimate(x,y,2,o)
+                jac,guess=expfit.jac2exp,None if guess is None else guess+[o]
             try:
-                self.pot,pcov=scipy.optimize.curve_fit(self.fitfunc,x,y,p0=tuple(self.pot), maxfev=self.maxfev)
+                self.pot=self._fitexp(x,y,jac,[self._warmpot(warmstart),guess],self.pot)
                 self.wtc=(self.pot[0]*self.pot[1]+self.pot[2]*self.pot[3])/(self.pot[0]+self.pot[2]) ## weighted average
                 self.atc=(self.pot[1]+self.pot[3])/2                                                 ## average, not weighted
                 self.tc1=self.pot[1]                                                                 ## first time constant
@@ -96,7 +127,7 @@ class XYFitter():
                 else:
                     self.tc=self.atc
                 self.success=True
-                self.r2=self.getr2(x,y)
+                self.r2=self._r2(x,y)
             except:
                 logging.getLogger(__name__).debug(f"Second order exponential fit failed")
                 self.tc=np.nan
@@ -105,17 +136,58 @@ class XYFitter():
         ## in order to output correct results with jsonpickle, we have to transform pot to list
         self.pot=[float(p) for p in self.pot]
     
+    def _r2(self,x,y):
+        ## r2 in fitting coordinates (x already shifted for version 1)
+        return FitModel(self.fitfunc.__name__,self.pot).r2(x,y)[1]
+
+    def model(self):
+        '''fitted curve as a FitModel, in the same time coordinates as line()'''
+        return FitModel(self.fitfunc.__name__,self.pot,self.o if self.version==1 else 0.0)
+
     def getr2(self,x,y):
-        y_fit=self.line(x)
-        ss_res = np.sum((y-y_fit)**2)
-        ss_tot = np.sum((y- np.mean(y))**2)
-        return 1-(ss_res/ss_tot)
+        return self.model().r2(x,y)[1]
 
     def line(self,arr):
         if self.success:
-            if self.version==1:
-                return np.array([self.fitfunc(t-self.o,*self.pot) for t in arr])
-            else:
-                return np.array([self.fitfunc(t,*self.pot) for t in arr])
+            return self.model()(arr)
         else:
-            return np.array([])
\ No newline at end of file
+            return np.array([])
+
+class FitModel:
+    '''fitted curve(s) of XYFitter, evaluated on whole arrays.
+    func is the name of the XYFitter fit function, params are fitted parameters, either (nparams,) for one frame
+    or (nframes,nparams) for many frames fitted with the same function. shift (scalar or (nframes,)) is subtracted from x.
+    x may be (nsamples,) or (nframes,nsamples); many frames evaluate to (nframes,nsamples)
+    '''
+    def __init__(self,func,params,shift=0.0):
+        self.func=func
+        self.params=np.asarray(params,dtype=np.float64)
+        self.shift=np.asarray(shift,dtype=np.float64)
+
+    def __call__(self,x):
+        p=self.params
+        single=p.ndim==1
+        p=np.atleast_2d(p)
+        x=np.asarray(x,dtype=np.float64)-np.reshape(self.shift,(-1,1))
+        col=lambda i:p[:,i,np.newaxis]
+        if self.func=='fitlinear':
+            y=col(0)*x+col(1)
+        elif self.func=='fit1expnoo':
+            y=col(0)*np.exp(-x/col(1))+col(2)
+        elif self.func=='fit2expnoo':
+            y=col(0)*np.exp(-x/col(1))+col(2)*np.exp(-x/col(3))+col(4)
+        elif self.func=='fit1exp':
+            y=col(0)*np.exp(-(x-col(3))/col(1))+col(2)
+        elif self.func=='fit2exp':
+            y=col(0)*np.exp(-(x-col(5))/col(1))+col(2)*np.exp(-(x-col(5))/col(3))+col(4)
+        else:
+            raise ValueError(f"Unknown fit function {self.func}")
+        return y[0] if single and y.shape[0]==1 else y
+
+    def r2(self,x,y):
+        '''returns fitted curve(s) and coefficient(s) of determination against y, in one pass'''
+        y=np.asarray(y,dtype=np.float64)
+        y_fit=self(x)
+        ss_res = np.sum((y-y_fit)**2,axis=-1)
+        ss_tot = np.sum((y- np.mean(y,axis=-1,keepdims=True))**2,axis=-1)
+        return y_fit,1-(ss_res/ss_tot)
\ No newline at end of file
@@ -10,7 +10,7 @@ ITSQ_FIT_ITERATION_COUNT=5000                           ## maximum number of ite
 ITSQ_FITTER_VERSION=1                                   ## 1 or 2. 2 sometimes gives weird results
 ITSQ_OUTPUT_FIELDS_FILE="./params/outfields.txt"        ## list of parameters that the program should output. automatically regenerated if absent. set to False to ignore filtering
 ITSQ_SKIP_FILES=['.','_']                               ## skip files starting with one of these characters
-ITSQ_ENABLE_MULTIPROCESSING=True                        ## enable parallel processing for spontaneous and iv. Not a major improvement! May not work on some platforms (win, osx)
+ITSQ_ENABLE_MULTIPROCESSING=True                        ## process the frames of iv, rheobase and spontaneous protocols in a pool of worker processes. ignored in batch workers
 ITSQ_PROTOCOL_SAVE_DATA=True                            ## save analysis data for each protocol. not tested on OSX. WIP
 ITSQ_PARSE_PROTOCOLS=True                               ## parse protocols for current pulses. not heavily tested experimental. works with IV, resistance and mb time constant
 ITSQ_MPL_BACKEND="WXAgg"                                ## force matplotlib backend None (auto) or one of 'GTK3Agg', 'MacOSX', 'Qt4Agg', 'Qt5Agg', 'TkAgg', 'WXAgg'
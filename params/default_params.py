@@ -6,16 +6,31 @@
 
 ITSQ_VERSION=3.21                                       ## the version of intrinsic that match this param file. No version check is performed, but that may change in a near future
 ITSQ_LOG_LEVEL=10                                       ## log level DEBUG=10 INFO=20 WARNING=30,ERROR=40 CRITICAL=50
+ITSQ_CURSOR_PREVIEW=True                                ## preview peaks, thresholds or fit window of the current frame while threshold and fit cursors are dragged
+ITSQ_CURSOR_PREVIEW_INTERVAL=0.1                        ## minimum time (s) between two previews while dragging a cursor
 ITSQ_PANZOOM_WHEEL_ONLY=True                            ## should be True
 ITSQ_FIT_ITERATION_COUNT=10000                          ## maximum number of iterations for curve fitting 250-10000
 ITSQ_FITTER_VERSION=1                                   ## 1 or 2. 2 sometimes gives weird results
+ITSQ_FIT_WARM_START=False                               ## start time constant fits from the previous fit of the frame (or of the protocol) instead of estimates from data
 ITSQ_OUTPUT_FIELDS_FILE="./params/outfields.txt"        ## list of parameters that the program should output. automatically regenerated if absent. set to False to ignore filtering
 ITSQ_SKIP_FILES=['.','_']                               ## skip files starting with one of these characters
-ITSQ_ENABLE_MULTIPROCESSING=True                        ## enable parallel processing for spontaneous and iv. Not a major improvement! May not work on some platforms (win, osx)
+ITSQ_ENABLE_MULTIPROCESSING=True                        ## process the frames of iv, rheobase and spontaneous protocols in a pool of worker processes. ignored in batch workers
+ITSQ_FRAME_JOBS=0                                       ## number of worker processes used to process frames (0: one per cpu)
+ITSQ_BATCH_JOBS=1                                       ## number of worker processes used to analyse folders (1: sequential, 0: one per cpu). batch mode is non interactive (no debug frames)
+ITSQ_BATCH_PREFETCH=0                                   ## in batch mode, number of files analysed ahead of the results already consumed. 0: twice the number of worker processes
+ITSQ_MANIFEST_FILE=None                                 ## None, or json file where folder listings are saved, so that folders that did not change are not listed again
 ITSQ_PROTOCOL_SAVE_DATA=True                            ## save analysis data for each protocol. not tested on OSX. WIP
 ITSQ_PARSE_PROTOCOLS=True                               ## parse protocols for current pulses (only). not heavily tested experimental. works with IV, resistance and mb time constant
 ITSQ_MPL_BACKEND=None                                   ## force matplotlib backend None (auto) or one of 'GTK3Agg', 'MacOSX', 'Qt4Agg', 'Qt5Agg', 'TkAgg', 'WXAgg'; using WXAgg saves resources, but may conflict with internal app event loop
 ITSQ_ENABLE_HOOKS=True                                  ## guess if current steps are nA or pA and convert to pA. No guarantee! some other hooks may be implemented later
+ITSQ_LAZY_LOADING=True                                  ## only decode the sweeps and channels that a protocol actually uses (abf, axgd, axgx). set to False to load whole files in memory
+ITSQ_CACHE_SIZE=2048                                    ## size (MB) of the cache of decoded files (channels used by the analysis). 0 disables the cache, -1 for unbounded cache
+ITSQ_CACHE_FOLDER=None                                  ## folder of the cache of decoded files. None: ~/.cache/intrinsic/experiments
+ITSQ_SELECTIVE_RERUN=False                              ## reuse the results of files whose data and parameters read during analysis did not change (records in @itsq/*.rerun)
+ITSQ_RESULT_CACHE_SIZE=0                                ## size (MB) of the cache of analysis results, keyed by file, parameter values and code version. 0 disables the cache, -1 for unbounded cache
+ITSQ_RESULT_CACHE_FOLDER=None                           ## folder of the cache of analysis results. None: ~/.cache/intrinsic/results
+ITSQ_RESULT_STORE="results.sqlite"                      ## results of each cell are committed to this sqlite file as soon as they are available. None: results are kept in memory
+ITSQ_RESUME=False                                       ## skip the cells already in ITSQ_RESULT_STORE with the same parameters and files (resume an interrupted run). otherwise the store is cleared at start
 #
 EPSILON=0.001                                           ## slight offset between and current injection offsets and offsets for measurement. currently unused
 
@@ -45,6 +60,7 @@ IV_SPIKE_MIN_INTER=0.005                                ## minimum interval betw
 IV_SPIKE_PRE_TIME=0.005                                 ## time to keep before spike peak for threshold and maxrise measurement; 0.0015 is ususally enough
 IV_SPIKE_POST_TIME=0.01                                 ## time to keep after spike peak for halfwidth measurement;0.005 may be required for correct phase plane analysis
 IV_SPIKE_DV_THRESHOLD=0.0002                            ## threshold for first derivative, in case first threshold failed, in V/s. 10 is a good value
+IV_SPIKE_DV_SMOOTHING=0                                 ## savitzky-golay window (samples) used to smooth derivatives for threshold, max rise and max fall. 0: no smoothing
 IV_SPIKE_LOWEST_THRESHOLD=True                          ## determines two thresholds, based on first and second derivative,and take lowest (otherwise the second threshold is used if threshold detection with 2nd derivative failed )
 IV_SPIKE_EVOKED_THRESHOLD=0                             ## for a spike to be considered as evoked, current must be >= to this value. use 0.000001 to eliminate spontaneous spikes
 IV_MIN_SPIKES_FOR_MEASURE=1                             ## minimum number of spikes in a frame to measure the threshold,maxrise, ...